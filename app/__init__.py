@@ -1,21 +1,50 @@
 from flask import Flask, request
 from dotenv import load_dotenv
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+# Una sola vez por proceso y ANTES de importar Config, que lee el entorno
+# al definirse (antes se llamaba en cada create_app(), ya tarde).
+load_dotenv()
 
 from .config import Config
 from .extensions import db, migrate, jwt
+from .json_provider import PadelJSONProvider
+from .compression import init_compression
 
 def create_app():
-    load_dotenv()
     app = Flask(__name__)
     app.config.from_object(Config)
 
+    # IP real del cliente detrás del proxy (límites por IP)
+    if app.config["PROXY_SALTOS"]:
+        saltos = app.config["PROXY_SALTOS"]
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=saltos, x_proto=saltos)
+
+    # Serializa Decimal y fechas directamente (orjson si está disponible)
+    app.json = PadelJSONProvider(app)
+
     CORS(app, resources={r"/*": {"origins": "*"}})
 
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
 
+    # Compresión según Accept-Encoding (también en respuestas streaming)
+    init_compression(app)
+
+    # Club de cada petición (/clubs/<club>/... o JWT) → su base de datos
+    from .clubs import init_clubs
+    init_clubs(app)
+
+    # Límites por usuario/IP y descarte de lecturas bajo carga
+    from .limites import init_limites
+    init_limites(app)
+
+    # Tareas en segundo plano tras el commit (pool por worker + outbox)
+    from .tareas import init_tareas
+    init_tareas(app)
+
     # 🔹 Blueprint de autenticación
     from .auth import auth_bp
     app.register_blueprint(auth_bp, url_prefix="/auth")
@@ -27,6 +56,10 @@ def create_app():
     from .admin_routes import admin_bp
     app.register_blueprint(admin_bp, url_prefix="/admin")
 
+    # Comandos CLI (flask rollups ...)
+    from .commands import register_commands
+    register_commands(app)
+
     @app.route("/")
     def index():
         return {"message": "¡La aplicación está funcionando!"}
@@ -1,7 +1,30 @@
-from flask import Blueprint, request
+import csv
+import io
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from flask import Blueprint, Response, current_app, request
+from sqlalchemy import delete, func, select, tuple_, union_all
+from sqlalchemy.exc import IntegrityError
+
+from .db_utils import dialect_insert
 from .extensions import db
-from .models import Rol, Pista, Horario, Extra
+from .models import (
+    Rol,
+    Pista,
+    Horario,
+    Extra,
+    HorarioReserva,
+    HorarioReservaArchivado,
+    ReservaArchivada,
+    ReservaDiaria,
+    minutos,
+    parse_franja,
+)
 from .permissions import admin_required
+from .idempotencia import idempotente
+from .json_provider import formato_dinero
+from . import alta_usuarios, archivo, clubs, heatmap, ocupacion, perfiles, rollups, tareas
 
 admin_bp = Blueprint("admin", __name__)
 
@@ -16,6 +39,7 @@ def list_roles():
 
 
 @admin_bp.post("/roles")
+@idempotente
 @admin_required
 def create_role():
     data = request.get_json() or {}
@@ -46,6 +70,8 @@ def update_role(role_id):
         r.nombre = nombre
 
     db.session.commit()
+    # El nombre del rol va en el perfil cacheado de sus usuarios
+    perfiles.invalidar_todos()
     return {"id": r.id, "nombre": r.nombre}
 
 
@@ -53,8 +79,13 @@ def update_role(role_id):
 @admin_required
 def delete_role(role_id):
     r = Rol.query.get_or_404(role_id)
-    db.session.delete(r)
-    db.session.commit()
+    # usuarios.rol_id es ON DELETE RESTRICT: la BD rechaza borrar un rol en uso
+    try:
+        db.session.execute(delete(Rol).where(Rol.id == r.id))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return {"error": "El rol tiene usuarios asignados"}, 409
     return {}, 204
 
 
@@ -71,13 +102,14 @@ def list_pistas():
             "nombre": p.nombre,
             "cubierta": p.cubierta,
             "plazas": p.plazas,
-            "precio_base": str(p.precio_base),
+            "precio_base": p.precio_base,
         }
         for p in pistas
     ]
 
 
 @admin_bp.post("/pistas")
+@idempotente
 @admin_required
 def create_pista():
     data = request.get_json() or {}
@@ -127,9 +159,16 @@ def update_pista(pista_id):
 @admin_bp.delete("/pistas/<int:pista_id>")
 @admin_required
 def delete_pista(pista_id):
+    """
+    Borra una pista con un único DELETE: sus reservas, franjas reservadas,
+    archivo y rollup caen por los ON DELETE CASCADE de la base de datos,
+    sin cargarlos en memoria.
+    """
     p = Pista.query.get_or_404(pista_id)
-    db.session.delete(p)
+    db.session.execute(delete(Pista).where(Pista.id == p.id))
+    ocupacion.anotar_cambio()
     db.session.commit()
+    ocupacion.invalidar_mapa()
     return {}, 204
 
 
@@ -139,7 +178,7 @@ def delete_pista(pista_id):
 @admin_bp.get("/horarios")
 @admin_required
 def list_horarios():
-    horarios = Horario.query.order_by(Horario.id.asc()).all()
+    horarios = Horario.query.order_by(Horario.inicio_min.asc(), Horario.id.asc()).all()
     return [
         {"id": h.id, "franja": h.franja, "turno": h.turno}
         for h in horarios
@@ -147,6 +186,7 @@ def list_horarios():
 
 
 @admin_bp.post("/horarios")
+@idempotente
 @admin_required
 def create_horario():
     data = request.get_json() or {}
@@ -159,9 +199,13 @@ def create_horario():
     if Horario.query.filter_by(franja=franja, turno=turno).first():
         return {"error": "El horario ya existe"}, 409
 
-    h = Horario(franja=franja, turno=turno)
+    try:
+        h = Horario(franja=franja, turno=turno)
+    except ValueError as e:
+        return {"error": str(e)}, 400
     db.session.add(h)
     db.session.commit()
+    ocupacion.invalidar_catalogo()
 
     return {"id": h.id, "franja": h.franja, "turno": h.turno}, 201
 
@@ -173,11 +217,23 @@ def update_horario(horario_id):
     data = request.get_json() or {}
 
     if "franja" in data:
-        h.franja = (data["franja"] or "").strip()
+        try:
+            h.franja = (data["franja"] or "").strip()
+        except ValueError as e:
+            return {"error": str(e)}, 400
     if "turno" in data:
-        h.turno = (data["turno"] or "").strip()
+        turno = (data["turno"] or "").strip()
+        if turno != h.turno:
+            # El rollup agrupa por turno: mover las franjas ya reservadas
+            rollups.aplicar_reservas(HorarioReserva.horario_id == h.id, signo=-1)
+            rollups.aplicar_reservas(HorarioReservaArchivado.horario_id == h.id, signo=-1, archivadas=True)
+            h.turno = turno
+            db.session.flush()
+            rollups.aplicar_reservas(HorarioReserva.horario_id == h.id)
+            rollups.aplicar_reservas(HorarioReservaArchivado.horario_id == h.id, archivadas=True)
 
     db.session.commit()
+    ocupacion.invalidar_catalogo()
     return {"id": h.id, "franja": h.franja, "turno": h.turno}
 
 
@@ -185,8 +241,14 @@ def update_horario(horario_id):
 @admin_required
 def delete_horario(horario_id):
     h = Horario.query.get_or_404(horario_id)
-    db.session.delete(h)
-    db.session.commit()
+    # horarios_reserva.horario_id es ON DELETE RESTRICT
+    try:
+        db.session.execute(delete(Horario).where(Horario.id == h.id))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return {"error": "El horario tiene reservas asociadas"}, 409
+    ocupacion.invalidar_catalogo()
     return {}, 204
 
 
@@ -198,12 +260,13 @@ def delete_horario(horario_id):
 def list_extras():
     extras = Extra.query.order_by(Extra.id.asc()).all()
     return [
-        {"id": e.id, "nombre": e.nombre, "precio_extra": str(e.precio_extra)}
+        {"id": e.id, "nombre": e.nombre, "precio_extra": e.precio_extra}
         for e in extras
     ]
 
 
 @admin_bp.post("/extras")
+@idempotente
 @admin_required
 def create_extra():
     data = request.get_json() or {}
@@ -264,24 +327,37 @@ def admin_list_reservas():
     Lista todas las reservas del sistema.
     Incluye precio total.
     El admin puede filtrar por:
-    - fecha (YYYY-MM-DD)
+    - fecha, o rango desde/hasta (YYYY-MM-DD)
     - pista_id
     - usuario_id
+    Las reservas archivadas sólo se incluyen si la fecha o el rango
+    llegan al histórico.
     """
-    fecha = request.args.get("fecha")
+    fechas = {}
+    for nombre in ("fecha", "desde", "hasta"):
+        valor = request.args.get(nombre)
+        if valor:
+            fechas[nombre] = _parse_fecha(valor)
+            if fechas[nombre] is None:
+                return {"error": f"{nombre}: formato de fecha inválido. Usa YYYY-MM-DD"}, 400
+
     pista_id = request.args.get("pista_id")
     usuario_id = request.args.get("usuario_id")
 
-    query = Reserva.query
-
-    if fecha:
-        query = query.filter(Reserva.fecha == fecha)
-    if pista_id:
-        query = query.filter(Reserva.pista_id == int(pista_id))
-    if usuario_id:
-        query = query.filter(Reserva.usuario_id == int(usuario_id))
-
-    reservas = query.order_by(Reserva.fecha.asc()).all()
+    def filtrar(query, modelo):
+        if "fecha" in fechas:
+            query = query.filter(modelo.fecha == fechas["fecha"])
+        if "desde" in fechas:
+            query = query.filter(modelo.fecha >= fechas["desde"])
+        if "hasta" in fechas:
+            query = query.filter(modelo.fecha <= fechas["hasta"])
+        if pista_id:
+            query = query.filter(modelo.pista_id == int(pista_id))
+        if usuario_id:
+            query = query.filter(modelo.usuario_id == int(usuario_id))
+        return query
+
+    reservas = archivo.reservas_con_archivo(filtrar, **fechas)
 
     return [
         {
@@ -290,9 +366,9 @@ def admin_list_reservas():
             "usuario_id": r.usuario_id,
             "pista": r.pista.nombre,
             "pista_id": r.pista_id,
-            "fecha": r.fecha.isoformat(),
+            "fecha": r.fecha,
             "horarios": [hr.horario.franja for hr in r.horarios],
-            "precio_total": str(sum(hr.precio for hr in r.horarios)),
+            "precio_total": sum((hr.precio for hr in r.horarios), Decimal("0")),
         }
         for r in reservas
     ]
@@ -320,18 +396,651 @@ def admin_detalle_reserva(reserva_id):
             "id": r.pista.id,
             "nombre": r.pista.nombre,
         },
-        "fecha": r.fecha.isoformat(),
+        "fecha": r.fecha,
         "horarios": [
             {
                 "id": hr.horario.id,
                 "franja": hr.horario.franja,
                 "turno": hr.horario.turno,
-                "precio": str(hr.precio),
+                "precio": hr.precio,
             }
             for hr in r.horarios
         ],
-        "precio_total": str(sum(hr.precio for hr in r.horarios)),
+        "precio_total": sum((hr.precio for hr in r.horarios), Decimal("0")),
+    }
+
+
+
+@admin_bp.post("/reservas/cancelacion-masiva")
+@idempotente
+@admin_required
+def admin_cancelacion_masiva():
+    """
+    Cancela todas las reservas de una o varias pistas en una ventana
+    (p. ej. cierre por mantenimiento). Es la única cancelación que puede
+    hacer el admin.
+    Body JSON:
+    - pista_ids (lista) o pista_id
+    - desde, hasta (YYYY-MM-DD, obligatorios)
+    - hora_desde, hora_hasta (HH:MM, opcionales): se cancela toda reserva
+      con alguna franja que se solape con esa ventana horaria
+    - simular (bool): sólo devuelve lo que se cancelaría
+    Devuelve los ids de reserva y de usuario afectados para avisarles.
+    """
+    data = request.get_json(silent=True) or {}
+
+    pista_ids = data.get("pista_ids") or ([data["pista_id"]] if data.get("pista_id") else [])
+    if not isinstance(pista_ids, list) or not pista_ids or not all(isinstance(p, int) and not isinstance(p, bool) for p in pista_ids):
+        return {"error": "pista_ids debe ser una lista de ids"}, 400
+
+    desde = _parse_fecha(data.get("desde"))
+    hasta = _parse_fecha(data.get("hasta"))
+    if not desde or not hasta or desde > hasta:
+        return {"error": "desde y hasta son obligatorios (YYYY-MM-DD, desde <= hasta)"}, 400
+
+    try:
+        hora_desde = minutos(data["hora_desde"]) if data.get("hora_desde") else None
+        hora_hasta = minutos(data["hora_hasta"]) if data.get("hora_hasta") else None
+    except (ValueError, AttributeError):
+        return {"error": "Formato de hora inválido. Usa HH:MM"}, 400
+
+    # Reservas afectadas (usa ix_reservas_pista_fecha)
+    afectadas = (
+        select(Reserva.id)
+        .where(Reserva.pista_id.in_(pista_ids), Reserva.fecha >= desde, Reserva.fecha <= hasta)
+    )
+    if hora_desde is not None or hora_hasta is not None:
+        solapa = select(HorarioReserva.reserva_id).join(Horario, HorarioReserva.horario_id == Horario.id)
+        if hora_desde is not None:
+            solapa = solapa.where(Horario.fin_min > hora_desde)
+        if hora_hasta is not None:
+            solapa = solapa.where(Horario.inicio_min < hora_hasta)
+        afectadas = afectadas.where(Reserva.id.in_(solapa))
+
+    simular = bool(data.get("simular"))
+    if not simular:
+        # Primero la escritura del rollup: toma el bloqueo de escritura y
+        # nadie puede reservar en la ventana hasta el commit.
+        rollups.aplicar_reservas(Reserva.id.in_(afectadas), signo=-1)
+
+    filas = db.session.execute(
+        select(Reserva.id, Reserva.usuario_id).where(Reserva.id.in_(afectadas))
+    ).all()
+
+    if not simular and filas:
+        db.session.execute(delete(Reserva).where(Reserva.id.in_(afectadas)))
+        tareas.encolar(
+            "auditoria",
+            evento="cancelacion_masiva",
+            reservas=[f.id for f in filas],
+            pista_ids=pista_ids,
+            desde=desde.isoformat(),
+            hasta=hasta.isoformat(),
+        )
+        ocupacion.anotar_cambio()
+    db.session.commit()
+    if not simular and filas:
+        ocupacion.invalidar_mapa()
+
+    return {
+        "simulacion": simular,
+        "canceladas": len(filas),
+        "reservas": [f.id for f in filas],
+        "usuarios": sorted({f.usuario_id for f in filas}),
+    }
+
+
+# -------------------------
+# TAREAS EN SEGUNDO PLANO
+# -------------------------
+@admin_bp.get("/tareas/estado")
+@admin_required
+def estado_tareas():
+    """
+    Instrumentación de las tareas en segundo plano:
+    - proceso: cola, hilos ocupados, contadores y latencias (espera desde
+      que se encoló y duración) del worker que atiende la petición
+    - outbox: tareas en la tabla por estado y la más antigua sin terminar
+    """
+    proceso = None
+    if current_app.config["TAREAS_ENABLED"]:
+        proceso = tareas.ejecutor(current_app._get_current_object()).estado()
+    return {"proceso": proceso, "outbox": tareas.resumen_outbox()}
+
+
+# -------------------------
+# ANALÍTICA (ADMIN)
+# -------------------------
+def _parse_fecha(valor):
+    try:
+        return datetime.strptime(valor, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _porcentaje(slots, capacidad):
+    return round(100 * slots / capacidad, 2) if capacidad else 0.0
+
+
+@admin_bp.get("/analytics/ocupacion")
+@admin_required
+def admin_analytics_ocupacion():
+    """
+    Ocupación (%) e ingresos leyendo del rollup reservas_diarias.
+    Parámetros:
+    - desde, hasta (YYYY-MM-DD, obligatorios)
+    - pista_id (opcional)
+    - agrupar: detalle (pista/fecha/turno) | dia | pista | turno
+    La capacidad de cada turno es su número de franjas en el catálogo.
+    """
+    desde = _parse_fecha(request.args.get("desde"))
+    hasta = _parse_fecha(request.args.get("hasta"))
+    pista_id = request.args.get("pista_id", type=int)
+    agrupar = request.args.get("agrupar", "detalle")
+
+    if not desde or not hasta or desde > hasta:
+        return {"error": "desde y hasta son obligatorios (YYYY-MM-DD, desde <= hasta)"}, 400
+
+    columnas = {
+        "detalle": (ReservaDiaria.pista_id, ReservaDiaria.fecha, ReservaDiaria.turno),
+        "dia": (ReservaDiaria.fecha,),
+        "pista": (ReservaDiaria.pista_id,),
+        "turno": (ReservaDiaria.turno,),
     }
+    if agrupar not in columnas:
+        return {"error": "agrupar debe ser detalle, dia, pista o turno"}, 400
 
+    # Capacidad: franjas por turno y número de pistas del informe
+    franjas_turno = dict(
+        db.session.query(Horario.turno, func.count(Horario.id)).group_by(Horario.turno).all()
+    )
+    franjas_dia = sum(franjas_turno.values())
+    n_pistas = 1 if pista_id else Pista.query.count()
+    n_dias = (hasta - desde).days + 1
+
+    claves = columnas[agrupar]
+    query = (
+        db.session.query(
+            *claves,
+            func.sum(ReservaDiaria.slots),
+            func.sum(ReservaDiaria.ingresos),
+        )
+        .filter(ReservaDiaria.fecha >= desde, ReservaDiaria.fecha <= hasta)
+        .group_by(*claves)
+        .order_by(*claves)
+    )
+    if pista_id:
+        query = query.filter(ReservaDiaria.pista_id == pista_id)
+
+    filas = []
+    for *clave, slots, ingresos in query.all():
+        fila = {c.key: v for c, v in zip(claves, clave)}
+        if agrupar == "detalle":
+            capacidad = franjas_turno.get(fila["turno"], 0)
+        elif agrupar == "dia":
+            capacidad = franjas_dia * n_pistas
+        elif agrupar == "pista":
+            capacidad = franjas_dia * n_dias
+        else:
+            capacidad = franjas_turno.get(fila["turno"], 0) * n_pistas * n_dias
+
+        fila.update({
+            "slots": slots,
+            "capacidad": capacidad,
+            "ocupacion": _porcentaje(slots, capacidad),
+            "ingresos": Decimal(ingresos or 0),
+        })
+        filas.append(fila)
+
+    total_slots = sum(f["slots"] for f in filas)
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "agrupar": agrupar,
+        "filas": filas,
+        "total": {
+            "slots": total_slots,
+            "capacidad": franjas_dia * n_pistas * n_dias,
+            "ocupacion": _porcentaje(total_slots, franjas_dia * n_pistas * n_dias),
+            "ingresos": sum((f["ingresos"] for f in filas), Decimal("0")),
+        },
+    }
 
 
+def _resumen_club(desde, hasta):
+    """Slots, capacidad e ingresos de la BD en curso (rollup reservas_diarias)."""
+    slots, ingresos = (
+        db.session.query(func.coalesce(func.sum(ReservaDiaria.slots), 0), func.sum(ReservaDiaria.ingresos))
+        .filter(ReservaDiaria.fecha >= desde, ReservaDiaria.fecha <= hasta)
+        .one()
+    )
+    n_pistas = Pista.query.count()
+    capacidad = db.session.query(func.count(Horario.id)).scalar() * n_pistas * ((hasta - desde).days + 1)
+    return {
+        "pistas": n_pistas,
+        "slots": int(slots),
+        "capacidad": capacidad,
+        "ocupacion": _porcentaje(slots, capacidad),
+        "ingresos": Decimal(ingresos or 0),
+    }
+
+
+@admin_bp.get("/clubs/ocupacion")
+@admin_required
+def admin_clubs_ocupacion():
+    """
+    Ocupación e ingresos de cada club y del total, entre desde y hasta
+    (YYYY-MM-DD). Cada club está en su BD: se consultan todas a la vez
+    (CLUBS_HILOS hilos) y se suman aquí. Sólo para la administración
+    central (token sin club); un club que falle sale en "errores".
+    """
+    if not current_app.config["CLUBS"]:
+        return {"error": "No hay clubs configurados"}, 404
+    if clubs.actual() is not None:
+        return {"error": "Sólo para la administración central"}, 403
+
+    desde = _parse_fecha(request.args.get("desde"))
+    hasta = _parse_fecha(request.args.get("hasta"))
+    if not desde or not hasta or desde > hasta:
+        return {"error": "desde y hasta son obligatorios (YYYY-MM-DD, desde <= hasta)"}, 400
+
+    por_club, errores = clubs.en_todos(_resumen_club, desde, hasta)
+
+    total = {"pistas": 0, "slots": 0, "capacidad": 0, "ingresos": Decimal("0")}
+    for resumen in por_club.values():
+        for clave in total:
+            total[clave] += resumen[clave]
+    total["ocupacion"] = _porcentaje(total["slots"], total["capacidad"])
+
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "clubs": por_club,
+        "total": total,
+        "errores": errores,
+    }
+
+
+@admin_bp.get("/analytics/heatmap")
+@admin_required
+def admin_analytics_heatmap():
+    """
+    Mapa de calor de ocupación (%) como matrices compactas.
+    Parámetros:
+    - desde, hasta (YYYY-MM-DD, obligatorios; como mucho HEATMAP_MAX_DIAS)
+    - pista_id (opcional, se puede repetir)
+    - picos (opcional, nº de celdas más ocupadas a devolver; 5 por defecto)
+    Los ejes son pistas (por id) y franjas (por hora de inicio).
+    """
+    if not heatmap.disponible():
+        return {"error": "El mapa de calor necesita numpy instalado"}, 501
+
+    desde = _parse_fecha(request.args.get("desde"))
+    hasta = _parse_fecha(request.args.get("hasta"))
+    if not desde or not hasta or desde > hasta:
+        return {"error": "desde y hasta son obligatorios (YYYY-MM-DD, desde <= hasta)"}, 400
+    n_dias = (hasta - desde).days + 1
+    if n_dias > current_app.config["HEATMAP_MAX_DIAS"]:
+        return {"error": f"El rango máximo es de {current_app.config['HEATMAP_MAX_DIAS']} días"}, 400
+
+    pista_ids = request.args.getlist("pista_id", type=int)
+    query = db.session.query(Pista.id, Pista.nombre).order_by(Pista.id)
+    if pista_ids:
+        query = query.filter(Pista.id.in_(pista_ids))
+    pistas = query.all()
+
+    cat = ocupacion.catalogo()
+    filas = db.session.execute(heatmap.tripletas(desde, hasta, pista_ids)).all()
+    t = heatmap.tensor(filas, [p.id for p in pistas], list(cat.ids), desde, n_dias)
+
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "pistas": [{"id": p.id, "nombre": p.nombre} for p in pistas],
+        "franjas": [
+            {"id": h_id, "franja": franja, "turno": turno}
+            for h_id, franja, turno in zip(cat.ids, cat.franjas, cat.turnos)
+        ],
+        "dias_semana": heatmap.DIAS_SEMANA,
+        **heatmap.agregados(t, cat, desde, picos=request.args.get("picos", 5, type=int)),
+    }
+
+
+# -------------------------
+# EXPORTACIÓN (ADMIN)
+# -------------------------
+COLUMNAS_EXPORT = (
+    "reserva_id", "fecha", "usuario_id", "usuario", "email",
+    "pista_id", "pista", "horario_id", "franja", "turno", "precio",
+)
+
+
+def _export_select(fecha=None, desde=None, hasta=None, pista_id=None, usuario_id=None):
+    """
+    SELECT Core: una fila por franja reservada, sin pasar por el ORM.
+    Si el rango llega al histórico se añade el archivo con UNION ALL.
+    """
+    def select_tabla(reserva, franja):
+        stmt = (
+            select(
+                reserva.id.label("reserva_id"),
+                reserva.fecha.label("fecha"),
+                Usuario.id.label("usuario_id"),
+                Usuario.nombre.label("usuario"),
+                Usuario.email.label("email"),
+                Pista.id.label("pista_id"),
+                Pista.nombre.label("pista"),
+                Horario.id.label("horario_id"),
+                Horario.franja.label("franja"),
+                Horario.turno.label("turno"),
+                franja.precio.label("precio"),
+            )
+            .select_from(franja)
+            .join(reserva, franja.reserva_id == reserva.id)
+            .join(Usuario, reserva.usuario_id == Usuario.id)
+            .join(Pista, reserva.pista_id == Pista.id)
+            .join(Horario, franja.horario_id == Horario.id)
+        )
+        if fecha:
+            stmt = stmt.where(reserva.fecha == fecha)
+        if desde:
+            stmt = stmt.where(reserva.fecha >= desde)
+        if hasta:
+            stmt = stmt.where(reserva.fecha <= hasta)
+        if pista_id:
+            stmt = stmt.where(reserva.pista_id == pista_id)
+        if usuario_id:
+            stmt = stmt.where(reserva.usuario_id == usuario_id)
+        return stmt
+
+    stmt = select_tabla(Reserva, HorarioReserva)
+    if archivo.incluye_archivo(desde, hasta, fecha):
+        stmt = union_all(select_tabla(ReservaArchivada, HorarioReservaArchivado), stmt)
+        columnas = stmt.selected_columns
+        return stmt.order_by(columnas.fecha, columnas.reserva_id, columnas.horario_id)
+
+    return stmt.order_by(Reserva.fecha, Reserva.id, Horario.id)
+
+
+def _filas_export(engine, stmt, lote):
+    """
+    Itera el resultado en lotes con un cursor de servidor
+    (stream_results + yield_per): la memoria no crece con el tamaño.
+    """
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=lote).execute(stmt)
+        for particion in result.partitions():
+            yield particion
+
+
+def _export_csv(particiones):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNAS_EXPORT)
+    for filas in particiones:
+        for f in filas:
+            writer.writerow([*f[:-1], formato_dinero(f.precio)])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _export_ndjson(particiones, json_provider):
+    for filas in particiones:
+        yield b"".join(
+            json_provider.dumps_bytes(dict(f._mapping)) + b"\n" for f in filas
+        )
+
+
+@admin_bp.get("/reservas/export")
+@admin_required
+def admin_export_reservas():
+    """
+    Exporta las reservas (una fila por franja) en streaming.
+    Parámetros:
+    - formato: csv (por defecto) | ndjson
+    - fecha, desde, hasta (YYYY-MM-DD); con un rango histórico incluye el archivo
+    - pista_id, usuario_id
+    """
+    formato = request.args.get("formato", "csv")
+    if formato not in ("csv", "ndjson"):
+        return {"error": "formato debe ser csv o ndjson"}, 400
+
+    fechas = {}
+    for nombre in ("fecha", "desde", "hasta"):
+        valor = request.args.get(nombre)
+        if valor:
+            fechas[nombre] = _parse_fecha(valor)
+            if fechas[nombre] is None:
+                return {"error": f"{nombre}: formato de fecha inválido. Usa YYYY-MM-DD"}, 400
+
+    stmt = _export_select(
+        **fechas,
+        pista_id=request.args.get("pista_id", type=int),
+        usuario_id=request.args.get("usuario_id", type=int),
+    )
+    particiones = _filas_export(db.session.get_bind(), stmt, current_app.config["EXPORT_BATCH_SIZE"])
+
+    if formato == "csv":
+        cuerpo, mimetype = _export_csv(particiones), "text/csv"
+    else:
+        cuerpo, mimetype = _export_ndjson(particiones, current_app.json), "application/x-ndjson"
+
+    return Response(
+        cuerpo,
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=reservas.{formato}"},
+    )
+
+
+# -------------------------
+# CARGA MASIVA DEL CATÁLOGO (ADMIN)
+# -------------------------
+def _leer_lote():
+    """
+    Lee las filas de un lote. Acepta:
+    - JSON: una lista de objetos o {"items": [...]}
+    - CSV: body con Content-Type text/csv o archivo en el campo "file"
+    Devuelve una lista de dicts o None si el formato no es válido.
+    """
+    if "file" in request.files:
+        texto = request.files["file"].read().decode("utf-8-sig")
+        return list(csv.DictReader(io.StringIO(texto)))
+
+    if request.mimetype == "text/csv":
+        return list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("items")
+    if not isinstance(data, list) or not all(isinstance(d, dict) for d in data):
+        return None
+    return data
+
+
+def _texto(item, campo):
+    valor = item.get(campo)
+    if valor is None:
+        return ""
+    if not isinstance(valor, str):
+        raise ValueError(f"{campo} debe ser texto")
+    return valor.strip()
+
+
+def _entero(item, campo):
+    """Entero de JSON o de CSV ("4"); 2.7, true o "x" no valen."""
+    valor = item.get(campo)
+    if valor is None or valor == "":
+        return None
+    if isinstance(valor, str) and valor.strip().lstrip("+-").isdigit():
+        return int(valor)
+    if not isinstance(valor, int) or isinstance(valor, bool):
+        raise ValueError(f"{campo} debe ser un número entero")
+    return valor
+
+
+def _importe(valor):
+    try:
+        importe = Decimal(str(valor).strip())
+    except (InvalidOperation, ValueError):
+        return None
+    return importe if importe.is_finite() and importe >= 0 else None
+
+
+def _booleano(valor):
+    if isinstance(valor, str):
+        return valor.strip().lower() in ("1", "true", "si", "sí", "yes")
+    return bool(valor)
+
+
+def _validar_pista(item):
+    nombre = _texto(item, "nombre")
+    precio_base = _importe(item.get("precio_base"))
+    plazas = _entero(item, "plazas")
+
+    if not nombre or plazas is None or item.get("precio_base") in (None, ""):
+        return None, "nombre, plazas y precio_base son obligatorios"
+    if plazas <= 0:
+        return None, "plazas debe ser mayor que 0"
+    if precio_base is None:
+        return None, "precio_base inválido"
+
+    return {
+        "nombre": nombre,
+        "cubierta": _booleano(item.get("cubierta", False)),
+        "plazas": plazas,
+        "precio_base": precio_base,
+    }, None
+
+
+def _validar_horario(item):
+    franja = _texto(item, "franja")
+    turno = _texto(item, "turno")
+    if not franja or not turno:
+        return None, "franja y turno son obligatorios"
+    try:
+        inicio_min, fin_min = parse_franja(franja)
+    except ValueError as e:
+        return None, str(e)
+    return {"franja": franja, "turno": turno, "inicio_min": inicio_min, "fin_min": fin_min}, None
+
+
+def _validar_extra(item):
+    nombre = _texto(item, "nombre")
+    if not nombre or item.get("precio_extra") in (None, ""):
+        return None, "nombre y precio_extra son obligatorios"
+    precio_extra = _importe(item.get("precio_extra"))
+    if precio_extra is None:
+        return None, "precio_extra inválido"
+    return {"nombre": nombre, "precio_extra": precio_extra}, None
+
+
+def _upsert_lote(modelo, claves, validar):
+    """
+    Valida todas las filas y hace un único INSERT ... ON CONFLICT
+    (clave = columnas únicas del modelo) en una sola transacción.
+    Las filas inválidas se informan y no bloquean al resto.
+    """
+    items = _leer_lote()
+    if items is None:
+        return {"error": "Se esperaba una lista JSON o un CSV"}, 400
+
+    tabla = modelo.__table__
+    columnas_clave = [tabla.c[k] for k in claves]
+
+    resultados = [None] * len(items)
+    validas = {}  # clave → (posición, fila); si se repite gana la última
+    for i, item in enumerate(items):
+        try:
+            fila, error = validar(item)
+        except ValueError as e:  # tipo de dato inválido en algún campo
+            fila, error = None, str(e)
+        if error:
+            resultados[i] = {"fila": i, "estado": "error", "error": error}
+            continue
+        clave = tuple(fila[k] for k in claves)
+        if clave in validas:
+            anterior = validas[clave][0]
+            resultados[anterior] = {"fila": anterior, "estado": "ignorada", "error": "duplicada en el lote"}
+        validas[clave] = (i, fila)
+
+    if validas:
+        existentes = {
+            tuple(r) for r in db.session.execute(
+                select(*columnas_clave).where(tuple_(*columnas_clave).in_(list(validas)))
+            )
+        }
+
+        stmt = dialect_insert(tabla)
+        actualizar = {
+            c: stmt.excluded[c]
+            for c in next(iter(validas.values()))[1]
+            if c not in claves
+        } or {claves[0]: stmt.excluded[claves[0]]}
+        stmt = stmt.on_conflict_do_update(index_elements=columnas_clave, set_=actualizar)
+        db.session.execute(stmt, [fila for _, fila in validas.values()])
+        db.session.commit()
+
+        ids = {
+            tuple(r[1:]): r[0] for r in db.session.execute(
+                select(tabla.c.id, *columnas_clave).where(tuple_(*columnas_clave).in_(list(validas)))
+            )
+        }
+        for clave, (i, _) in validas.items():
+            resultados[i] = {
+                "fila": i,
+                "estado": "actualizada" if clave in existentes else "creada",
+                "id": ids.get(clave),
+            }
+
+    resumen = {"creadas": 0, "actualizadas": 0, "ignoradas": 0, "errores": 0}
+    plural = {"creada": "creadas", "actualizada": "actualizadas", "ignorada": "ignoradas", "error": "errores"}
+    for r in resultados:
+        resumen[plural[r["estado"]]] += 1
+
+    return {**resumen, "filas": resultados}, 200
+
+
+@admin_bp.post("/pistas/batch")
+@idempotente
+@admin_required
+def batch_pistas():
+    """Alta/actualización masiva de pistas (clave: nombre)."""
+    return _upsert_lote(Pista, ["nombre"], _validar_pista)
+
+
+@admin_bp.post("/horarios/batch")
+@idempotente
+@admin_required
+def batch_horarios():
+    """Alta masiva de horarios (clave: franja + turno)."""
+    respuesta = _upsert_lote(Horario, ["franja", "turno"], _validar_horario)
+    ocupacion.invalidar_catalogo()
+    return respuesta
+
+
+@admin_bp.post("/extras/batch")
+@idempotente
+@admin_required
+def batch_extras():
+    """Alta/actualización masiva de extras (clave: nombre)."""
+    return _upsert_lote(Extra, ["nombre"], _validar_extra)
+
+
+# -------------------------
+# ALTA MASIVA DE USUARIOS (ADMIN)
+# -------------------------
+@admin_bp.post("/usuarios/batch")
+@idempotente
+@admin_required
+def batch_usuarios():
+    """
+    Alta masiva de socios (rol USER). Mismo formato que el resto de lotes
+    (JSON o CSV) con nombre, email, dni y password. Email y DNI ya
+    existentes o repetidos en el lote se informan como error por fila.
+    """
+    items = _leer_lote()
+    if items is None:
+        return {"error": "Se esperaba una lista JSON o un CSV"}, 400
+    return alta_usuarios.alta_masiva(items), 200
@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from sqlalchemy import or_, select
+from werkzeug.security import generate_password_hash
+
+from .db_utils import dialect_insert
+from .extensions import db
+from .models import Usuario
+
+
+# =========================================================
+# ===============   ALTA MASIVA DE SOCIOS   ===============
+# =========================================================
+# Lo caro de dar de alta un usuario es generate_password_hash (scrypt,
+# lento a propósito). En un lote se validan todas las filas, se
+# comprueban email y DNI contra la BD con una sola consulta, se hashean
+# las contraseñas en paralelo en varios procesos y se insertan todos
+# los usuarios en una única transacción.
+
+def hashear(passwords, procesos=None):
+    """
+    generate_password_hash de cada contraseña, en orden. Con pocos
+    elementos (HASH_MIN_PARALELO) o un solo proceso no compensa el pool.
+    """
+    procesos = procesos or current_app.config["HASH_PROCESOS"] or os.cpu_count() or 1
+    procesos = min(procesos, len(passwords))
+    if procesos <= 1 or len(passwords) < current_app.config["HASH_MIN_PARALELO"]:
+        return [generate_password_hash(p) for p in passwords]
+
+    # spawn y no fork: el worker tiene hilos (tareas, pool de conexiones)
+    # que no deben duplicarse en los hijos.
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as pool:
+        return list(pool.map(generate_password_hash, passwords, chunksize=max(1, len(passwords) // (procesos * 4))))
+
+
+def _validar(item):
+    fila = {
+        "nombre": str(item.get("nombre") or "").strip(),
+        "email": str(item.get("email") or "").strip().lower(),
+        "dni": str(item.get("dni") or "").strip(),
+        "password": str(item.get("password") or ""),
+    }
+    if not all(fila.values()):
+        return None, "nombre, email, dni y password son obligatorios"
+    if "@" not in fila["email"]:
+        return None, "email inválido"
+    return fila, None
+
+
+def alta_masiva(items, procesos=None):
+    """
+    Da de alta usuarios (rol USER) a partir de una lista de dicts con
+    nombre, email, dni y password. Las filas con error se informan y no
+    bloquean al resto. Devuelve {"creadas", "errores", "filas": [...]}.
+    """
+    resultados = [None] * len(items)
+    validas = []  # (posición, fila)
+    vistos_email, vistos_dni = set(), set()
+
+    for i, item in enumerate(items):
+        fila, error = _validar(item)
+        if not error and fila["email"] in vistos_email:
+            error = "email duplicado en el lote"
+        if not error and fila["dni"] in vistos_dni:
+            error = "dni duplicado en el lote"
+        if error:
+            resultados[i] = {"fila": i, "estado": "error", "error": error}
+            continue
+        vistos_email.add(fila["email"])
+        vistos_dni.add(fila["dni"])
+        validas.append((i, fila))
+
+    if validas:
+        # Una consulta contra los índices únicos de email y dni
+        ocupados_email, ocupados_dni = set(), set()
+        for email, dni in db.session.execute(
+            select(Usuario.email, Usuario.dni).where(
+                or_(Usuario.email.in_(vistos_email), Usuario.dni.in_(vistos_dni))
+            )
+        ):
+            ocupados_email.add(email)
+            ocupados_dni.add(dni)
+
+        nuevas = []
+        for i, fila in validas:
+            if fila["email"] in ocupados_email:
+                resultados[i] = {"fila": i, "estado": "error", "error": "email ya existe"}
+            elif fila["dni"] in ocupados_dni:
+                resultados[i] = {"fila": i, "estado": "error", "error": "dni ya existe"}
+            else:
+                nuevas.append((i, fila))
+
+        if nuevas:
+            hashes = hashear([fila["password"] for _, fila in nuevas], procesos)
+
+            # DO NOTHING: si otro alta se cuela entre la comprobación y el
+            # INSERT, esa fila se queda fuera y se informa abajo.
+            db.session.execute(
+                dialect_insert(Usuario.__table__).on_conflict_do_nothing(),
+                [
+                    {"nombre": f["nombre"], "email": f["email"], "dni": f["dni"], "password": h, "rol_id": 2}
+                    for (_, f), h in zip(nuevas, hashes)
+                ],
+            )
+            db.session.commit()
+
+            creados = {
+                email: (id_, dni) for id_, email, dni in db.session.execute(
+                    select(Usuario.id, Usuario.email, Usuario.dni)
+                    .where(Usuario.email.in_([f["email"] for _, f in nuevas]))
+                )
+            }
+            for i, fila in nuevas:
+                id_, dni = creados.get(fila["email"], (None, None))
+                if id_ is not None and dni == fila["dni"]:
+                    resultados[i] = {"fila": i, "estado": "creada", "id": id_}
+                else:
+                    resultados[i] = {"fila": i, "estado": "error", "error": "email o dni ya existe"}
+
+    errores = sum(1 for r in resultados if r["estado"] == "error")
+    return {"creadas": len(resultados) - errores, "errores": errores, "filas": resultados}
@@ -1,9 +1,15 @@
-from flask import Blueprint, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime
+import heapq
+from flask import Blueprint, current_app, request
+from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
+from datetime import date, datetime, timedelta
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from decimal import Decimal
 from .extensions import db
-from .models import Pista, Horario, Extra, Reserva, HorarioReserva, Usuario
+from .models import Pista, Horario, Extra, Reserva, HorarioReserva, Usuario, minutos
 from .permissions import user_required, owner_or_admin
+from .idempotencia import idempotente
+from . import archivo, ocupacion, retenciones, rollups, tareas
 
 # Blueprint principal del API (reservas y disponibilidad)
 api_bp = Blueprint("api", __name__)
@@ -21,61 +27,120 @@ def _user_id() -> int:
     return int(get_jwt_identity())
 
 
-# =========================================================
-# ===============   RESERVAS (USUARIO)   ==================
-# =========================================================
+def _franja_ocupada(pista_id, fecha, horario_ids):
+    """Primera de las franjas ya reservada en esa pista y fecha, o None."""
+    return (
+        db.session.query(HorarioReserva.horario_id)
+        .filter(
+            HorarioReserva.pista_id == pista_id,
+            HorarioReserva.fecha == fecha,
+            HorarioReserva.horario_id.in_(horario_ids),
+        )
+        .order_by(HorarioReserva.horario_id)
+        .limit(1)
+        .scalar()
+    )
 
-@api_bp.post("/reservas")
-@user_required
-def crear_reserva():
+
+def _leer_franjas(data):
     """
-    Crear una reserva nueva.
-    Reglas:
-    - Debe incluir pista_id, fecha y lista de horarios.
-    - No se puede reservar una franja ya ocupada.
-    - Cada franja se guarda con el precio_base de la pista.
-    - Si es fin de semana, se suma el extra 'fin de semana'.
+    Valida pista_id, fecha y horarios de una reserva o retención.
+    Devuelve ((pista, fecha, horarios), None) o (None, respuesta de error).
     """
-    data = request.get_json() or {}
-
-    usuario_id = _user_id()
     pista_id = data.get("pista_id")
     fecha_str = data.get("fecha")
     horarios = data.get("horarios")
 
     # Validación básica
     if not pista_id or not fecha_str or not horarios:
-        return {"error": "pista_id, fecha y horarios son obligatorios"}, 400
+        return None, ({"error": "pista_id, fecha y horarios son obligatorios"}, 400)
 
     # Convertir fecha string → date
     try:
         fecha = datetime.strptime(fecha_str, "%Y-%m-%d").date()
     except ValueError:
-        return {"error": "Formato de fecha inválido. Usa YYYY-MM-DD"}, 400
+        return None, ({"error": "Formato de fecha inválido. Usa YYYY-MM-DD"}, 400)
 
     if not isinstance(horarios, list) or len(horarios) == 0:
-        return {"error": "Debe incluir al menos una franja horaria"}, 400
+        return None, ({"error": "Debe incluir al menos una franja horaria"}, 400)
+
+    if not all(isinstance(h, int) and not isinstance(h, bool) for h in horarios):
+        return None, ({"error": "horarios debe ser una lista de ids de franja"}, 400)
 
     # Validar pista
     pista = Pista.query.get(pista_id)
     if not pista:
-        return {"error": "Pista no encontrada"}, 404
+        return None, ({"error": "Pista no encontrada"}, 404)
 
-    # Validar disponibilidad
-    for h_id in horarios:
-        existe = (
-            db.session.query(HorarioReserva)
-            .join(Reserva)
-            .filter(
-                Reserva.pista_id == pista_id,
-                Reserva.fecha == fecha,
-                HorarioReserva.horario_id == h_id,
-            )
-            .first()
-        )
-        if existe:
+    if len(set(horarios)) != len(horarios):
+        return None, ({"error": "Hay franjas repetidas"}, 400)
+
+    if Horario.query.filter(Horario.id.in_(horarios)).count() != len(horarios):
+        return None, ({"error": "Franja horaria no encontrada"}, 404)
+
+    return (pista, fecha, horarios), None
+
+
+def _usuario_opcional():
+    """Id del usuario si la petición trae un JWT válido; si no, None."""
+    try:
+        verify_jwt_in_request(optional=True)
+        identidad = get_jwt_identity()
+    except Exception:
+        return None
+    return int(identidad) if identidad is not None else None
+
+
+def _horarios(desde=None, hasta=None):
+    """
+    Catálogo de franjas ordenado por hora de inicio.
+    desde/hasta ("HH:MM") acotan la ventana en SQL sobre inicio_min/fin_min.
+    Lanza ValueError si alguna hora no es válida.
+    """
+    query = Horario.query
+    if desde:
+        query = query.filter(Horario.inicio_min >= minutos(desde))
+    if hasta:
+        query = query.filter(Horario.fin_min <= minutos(hasta))
+    return query.order_by(Horario.inicio_min.asc(), Horario.id.asc()).all()
+
+
+# =========================================================
+# ===============   RESERVAS (USUARIO)   ==================
+# =========================================================
+
+@api_bp.post("/reservas")
+@idempotente
+@user_required
+def crear_reserva():
+    """
+    Crear una reserva nueva.
+    Reglas:
+    - Debe incluir pista_id, fecha y lista de horarios.
+    - No se puede reservar una franja ya ocupada.
+    - Cada franja se guarda con el precio_base de la pista.
+    - Si es fin de semana, se suma el extra 'fin de semana'.
+    """
+    usuario_id = _user_id()
+    datos, error = _leer_franjas(request.get_json() or {})
+    if error:
+        return error
+    pista, fecha, horarios = datos
+    pista_id = pista.id
+
+    # Franjas retenidas: las de otro usuario no se pueden reservar; si
+    # todas son del propio usuario, ya se comprobaron al retenerlas
+    propias, ajena = retenciones.estado(usuario_id, pista_id, fecha, horarios)
+    if ajena is not None:
+        return {"error": f"La franja {ajena} está retenida por otro usuario"}, 409
+
+    # Validar disponibilidad (aviso rápido; la garantía es el UNIQUE
+    # pista+fecha+franja de horarios_reserva, ver más abajo)
+    if len(propias) < len(horarios):
+        ocupada = _franja_ocupada(pista_id, fecha, horarios)
+        if ocupada is not None:
             return {
-                "error": f"La franja {h_id} ya está reservada para esa pista y fecha"
+                "error": f"La franja {ocupada} ya está reservada para esa pista y fecha"
             }, 409
 
     # -------------------------
@@ -103,19 +168,55 @@ def crear_reserva():
         hr = HorarioReserva(
             reserva_id=reserva.id,
             horario_id=h_id,
+            pista_id=pista_id,
+            fecha=fecha,
             precio=precio_final,
         )
         db.session.add(hr)
 
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # Otra reserva de esas franjas se confirmó entre la comprobación y
+        # el INSERT (UNIQUE pista+fecha+franja). Las franjas ya se validaron
+        # en _leer_franjas: si no es eso, el error sigue.
+        db.session.rollback()
+        ocupada = _franja_ocupada(pista_id, fecha, horarios)
+        if ocupada is None:
+            raise
+        return {
+            "error": f"La franja {ocupada} ya está reservada para esa pista y fecha"
+        }, 409
+
+    # Rollup diario en la misma transacción
+    rollups.aplicar_reservas(Reserva.id == reserva.id)
+    if propias:
+        retenciones.consumir(usuario_id, pista_id, fecha, propias)
+
+    # Efectos secundarios: en la misma transacción, se ejecutan tras el commit
+    tareas.encolar(
+        "auditoria",
+        evento="reserva_creada",
+        reserva_id=reserva.id,
+        usuario_id=usuario_id,
+        pista_id=reserva.pista_id,
+        fecha=fecha.isoformat(),
+        horarios=horarios,
+    )
+    ocupacion.anotar_cambio(pista_id, fecha)
+
     db.session.commit()
+    ocupacion.registrar_cambio(pista_id, fecha, horarios, ocupar=True)
+    if propias:
+        retenciones.olvidar(pista_id, fecha, propias)
 
     return {
         "id": reserva.id,
         "usuario_id": reserva.usuario_id,
         "pista_id": reserva.pista_id,
-        "fecha": reserva.fecha.isoformat(),
+        "fecha": reserva.fecha,
         "horarios": horarios,
-        "precio_final_por_franja": str(precio_final),
+        "precio_final_por_franja": precio_final,
     }, 201
 
 
@@ -124,19 +225,37 @@ def crear_reserva():
 @user_required
 def mis_reservas():
     """
-    Devuelve todas las reservas del usuario autenticado.
+    Devuelve las reservas del usuario autenticado.
     Incluye el precio total (suma de precios por franja).
+    Parámetros opcionales: desde, hasta (YYYY-MM-DD). Las reservas
+    archivadas sólo se incluyen si el rango llega al histórico.
     """
     uid = _user_id()
-    reservas = Reserva.query.filter_by(usuario_id=uid).all()
+    try:
+        desde, hasta = (
+            datetime.strptime(request.args[p], "%Y-%m-%d").date() if request.args.get(p) else None
+            for p in ("desde", "hasta")
+        )
+    except ValueError:
+        return {"error": "Formato de fecha inválido. Usa YYYY-MM-DD"}, 400
+
+    def filtrar(query, modelo):
+        query = query.filter(modelo.usuario_id == uid)
+        if desde:
+            query = query.filter(modelo.fecha >= desde)
+        if hasta:
+            query = query.filter(modelo.fecha <= hasta)
+        return query
+
+    reservas = archivo.reservas_con_archivo(filtrar, desde=desde, hasta=hasta)
 
     return [
         {
             "id": r.id,
-            "fecha": r.fecha.isoformat(),
+            "fecha": r.fecha,
             "pista": r.pista.nombre,
             "horarios": [hr.horario.franja for hr in r.horarios],
-            "precio_total": str(sum(hr.precio for hr in r.horarios)),
+            "precio_total": sum((hr.precio for hr in r.horarios), Decimal("0")),
         }
         for r in reservas
     ]
@@ -156,22 +275,23 @@ def detalle_reserva(reserva_id):
         "id": r.id,
         "usuario": r.usuario.nombre,
         "pista": r.pista.nombre,
-        "fecha": r.fecha.isoformat(),
+        "fecha": r.fecha,
         "horarios": [
             {
                 "id": hr.horario.id,
                 "franja": hr.horario.franja,
                 "turno": hr.horario.turno,
-                "precio": str(hr.precio),
+                "precio": hr.precio,
             }
             for hr in r.horarios
         ],
-        "precio_total": str(sum(hr.precio for hr in r.horarios)),
+        "precio_total": sum((hr.precio for hr in r.horarios), Decimal("0")),
     }
 
 
 
 @api_bp.delete("/reservas/<int:reserva_id>")
+@idempotente
 @owner_or_admin(allow_admin_edit=False)
 def cancelar_reserva(reserva_id):
     """
@@ -180,17 +300,93 @@ def cancelar_reserva(reserva_id):
     - El admin NO puede cancelar reservas de usuarios.
     """
     r = Reserva.query.get_or_404(reserva_id)
-    db.session.delete(r)
+    pista_id, fecha = r.pista_id, r.fecha
+    horario_ids = [hr.horario_id for hr in r.horarios]
+    rollups.aplicar_reservas(Reserva.id == r.id, signo=-1)
+    # Las franjas caen por ON DELETE CASCADE
+    db.session.execute(delete(Reserva).where(Reserva.id == r.id))
+    tareas.encolar(
+        "auditoria",
+        evento="reserva_cancelada",
+        reserva_id=reserva_id,
+        usuario_id=_user_id(),
+        pista_id=pista_id,
+        fecha=fecha.isoformat(),
+        horarios=horario_ids,
+    )
+    ocupacion.anotar_cambio(pista_id, fecha)
     db.session.commit()
+    ocupacion.registrar_cambio(pista_id, fecha, horario_ids, ocupar=False)
     return {}, 204
 
+# =========================================================
+# ===============   RETENCIONES (CHECKOUT)   ==============
+# =========================================================
+
+@api_bp.post("/retenciones")
+@idempotente
+@user_required
+def crear_retencion():
+    """
+    Retiene franjas durante RETENCION_TTL segundos mientras el usuario
+    completa la reserva. Mismo cuerpo que POST /api/reservas.
+    Retener otra vez las mismas franjas renueva el plazo.
+    """
+    datos, error = _leer_franjas(request.get_json() or {})
+    if error:
+        return error
+    pista, fecha, horarios = datos
+
+    ocupada = _franja_ocupada(pista.id, fecha, horarios)
+    if ocupada is not None:
+        return {"error": f"La franja {ocupada} ya está reservada para esa pista y fecha"}, 409
+
+    retencion, error = retenciones.retener(_user_id(), pista.id, fecha, horarios)
+    if error:
+        return {"error": error}, 409
+
+    return {
+        **retencion,
+        "pista_id": pista.id,
+        "fecha": fecha,
+        "horarios": horarios,
+    }, 201
+
+
+@api_bp.delete("/retenciones/<retencion>")
+@user_required
+def liberar_retencion(retencion):
+    """Suelta una retención propia antes de que caduque."""
+    if not retenciones.liberar(_user_id(), retencion):
+        return {"error": "Retención no encontrada"}, 404
+    return {}, 204
+
+
 # =========================================================
 # ===============   CONSULTA DATOS PISTAS / HORARIOS   ====
 # =========================================================
 @api_bp.get("/horarios")
 @user_required
 def list_horarios():
-    horarios = Horario.query.order_by(Horario.id.asc()).all()
+    """
+    Lista las franjas ordenadas por hora.
+    Parámetros opcionales: desde, hasta (HH:MM).
+    Sin filtros, la lista es el catálogo en el orden de los bits de
+    ?format=bits y X-Catalogo-Version indica su versión.
+    """
+    desde, hasta = request.args.get("desde"), request.args.get("hasta")
+    if not desde and not hasta:
+        cat = ocupacion.catalogo()
+        return [
+            {"id": cat.ids[i], "franja": cat.franjas[i], "turno": cat.turnos[i]}
+            for i in range(cat.n)
+        ], 200, {CABECERA_VERSION: cat.version}
+
+    try:
+        horarios = _horarios(desde, hasta)
+    except ValueError:
+        return {"error": "Formato de hora inválido. Usa HH:MM"}, 400
+
     return [
         {"id": h.id, "franja": h.franja, "turno": h.turno}
         for h in horarios
@@ -207,7 +403,7 @@ def list_pistas():
             "nombre": p.nombre,
             "cubierta": p.cubierta,
             "plazas": p.plazas,
-            "precio_base": str(p.precio_base),
+            "precio_base": p.precio_base,
         }
         for p in pistas
     ]
@@ -215,6 +411,39 @@ def list_pistas():
 # ===============   DISPONIBILIDAD   =======================
 # =========================================================
 
+def _libres(cat, ventana, ocupada):
+    """Franjas del catálogo dentro de la ventana y no ocupadas, en orden."""
+    return [
+        {"id": cat.ids[i], "franja": cat.franjas[i], "turno": cat.turnos[i]}
+        for i in cat.posiciones(ventana & ~ocupada)
+    ]
+
+
+# Formato compacto (?format=bits): en vez de la lista de franjas, la
+# máscara de libres en hexadecimal, con el bit i = franja i del catálogo
+# (el orden de GET /api/horarios). "version" permite al cliente detectar
+# que su copia del catálogo ha cambiado y volver a pedirla.
+CABECERA_VERSION = "X-Catalogo-Version"
+FORMATOS = ("json", "bits")
+
+
+def _formato(valor):
+    """Formato de respuesta pedido. ValueError si no es uno de FORMATOS."""
+    valor = valor or "json"
+    if valor not in FORMATOS:
+        raise ValueError(valor)
+    return valor
+
+
+def _bits(ventana, ocupada):
+    return format(ventana & ~ocupada, "x")
+
+
+def _ventana(cat, desde=None, hasta=None):
+    """Máscara de la ventana desde/hasta (HH:MM). ValueError si no es válida."""
+    return cat.ventana(minutos(desde) if desde else None, minutos(hasta) if hasta else None)
+
+
 @api_bp.get("/disponibilidad")
 def disponibilidad():
     """
@@ -222,6 +451,10 @@ def disponibilidad():
     Parámetros:
     - pista_id
     - fecha
+    - desde, hasta (HH:MM, opcionales)
+    - format: json (por defecto) o bits
+    La ocupación sale del mapa compartido entre workers; la BD sólo se
+    consulta si esa pista y fecha aún no están cargadas.
     """
     pista_id = request.args.get("pista_id")
     fecha = request.args.get("fecha")
@@ -229,35 +462,45 @@ def disponibilidad():
     if not pista_id or not fecha:
         return {"error": "pista_id y fecha son obligatorios"}, 400
 
-    # Todas las franjas existentes
-    horarios = Horario.query.all()
+    try:
+        formato = _formato(request.args.get("format"))
+    except ValueError:
+        return {"error": f"format debe ser uno de: {', '.join(FORMATOS)}"}, 400
 
-    # Franjas ocupadas en esa pista y fecha
-    ocupadas = (
-        db.session.query(HorarioReserva.horario_id)
-        .join(Reserva)
-        .filter(
-            Reserva.pista_id == pista_id,
-            Reserva.fecha == fecha,
-        )
-        .all()
-    )
-    ocupadas = {h[0] for h in ocupadas}
+    try:
+        pista_id = int(pista_id)
+    except ValueError:
+        return {"error": "pista_id debe ser un entero"}, 400
 
-    # Filtrar franjas libres
-    libres = [
-        {"id": h.id, "franja": h.franja, "turno": h.turno}
-        for h in horarios
-        if h.id not in ocupadas
-    ]
+    try:
+        fecha = datetime.strptime(fecha, "%Y-%m-%d").date()
+    except ValueError:
+        return {"error": "Formato de fecha inválido. Usa YYYY-MM-DD"}, 400
+
+    cat = ocupacion.catalogo()
+    # Todas las franjas existentes (dentro de la ventana pedida)
+    try:
+        ventana = _ventana(cat, request.args.get("desde"), request.args.get("hasta"))
+    except ValueError:
+        return {"error": "Formato de hora inválido. Usa HH:MM"}, 400
 
-    return {"libres": libres}
+    ocupada = ocupacion.mascaras_dia(cat, [pista_id], fecha)[pista_id]
+    # Las franjas retenidas por otros usuarios cuentan como ocupadas
+    ocupada |= retenciones.mascaras(cat, [(pista_id, fecha)], _usuario_opcional())[(pista_id, fecha)]
+
+    if formato == "bits":
+        return {"version": cat.version, "franjas": cat.n, "libres": _bits(ventana, ocupada)}
+    return {"libres": _libres(cat, ventana, ocupada)}
 
 
 @api_bp.post("/disponibilidadfecha")
 @user_required
 def disponibilidadfecha(): 
-    """Para una fecha, la disponibilidad de todas las pistas"""
+    """
+    Para una fecha, la disponibilidad de todas las pistas.
+    Cuerpo: fecha, desde/hasta opcionales y format (json o bits; también
+    vale ?format=).
+    """
     # force=True ayuda si el Content-Type no es exactamente application/json
     # silent=True evita que explote si el body está vacío o mal formado
     data = request.get_json(force=True, silent=True)
@@ -268,35 +511,139 @@ def disponibilidadfecha():
 
     fecha = data.get("fecha") 
 
- 
-   
-
     if not fecha:
         return {"error": "fecha es obligatoria"}, 400
 
-    pistas = Pista.query.all()
-    horarios = Horario.query.all()
+    try:
+        formato = _formato(data.get("format") or request.args.get("format"))
+    except ValueError:
+        return {"error": f"format debe ser uno de: {', '.join(FORMATOS)}"}, 400
 
-    disponibilidad = {}
+    try:
+        fecha = datetime.strptime(str(fecha), "%Y-%m-%d").date()
+    except ValueError:
+        return {"error": "Formato de fecha inválido. Usa YYYY-MM-DD"}, 400
 
-    for pista in pistas:
-        ocupadas = (
-            db.session.query(HorarioReserva.horario_id)
-            .join(Reserva)
-            .filter(
-                Reserva.pista_id == pista.id,
-                Reserva.fecha == fecha,
-            )
-            .all()
-        )
-        ocupadas = {h[0] for h in ocupadas}
+    pistas = db.session.query(Pista.id, Pista.nombre).all()
+    cat = ocupacion.catalogo()
+    try:
+        ventana = _ventana(cat, data.get("desde"), data.get("hasta"))
+    except (ValueError, AttributeError):
+        return {"error": "Formato de hora inválido. Usa HH:MM"}, 400
+
+    ocupadas = ocupacion.mascaras_dia(cat, [p.id for p in pistas], fecha)
+    retenidas = retenciones.mascaras(cat, [(p.id, fecha) for p in pistas], _user_id())
+    ocupadas = {p.id: ocupadas[p.id] | retenidas[(p.id, fecha)] for p in pistas}
+
+    if formato == "bits":
+        # Por id de pista (GET /api/pistas) para que la respuesta quede mínima
+        return {
+            "version": cat.version,
+            "franjas": cat.n,
+            "libres": {str(p.id): _bits(ventana, ocupadas[p.id]) for p in pistas},
+        }
+
+    disponibilidad = {
+        pista.nombre: _libres(cat, ventana, ocupadas[pista.id])
+        for pista in pistas
+    }
+
+    return {"disponibilidad": disponibilidad}
+
+# =========================================================
+# ===============   BÚSQUEDA DE HUECOS   ==================
+# =========================================================
+
+def _hhmm(mins: int) -> str:
+    return f"{mins // 60:02d}:{mins % 60:02d}"
 
-        libres = [
-            {"id": h.id, "franja": h.franja, "turno": h.turno}
-            for h in horarios
-            if h.id not in ocupadas
-        ]
 
-        disponibilidad[pista.nombre] = libres
+@api_bp.get("/buscar")
+@user_required
+def buscar_huecos():
+    """
+    Busca bloques de franjas contiguas libres en varias pistas y fechas.
+    Parámetros:
+    - duracion (minutos, obligatorio)
+    - desde, hasta (HH:MM): ventana horaria
+    - fecha_desde (por defecto hoy), fecha_hasta (por defecto +6 días)
+    - cubierta (true/false), plazas: filtros de pista
+    - limite (por defecto 20)
+    Orden: fecha, hora de inicio y, a igualdad, los huecos que encajan
+    junto a otra reserva o al borde de la ventana (menos fragmentación).
+    """
+    duracion = request.args.get("duracion", type=int)
+    if not duracion or duracion <= 0:
+        return {"error": "duracion (minutos) es obligatoria"}, 400
+
+    try:
+        desde_min = minutos(request.args["desde"]) if request.args.get("desde") else None
+        hasta_min = minutos(request.args["hasta"]) if request.args.get("hasta") else None
+    except ValueError:
+        return {"error": "Formato de hora inválido. Usa HH:MM"}, 400
 
-    return {"disponibilidad": disponibilidad}
\ No newline at end of file
+    try:
+        fecha_desde = (
+            datetime.strptime(request.args["fecha_desde"], "%Y-%m-%d").date()
+            if request.args.get("fecha_desde") else date.today()
+        )
+        fecha_hasta = (
+            datetime.strptime(request.args["fecha_hasta"], "%Y-%m-%d").date()
+            if request.args.get("fecha_hasta") else fecha_desde + timedelta(days=6)
+        )
+    except ValueError:
+        return {"error": "Formato de fecha inválido. Usa YYYY-MM-DD"}, 400
+
+    n_dias = (fecha_hasta - fecha_desde).days + 1
+    if n_dias <= 0 or n_dias > current_app.config["BUSQUEDA_MAX_DIAS"]:
+        return {"error": f"El rango de fechas debe tener entre 1 y {current_app.config['BUSQUEDA_MAX_DIAS']} días"}, 400
+
+    limite = min(request.args.get("limite", 20, type=int), 200)
+
+    pistas_q = Pista.query
+    if request.args.get("cubierta") is not None:
+        pistas_q = pistas_q.filter(Pista.cubierta == (request.args["cubierta"].lower() in ("1", "true", "si", "sí")))
+    if request.args.get("plazas", type=int):
+        pistas_q = pistas_q.filter(Pista.plazas == request.args.get("plazas", type=int))
+    pistas = {p.id: p.nombre for p in pistas_q.order_by(Pista.id.asc())}
+
+    cat = ocupacion.catalogo()
+    ventana = cat.ventana(desde_min, hasta_min)
+    grupos = cat.inicios_por_longitud(duracion)
+    if not pistas or not grupos:
+        return {"candidatos": [], "total": 0, "catalogo": cat.version}
+
+    ocupadas = ocupacion.mascaras_ocupacion(cat, list(pistas), fecha_desde, fecha_hasta)
+    fechas = [fecha_desde + timedelta(days=d) for d in range(n_dias)]
+    retenidas = retenciones.mascaras(cat, [(p, f) for f in fechas for p in pistas], _user_id())
+
+    candidatos = []
+    for fecha in fechas:
+        for pista_id in pistas:
+            ocupada = ocupadas.get((pista_id, fecha), 0) | retenidas[(pista_id, fecha)]
+            libres = ventana & ~ocupada
+            for k, inicios in ocupacion.bloques_libres(libres, grupos).items():
+                for i in cat.posiciones(inicios):
+                    j = i + k - 1
+                    # Encaje: el hueco toca una reserva o el borde de la ventana
+                    encaje = (not (libres >> (i - 1)) & 1 if i else 1) + (not (libres >> (j + 1)) & 1)
+                    candidatos.append((fecha, cat.inicio[i], -encaje, pista_id, i, j))
+
+    total = len(candidatos)
+    mejores = heapq.nsmallest(limite, candidatos)
+
+    return {
+        "total": total,
+        "catalogo": cat.version,
+        "candidatos": [
+            {
+                "pista_id": pista_id,
+                "pista": pistas[pista_id],
+                "fecha": fecha,
+                "inicio": _hhmm(cat.inicio[i]),
+                "fin": _hhmm(cat.fin[j]),
+                "horarios": list(cat.ids[i:j + 1]),
+            }
+            for fecha, _, _, pista_id, i, j in mejores
+        ],
+    }
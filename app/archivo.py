@@ -0,0 +1,98 @@
+import heapq
+from datetime import date, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, select
+
+from . import ocupacion
+from .extensions import db
+from .models import HorarioReserva, HorarioReservaArchivado, Reserva, ReservaArchivada
+
+
+# =========================================================
+# ===============   ARCHIVO DE RESERVAS PASADAS   =========
+# =========================================================
+# Las tablas vivas (reservas, horarios_reserva) sólo guardan el periodo
+# reciente; lo anterior a la fecha de corte se mueve a *_archivo en
+# transacciones por lotes. El rollup reservas_diarias no cambia.
+
+def fecha_corte_por_defecto():
+    return date.today() - timedelta(days=current_app.config["ARCHIVE_AFTER_DAYS"])
+
+
+def archivar(corte=None, lote=1000):
+    """
+    Mueve al archivo las reservas con fecha < corte, `lote` reservas por
+    transacción. Devuelve el número de reservas archivadas.
+    """
+    corte = corte or fecha_corte_por_defecto()
+    total = 0
+
+    while True:
+        ids = db.session.scalars(
+            select(Reserva.id).where(Reserva.fecha < corte).order_by(Reserva.id).limit(lote)
+        ).all()
+        if not ids:
+            break
+
+        db.session.execute(
+            insert(ReservaArchivada).from_select(
+                ["id", "usuario_id", "pista_id", "fecha"],
+                select(Reserva.id, Reserva.usuario_id, Reserva.pista_id, Reserva.fecha)
+                .where(Reserva.id.in_(ids)),
+            )
+        )
+        db.session.execute(
+            insert(HorarioReservaArchivado).from_select(
+                ["id", "reserva_id", "horario_id", "precio"],
+                select(HorarioReserva.id, HorarioReserva.reserva_id, HorarioReserva.horario_id, HorarioReserva.precio)
+                .where(HorarioReserva.reserva_id.in_(ids)),
+            )
+        )
+        db.session.execute(delete(HorarioReserva).where(HorarioReserva.reserva_id.in_(ids)))
+        db.session.execute(delete(Reserva).where(Reserva.id.in_(ids)))
+        ocupacion.anotar_cambio()
+        db.session.commit()
+
+        total += len(ids)
+
+    if total:
+        # Las reservas archivadas ya no cuentan como ocupación viva
+        ocupacion.invalidar_mapa()
+    return total
+
+
+def ultima_fecha_archivada():
+    """Fecha más reciente del archivo (None si está vacío). Usa el índice de fecha."""
+    return db.session.query(func.max(ReservaArchivada.fecha)).scalar()
+
+
+def incluye_archivo(desde=None, hasta=None, fecha=None):
+    """
+    ¿Hay que consultar el archivo para este rango?
+    Sólo si se pide un rango y empieza en o antes de lo último archivado.
+    """
+    if fecha is not None:
+        desde = fecha
+    elif desde is None and hasta is None:
+        return False
+
+    ultima = ultima_fecha_archivada()
+    return ultima is not None and (desde is None or desde <= ultima)
+
+
+def reservas_con_archivo(filtrar, desde=None, hasta=None, fecha=None):
+    """
+    Reservas vivas y, si el rango lo pide, archivadas, ordenadas por fecha.
+    `filtrar(query, modelo)` aplica los filtros comunes a cada tabla.
+    """
+    vivas = filtrar(Reserva.query, Reserva).order_by(Reserva.fecha.asc(), Reserva.id.asc()).all()
+    if not incluye_archivo(desde, hasta, fecha):
+        return vivas
+
+    archivadas = (
+        filtrar(ReservaArchivada.query, ReservaArchivada)
+        .order_by(ReservaArchivada.fecha.asc(), ReservaArchivada.id.asc())
+        .all()
+    )
+    return list(heapq.merge(archivadas, vivas, key=lambda r: (r.fecha, r.id)))
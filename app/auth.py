@@ -1,12 +1,39 @@
-from flask import Blueprint, request
+import uuid
+from datetime import datetime
+
+from flask import Blueprint, abort, current_app, request
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt, jwt_required, get_jwt_identity
+from sqlalchemy import delete, update
 
 from .extensions import db
-from .models import Usuario
+from .models import Usuario, Reserva, ReservaArchivada, RefreshToken
+from . import ocupacion, perfiles, revocacion, rollups
 
 auth_bp = Blueprint("auth", __name__)
 
+
+def _emitir_refresh(usuario_id, familia):
+    """
+    Crea un refresh token y su fila en refresh_tokens (sin commit).
+    Todos los tokens de una sesión (login + renovaciones) comparten familia.
+    """
+    jti = str(uuid.uuid4())
+    expira = current_app.config["JWT_REFRESH_TOKEN_EXPIRES"]
+    token = create_refresh_token(
+        identity=str(usuario_id),
+        expires_delta=expira,
+        additional_claims={"jti": jti, "fam": familia},
+    )
+    db.session.add(RefreshToken(
+        jti=jti,
+        familia=familia,
+        usuario_id=usuario_id,
+        expira_en=datetime.utcnow() + expira,
+    ))
+    return token
+
+
 @auth_bp.post("/register")
 def register():
     data = request.get_json() or {}
@@ -36,10 +63,14 @@ def login():
     if not user or not check_password_hash(user.password, password):
         return {"error": "credenciales inválidas"}, 401
 
-    token = create_access_token(identity=str(user.id))
+    familia = str(uuid.uuid4())
+    token = create_access_token(identity=str(user.id), additional_claims={"fam": familia})
+    refresh = _emitir_refresh(user.id, familia)
+    db.session.commit()
 
     return {
         "access_token": token,
+        "refresh_token": refresh,
         "user": {
             "id": user.id,
             "nombre": user.nombre,
@@ -50,6 +81,67 @@ def login():
 
 
 
+@auth_bp.post("/refresh")
+@jwt_required(refresh=True)
+def refresh():
+    """
+    Renueva la sesión con un refresh token (Authorization: Bearer <refresh>)
+    sin volver a comprobar la contraseña. El refresh token se rota: el usado
+    deja de valer y se devuelve uno nuevo. Presentar uno ya usado se trata
+    como robo y revoca todos los de esa sesión.
+    """
+    claims = get_jwt()
+    jti = claims["jti"]
+    ahora = datetime.utcnow()
+
+    # Un único UPDATE por el índice de jti: sólo gana el primero que lo usa
+    usado = db.session.execute(
+        update(RefreshToken)
+        .where(
+            RefreshToken.jti == jti,
+            RefreshToken.usada_en.is_(None),
+            RefreshToken.revocada.is_(False),
+        )
+        .values(usada_en=ahora)
+    ).rowcount
+
+    if not usado:
+        fila = db.session.query(RefreshToken.familia, RefreshToken.revocada).filter_by(jti=jti).first()
+        if fila is not None and not fila.revocada:
+            db.session.execute(
+                update(RefreshToken).where(RefreshToken.familia == fila.familia).values(revocada=True)
+            )
+            # También los access tokens ya emitidos en esa sesión
+            revocacion.revocar_familia(fila.familia)
+            db.session.commit()
+            revocacion.sincronizar()
+            current_app.logger.warning("Refresh token reutilizado (familia %s): sesión revocada", fila.familia)
+        return {"error": "refresh token no válido"}, 401
+
+    user_id = int(get_jwt_identity())
+    access = create_access_token(identity=str(user_id), additional_claims={"fam": claims["fam"]})
+    nuevo = _emitir_refresh(user_id, claims["fam"])
+    db.session.commit()
+
+    return {"access_token": access, "refresh_token": nuevo}, 200
+
+
+@auth_bp.post("/logout")
+@jwt_required(refresh=True)
+def logout():
+    """Cierra la sesión: revoca sus refresh tokens y los access tokens emitidos."""
+    fam = get_jwt().get("fam")
+    db.session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.familia == fam)
+        .values(revocada=True)
+    )
+    revocacion.revocar_familia(fam)
+    db.session.commit()
+    revocacion.sincronizar()
+    return {}, 204
+
+
 @auth_bp.post("/delete")
 
 def delete_account():
@@ -57,13 +149,32 @@ def delete_account():
     user_id = data.get("user_id")
     # borrar usuario
     user = Usuario.query.get_or_404(user_id)
-    db.session.delete(user)
+    # Sus reservas desaparecen con él: descontarlas del rollup
+    rollups.aplicar_reservas(Reserva.usuario_id == user.id, signo=-1)
+    rollups.aplicar_reservas(ReservaArchivada.usuario_id == user.id, signo=-1, archivadas=True)
+    # Reservas (vivas y archivadas) caen por ON DELETE CASCADE en la BD
+    db.session.execute(delete(Usuario).where(Usuario.id == user.id))
+    # Sus JWT dejan de valer ya, no al caducar (y el id puede reutilizarse)
+    revocacion.revocar_usuario(user.id)
+    ocupacion.anotar_cambio()
     db.session.commit()
+    revocacion.sincronizar()
+    ocupacion.invalidar_mapa()
+    perfiles.invalidar(user.id)
     return {"message": "cuenta eliminada"}, 200
 
 @auth_bp.get("/me")
 @jwt_required()
 def me():
-    user_id = int(get_jwt_identity())
-    user = Usuario.query.get_or_404(user_id)
-    return {"id": user.id, "email": user.email, "nombre": user.nombre, "dni": user.dni,"rol": user.rol.nombre}, 200
\ No newline at end of file
+    """
+    Perfil del usuario autenticado, desde la caché de perfiles (sin BD si
+    ya está cargado). Con If-None-Match y el mismo ETag responde 304.
+    """
+    p = perfiles.perfil(int(get_jwt_identity()))
+    if p is None:
+        abort(404)
+    etag, cuerpo = p
+    r = current_app.response_class(cuerpo, mimetype="application/json")
+    r.set_etag(etag)
+    r.headers["Cache-Control"] = "private, no-cache"
+    return r.make_conditional(request)
\ No newline at end of file
@@ -0,0 +1,136 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request
+from flask_jwt_extended import decode_token
+
+from .extensions import jwt
+
+
+# =========================================================
+# ===============   CLUBS: UNA BD POR CLUB   ==============
+# =========================================================
+# Con CLUBS="centro=...,norte=..." cada club tiene su propia base de
+# datos con el esquema completo (usuarios, pistas, reservas...): las
+# escrituras de un club no esperan al cerrojo de las de otro, así que
+# la capacidad de escritura crece con el número de clubs. La BD por
+# defecto (SQLALCHEMY_DATABASE_URI) sigue existiendo: es la de la
+# administración central y la de siempre si no hay clubs.
+#
+# El club de cada petición sale de:
+# - la URL: /clubs/<club>/api/... es /api/... contra la BD de ese club
+#   (el prefijo se quita antes del enrutado, las rutas no cambian)
+# - o del claim "club" del JWT, que llevan los tokens emitidos en un club
+# Si vienen los dos tienen que coincidir: los ids de usuario se repiten
+# entre clubs, así que un token sólo vale en el club que lo emitió.
+#
+# Queda en g.club y la sesión (extensions.SesionClub) elige el engine
+# con él. Lo que cada proceso guarda en memoria por base de datos
+# (catálogo, mapa de ocupación, retenciones, revocaciones, perfiles)
+# va separado por actual().
+
+CLAVE_ENTORNO = "padel.club"
+PREFIJO = "/clubs/"
+
+
+def actual():
+    """Club del contexto en curso (None = BD por defecto)."""
+    return g.get("club") if has_app_context() else None
+
+
+def configurados():
+    return list(current_app.config["CLUBS"])
+
+
+@contextmanager
+def en_club(app, club):
+    """App context nuevo con las consultas dirigidas a la BD de `club`."""
+    with app.app_context():
+        g.club = club
+        yield
+
+
+def en_todos(fn, *args):
+    """
+    Ejecuta fn(*args) en cada club, en paralelo (CLUBS_HILOS hilos, cada
+    uno con su app context y su conexión). Devuelve ({club: resultado},
+    {club: error}): un club caído no tumba el informe de los demás.
+    """
+    app = current_app._get_current_object()
+    clubs = configurados()
+
+    def uno(club):
+        with en_club(app, club):
+            return fn(*args)
+
+    resultados, errores = {}, {}
+    with ThreadPoolExecutor(max_workers=max(1, min(len(clubs), app.config["CLUBS_HILOS"]))) as pool:
+        futuros = {club: pool.submit(uno, club) for club in clubs}
+        for club, futuro in futuros.items():
+            try:
+                resultados[club] = futuro.result()
+            except Exception as e:
+                app.logger.exception("Informe del club %s", club)
+                errores[club] = str(e)
+    return resultados, errores
+
+
+class PrefijoClub:
+    """WSGI: /clubs/<club>/resto → /resto, con el club en el environ."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        ruta = environ.get("PATH_INFO", "")
+        if ruta.startswith(PREFIJO):
+            club, _, resto = ruta[len(PREFIJO):].partition("/")
+            if club:
+                environ[CLAVE_ENTORNO] = club
+                environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + PREFIJO + club
+                environ["PATH_INFO"] = "/" + resto
+        return self.wsgi_app(environ, start_response)
+
+
+def _club_del_token():
+    """(club del JWT, hay JWT válido). Sin comprobar revocación: eso va en el endpoint."""
+    cabecera = request.headers.get("Authorization", "")
+    if not cabecera.startswith("Bearer "):
+        return None, False
+    try:
+        return decode_token(cabecera[7:]).get("club"), True
+    except Exception:
+        # Caducado o mal formado: el endpoint responderá 401/422
+        return None, False
+
+
+def init_clubs(app):
+    """Antes que init_limites: el límite por usuario ya necesita la BD del club."""
+    if not app.config["CLUBS"]:
+        return
+
+    app.wsgi_app = PrefijoClub(app.wsgi_app)
+
+    @app.before_request
+    def _elegir_club():
+        clubs = app.config["CLUBS"]
+        de_url = request.environ.get(CLAVE_ENTORNO)
+        del_token, hay_token = _club_del_token()
+
+        if de_url is not None:
+            if de_url not in clubs:
+                return {"error": "Club desconocido"}, 404
+            if hay_token and del_token != de_url:
+                return {"error": "El token no es de este club"}, 403
+            g.club = de_url
+        elif del_token is not None:
+            if del_token not in clubs:
+                return {"error": "Club desconocido"}, 404
+            g.club = del_token
+        return None
+
+    @jwt.additional_claims_loader
+    def _claim_club(identidad):
+        # Los tokens emitidos dentro de un club llevan el club
+        club = actual()
+        return {"club": club} if club is not None else {}
@@ -0,0 +1,228 @@
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+
+
+def _fecha(valor):
+    return datetime.strptime(valor, "%Y-%m-%d").date() if valor else None
+
+
+# -------------------------
+# ROLLUPS
+# -------------------------
+rollups_cli = AppGroup("rollups", help="Mantenimiento del rollup reservas_diarias.")
+
+
+@rollups_cli.command("reconstruir")
+@click.option("--desde", help="Fecha inicial (YYYY-MM-DD). Por defecto, todo el histórico.")
+@click.option("--hasta", help="Fecha final (YYYY-MM-DD).")
+def reconstruir_rollups(desde, hasta):
+    """Recalcula reservas_diarias desde horarios_reserva."""
+    from .rollups import reconstruir
+
+    filas = reconstruir(_fecha(desde), _fecha(hasta))
+    click.echo(f"reservas_diarias reconstruida: {filas} filas")
+
+
+# -------------------------
+# ARCHIVO
+# -------------------------
+reservas_cli = AppGroup("reservas", help="Mantenimiento de reservas.")
+
+
+@reservas_cli.command("archivar")
+@click.option("--antes-de", "antes_de", help="Fecha de corte (YYYY-MM-DD). Por defecto, hoy - ARCHIVE_AFTER_DAYS.")
+@click.option("--lote", default=1000, show_default=True, help="Reservas por transacción.")
+def archivar_reservas(antes_de, lote):
+    """Mueve las reservas anteriores al corte a las tablas de archivo."""
+    from .archivo import archivar, fecha_corte_por_defecto
+
+    corte = _fecha(antes_de) or fecha_corte_por_defecto()
+    total = archivar(corte, lote)
+    click.echo(f"{total} reservas archivadas (fecha < {corte.isoformat()})")
+
+
+# -------------------------
+# TAREAS
+# -------------------------
+tareas_cli = AppGroup("tareas", help="Tareas en segundo plano (outbox).")
+
+
+@tareas_cli.command("procesar")
+@click.option("--limite", type=int, help="Máximo de tareas a ejecutar.")
+def procesar_tareas(limite):
+    """Ejecuta en primer plano las tareas pendientes ya disponibles."""
+    from .tareas import ejecutar, pendientes
+
+    resultados = {}
+    for tarea_id in pendientes(limite):
+        r = ejecutar(tarea_id)
+        if r is not None:
+            resultados[r[0]] = resultados.get(r[0], 0) + 1
+    click.echo(f"tareas procesadas: {resultados or 0}")
+
+
+# -------------------------
+# IDEMPOTENCIA
+# -------------------------
+idempotencia_cli = AppGroup("idempotencia", help="Claves Idempotency-Key guardadas.")
+
+
+@idempotencia_cli.command("purgar")
+def purgar_idempotencia():
+    """Borra las claves caducadas."""
+    from .idempotencia import purgar
+
+    click.echo(f"{purgar()} claves caducadas borradas")
+
+
+# -------------------------
+# USUARIOS
+# -------------------------
+usuarios_cli = AppGroup("usuarios", help="Gestión de usuarios.")
+
+
+@usuarios_cli.command("importar")
+@click.argument("fichero", type=click.File("r", encoding="utf-8-sig"))
+@click.option("--procesos", type=int, help="Procesos para hashear contraseñas (por defecto, HASH_PROCESOS o nº de CPUs).")
+def importar_usuarios(fichero, procesos):
+    """Alta masiva de socios desde un CSV o JSON (nombre, email, dni, password)."""
+    import csv
+    import json
+
+    from .alta_usuarios import alta_masiva
+
+    if fichero.name.endswith(".json"):
+        items = json.load(fichero)
+    else:
+        items = list(csv.DictReader(fichero))
+
+    resultado = alta_masiva(items, procesos)
+    for fila in resultado["filas"]:
+        if fila["estado"] == "error":
+            click.echo(f"fila {fila['fila']}: {fila['error']}", err=True)
+    click.echo(f"{resultado['creadas']} usuarios creados, {resultado['errores']} errores")
+
+
+# -------------------------
+# TOKENS
+# -------------------------
+tokens_cli = AppGroup("tokens", help="Mantenimiento de tokens de sesión.")
+
+
+@tokens_cli.command("purgar")
+def purgar_tokens():
+    """Borra los refresh tokens y las revocaciones caducadas."""
+    from sqlalchemy import delete
+
+    from .extensions import db
+    from .models import RefreshToken
+    from .revocacion import purgar
+
+    borrados = db.session.execute(
+        delete(RefreshToken).where(RefreshToken.expira_en <= datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    click.echo(f"{borrados} refresh tokens caducados borrados")
+    click.echo(f"{purgar()} revocaciones caducadas borradas")
+
+
+# -------------------------
+# OCUPACIÓN
+# -------------------------
+ocupacion_cli = AppGroup("ocupacion", help="Mapa de ocupación compartido.")
+
+
+@ocupacion_cli.command("sincronizar")
+def sincronizar_ocupacion():
+    """Aplica al mapa en disco los cambios pendientes de cambios_ocupacion."""
+    from .ocupacion import mapa, sincronizar_mapa
+
+    sincronizar_mapa(forzar=True)
+    m = mapa()
+    click.echo(f"mapa al día hasta el cambio {m.cambio()}" if m is not None else "mapa desactivado")
+
+
+@ocupacion_cli.command("purgar")
+@click.option("--dias", default=7, show_default=True, help="Antigüedad mínima de los cambios a borrar.")
+def purgar_ocupacion(dias):
+    """Borra los cambios de ocupación antiguos."""
+    from .ocupacion import purgar_cambios
+
+    click.echo(f"{purgar_cambios(dias)} cambios de ocupación borrados")
+
+
+# -------------------------
+# RETENCIONES
+# -------------------------
+retenciones_cli = AppGroup("retenciones", help="Retenciones de franjas durante el checkout.")
+
+
+@retenciones_cli.command("purgar")
+def purgar_retenciones():
+    """Borra las retenciones caducadas."""
+    from .retenciones import purgar
+
+    click.echo(f"{purgar()} retenciones caducadas borradas")
+
+
+# -------------------------
+# CLUBS
+# -------------------------
+clubs_cli = AppGroup("clubs", help="Bases de datos de los clubs (CLUBS).")
+
+
+@clubs_cli.command("upgrade")
+@click.option("--revision", default="head", show_default=True)
+def upgrade_clubs(revision):
+    """Aplica las migraciones a la BD por defecto y a la de cada club."""
+    from flask import current_app
+    from flask_migrate import upgrade
+
+    from .clubs import configurados, en_club
+
+    app = current_app._get_current_object()
+    for club in [None, *configurados()]:
+        click.echo(f"== {club or '(por defecto)'}")
+        with en_club(app, club):
+            upgrade(revision=revision)
+
+
+@clubs_cli.command("en", context_settings={"ignore_unknown_options": True})
+@click.argument("club")
+@click.argument("comando", nargs=-1, required=True, type=click.UNPROCESSED)
+@click.pass_context
+def en_club_cli(ctx, club, comando):
+    """
+    Ejecuta otro comando contra la BD de un club, p. ej.
+    flask clubs en norte rollups reconstruir --desde 2024-01-01
+    """
+    from flask import current_app
+
+    from .clubs import en_club
+
+    app = current_app._get_current_object()
+    if club not in app.config["CLUBS"]:
+        raise click.BadParameter(f"club desconocido: {club}", param_hint="CLUB")
+    raiz = ctx.find_root()
+    # Los comandos reutilizan el app context ya abierto (con g.club)
+    with en_club(app, club):
+        raiz.command.main(
+            list(comando),
+            prog_name=f"{raiz.info_name} clubs en {club}",
+            obj=raiz.obj,
+            standalone_mode=False,
+        )
+
+
+def register_commands(app):
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(reservas_cli)
+    app.cli.add_command(tareas_cli)
+    app.cli.add_command(idempotencia_cli)
+    app.cli.add_command(usuarios_cli)
+    app.cli.add_command(tokens_cli)
+    app.cli.add_command(ocupacion_cli)
+    app.cli.add_command(retenciones_cli)
+    app.cli.add_command(clubs_cli)
@@ -0,0 +1,151 @@
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard es opcional
+    zstandard = None
+
+
+# =========================================================
+# ===============   COMPRESORES INCREMENTALES   ===========
+# =========================================================
+# Todos exponen la misma interfaz:
+#   - chunk(data)  → bytes comprimidos disponibles ya (flush parcial)
+#   - finish()     → bytes finales del stream
+# Así se puede comprimir un body completo o un generador trozo a trozo
+# sin acumular la respuesta en memoria.
+
+class _Gzip:
+    def __init__(self, level):
+        self._c = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data):
+        return self._c.compress(data) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._c.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self, level):
+        # COMPRESS_LEVEL va en la escala de gzip (1-9); brotli usa
+        # "quality" 0-11 y el mismo número sirve tal cual
+        self._c = brotli.Compressor(quality=min(level, 11))
+
+    def chunk(self, data):
+        return self._c.process(data) + self._c.flush()
+
+    def finish(self):
+        return self._c.finish()
+
+
+class _Zstd:
+    def __init__(self, level):
+        # zstd admite niveles hasta 22, pero los altos son mucho más lentos:
+        # con el nivel de gzip (1-9) queda en su rango rápido
+        self._c = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def chunk(self, data):
+        return self._c.compress(data) + self._c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._c.flush()
+
+
+def _compresores():
+    """Codificaciones disponibles, en orden de preferencia."""
+    disponibles = {}
+    if zstandard is not None:
+        disponibles["zstd"] = _Zstd
+    if brotli is not None:
+        disponibles["br"] = _Brotli
+    disponibles["gzip"] = _Gzip
+    return disponibles
+
+
+COMPRESORES = _compresores()
+
+
+# =========================================================
+# ===============   SELECCIÓN Y HOOK   ====================
+# =========================================================
+
+def elegir_codificacion(accept_encoding):
+    """
+    Devuelve la mejor codificación aceptada por el cliente o None.
+    Respeta los q-values (q=0 desactiva una codificación); a igualdad
+    de calidad gana el orden de preferencia de COMPRESORES.
+    """
+    mejor, mejor_q = None, 0
+    for nombre in COMPRESORES:
+        q = accept_encoding.quality(nombre)
+        if q > mejor_q:
+            mejor, mejor_q = nombre, q
+    return mejor
+
+
+def _comprimir_stream(iterable, compresor):
+    try:
+        for data in iterable:
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            out = compresor.chunk(data)
+            if out:
+                yield out
+        yield compresor.finish()
+    finally:
+        close = getattr(iterable, "close", None)
+        if close is not None:
+            close()
+
+
+def init_compression(app):
+    """
+    Registra la compresión de respuestas.
+    Config:
+    - COMPRESS_MIMETYPES: tipos a comprimir
+    - COMPRESS_MIN_SIZE: bytes mínimos (sólo respuestas no streaming)
+    - COMPRESS_LEVEL: nivel de compresión
+    """
+
+    @app.after_request
+    def comprimir_respuesta(response):
+        if not app.config["COMPRESS_ENABLED"]:
+            return response
+
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 304)
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in app.config["COMPRESS_MIMETYPES"]
+        ):
+            return response
+
+        response.vary.add("Accept-Encoding")
+
+        codificacion = elegir_codificacion(request.accept_encodings)
+        if codificacion is None:
+            return response
+
+        compresor = COMPRESORES[codificacion](app.config["COMPRESS_LEVEL"])
+
+        if response.is_streamed:
+            # Generadores (exportaciones): se comprime cada trozo al vuelo
+            response.response = _comprimir_stream(response.response, compresor)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < app.config["COMPRESS_MIN_SIZE"]:
+                return response
+            response.set_data(compresor.chunk(data) + compresor.finish())
+
+        response.headers["Content-Encoding"] = codificacion
+        return response
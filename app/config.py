@@ -1,16 +1,163 @@
+import hashlib
 import os
+import tempfile
+from datetime import timedelta
 from pathlib import Path
 
 
 BASE_DIR = Path(__file__).resolve().parent.parent  # .../padel-api
 
 
+def _clubs(valor):
+    """CLUBS="centro=sqlite:///centro.db,norte=postgresql://..." → {club: url}."""
+    clubs = {}
+    for parte in filter(None, (p.strip() for p in valor.split(","))):
+        club, _, url = parte.partition("=")
+        club = club.strip()
+        if not url or not club.replace("-", "").replace("_", "").isalnum():
+            raise ValueError(f"CLUBS: entrada inválida {parte!r} (se espera club=url)")
+        clubs[club] = url.strip()
+    return clubs
+
+
+# Hilos por worker y workers de gunicorn.conf.py (umbral de descarte)
+_GUNICORN_THREADS = int(os.getenv("GUNICORN_THREADS", "8"))
+_GUNICORN_WORKERS = int(os.getenv("GUNICORN_WORKERS", "4"))
+
+
 class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "dev")
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "dev-jwt")
+    # Vida de los refresh tokens (/auth/refresh); el access token sigue en 15 min
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=int(os.getenv("JWT_REFRESH_DAYS", "30")))
+    # Blocklist en memoria: cada cuánto se leen revocaciones nuevas y se
+    # olvidan las caducadas (s), y tasa de falsos positivos del filtro
+    TOKEN_BLOCKLIST_SYNC = float(os.getenv("TOKEN_BLOCKLIST_SYNC", "2"))
+    TOKEN_BLOCKLIST_PRUNE = float(os.getenv("TOKEN_BLOCKLIST_PRUNE", "300"))
+    TOKEN_BLOCKLIST_FP = float(os.getenv("TOKEN_BLOCKLIST_FP", "0.001"))
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///padel.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Proxies inversos delante de la app (nginx, PythonAnywhere...): de
+    # X-Forwarded-For sale la IP real de los límites por IP. 0 si se
+    # expone directamente, o cualquiera podría falsear su IP.
+    PROXY_SALTOS = int(os.getenv("PROXY_SALTOS", "1"))
+    # Una base de datos por club (app/clubs.py), además de la de por defecto
+    CLUBS = _clubs(os.getenv("CLUBS", ""))
+    SQLALCHEMY_BINDS = {f"club_{club}": url for club, url in CLUBS.items()}
+    # Hilos de los informes que recorren todos los clubs
+    CLUBS_HILOS = int(os.getenv("CLUBS_HILOS", "8"))
 
 
     UPLOAD_FOLDER = str(BASE_DIR / os.getenv("UPLOAD_FOLDER", "uploads"))
-    MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH_MB", "10")) * 1024 * 1024
\ No newline at end of file
+    MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH_MB", "10")) * 1024 * 1024
+
+    # Compresión de respuestas (gzip; br/zstd si están instalados)
+    COMPRESS_ENABLED = os.getenv("COMPRESS_ENABLED", "1") == "1"
+    COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+    COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+    COMPRESS_MIMETYPES = {
+        "application/json",
+        "application/x-ndjson",
+        "text/csv",
+        "text/plain",
+        "text/html",
+    }
+
+    # Exportaciones en streaming: filas por lote del cursor
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+    # Catálogo de franjas cacheado en cada worker (segundos)
+    CATALOGO_TTL = int(os.getenv("CATALOGO_TTL", "60"))
+    # Perfil de /auth/me cacheado por usuario en cada worker (segundos, entradas)
+    PERFIL_CACHE_TTL = int(os.getenv("PERFIL_CACHE_TTL", "60"))
+    PERFIL_CACHE_MAX = int(os.getenv("PERFIL_CACHE_MAX", "10000"))
+    # Rango máximo de fechas para la búsqueda de huecos
+    BUSQUEDA_MAX_DIAS = int(os.getenv("BUSQUEDA_MAX_DIAS", "62"))
+
+    # Mapa de ocupación compartido entre workers (fichero mapeado en memoria).
+    # Por defecto uno por base de datos en el directorio temporal.
+    OCCUPANCY_MAP_ENABLED = os.getenv("OCCUPANCY_MAP_ENABLED", "1") == "1"
+    OCCUPANCY_MAP_PATH = os.getenv(
+        "OCCUPANCY_MAP_PATH",
+        os.path.join(
+            tempfile.gettempdir(),
+            "padel-ocupacion-%s.map" % hashlib.sha1(SQLALCHEMY_DATABASE_URI.encode("utf-8")).hexdigest()[:12],
+        ),
+    )
+    # Pistas (ids 0..N-1) y días (ventana circular) que caben en el mapa
+    OCCUPANCY_MAP_PISTAS = int(os.getenv("OCCUPANCY_MAP_PISTAS", "64"))
+    OCCUPANCY_MAP_DIAS = int(os.getenv("OCCUPANCY_MAP_DIAS", "128"))
+
+    # Cada cuántos segundos un worker aplica al mapa de ocupación los
+    # cambios anotados en cambios_ocupacion por otros procesos
+    OCCUPANCY_SYNC = float(os.getenv("OCCUPANCY_SYNC", "2"))
+    # Duración máxima de una transacción de escritura (s): cada sincronización
+    # relee lo anotado en esta ventana, por si un commit tardío dejó un id
+    # por debajo del último aplicado (PostgreSQL)
+    SYNC_VENTANA = int(os.getenv("SYNC_VENTANA", "60"))
+
+    # Retenciones de franjas durante el checkout (app/retenciones.py):
+    # duración, recarga de la copia en memoria de cada worker (s) y
+    # máximo de franjas retenidas a la vez por usuario
+    RETENCION_TTL = int(os.getenv("RETENCION_TTL", "300"))
+    RETENCION_SYNC = float(os.getenv("RETENCION_SYNC", "1"))
+    RETENCION_MAX_FRANJAS = int(os.getenv("RETENCION_MAX_FRANJAS", "4"))
+
+    # Tareas en segundo plano (app/tareas.py)
+    TAREAS_ENABLED = os.getenv("TAREAS_ENABLED", "1") == "1"
+    TAREAS_WORKERS = int(os.getenv("TAREAS_WORKERS", "4"))
+    TAREAS_MAX_COLA = int(os.getenv("TAREAS_MAX_COLA", "1000"))
+    TAREAS_MAX_INTENTOS = int(os.getenv("TAREAS_MAX_INTENTOS", "5"))
+    TAREAS_BACKOFF = float(os.getenv("TAREAS_BACKOFF", "2"))  # segundos, se dobla en cada intento
+    TAREAS_BACKOFF_MAX = float(os.getenv("TAREAS_BACKOFF_MAX", "300"))
+    TAREAS_PLAZO = int(os.getenv("TAREAS_PLAZO", "300"))  # tras esto, una tarea en_curso se da por perdida
+    TAREAS_BARRIDO = float(os.getenv("TAREAS_BARRIDO", "30"))  # segundos entre barridos del outbox
+
+    # Idempotency-Key en endpoints de escritura (app/idempotencia.py)
+    IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))  # respuestas guardadas (s)
+    IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "60"))  # petición original abandonada (s)
+    IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "5"))  # espera de un duplicado concurrente (s)
+
+    # Alta masiva de usuarios: procesos para hashear contraseñas
+    # (vacío = nº de CPUs) y tamaño mínimo de lote para usar el pool
+    HASH_PROCESOS = int(os.getenv("HASH_PROCESOS", "0")) or None
+    HASH_MIN_PARALELO = int(os.getenv("HASH_MIN_PARALELO", "8"))
+
+    # Límites de peticiones (app/limites.py).
+    # endpoint → (capacidad de ráfaga, fichas por segundo), por usuario o IP
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+    RATE_LIMITS = {
+        "api.disponibilidad": (20, 5),
+        "api.disponibilidadfecha": (10, 1),
+        "api.buscar_huecos": (10, 1),
+        "api.crear_reserva": (10, 0.5),
+        "api.crear_retencion": (10, 0.5),
+    }
+    # Endpoints POST que sólo leen (se descartan como lecturas)
+    RATE_LIMIT_LECTURAS = {"api.disponibilidadfecha"}
+    # "memoria" (por worker) o "compartido" (fichero mapeado entre workers)
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memoria")
+    # Con más peticiones en curso que esto se rechazan las lecturas (0 = nunca).
+    # Se cuentan por worker ("memoria") o entre todos ("compartido"); por
+    # defecto, 3/4 de los hilos de gunicorn.conf.py que las atienden.
+    RATE_LIMIT_SHED_EN_CURSO = int(os.getenv(
+        "RATE_LIMIT_SHED_EN_CURSO",
+        str(_GUNICORN_THREADS * 3 // 4 * (_GUNICORN_WORKERS if RATE_LIMIT_BACKEND == "compartido" else 1)),
+    ))
+    RATE_LIMIT_PATH = os.getenv(
+        "RATE_LIMIT_PATH",
+        os.path.join(
+            tempfile.gettempdir(),
+            "padel-limites-%s.map" % hashlib.sha1(SQLALCHEMY_DATABASE_URI.encode("utf-8")).hexdigest()[:12],
+        ),
+    )
+    RATE_LIMIT_HUECOS = int(os.getenv("RATE_LIMIT_HUECOS", "65536"))
+
+    # Rango máximo (días) del mapa de calor de ocupación
+    HEATMAP_MAX_DIAS = int(os.getenv("HEATMAP_MAX_DIAS", "400"))
+
+    # Reservas con más antigüedad (días) que se mueven al archivo
+    ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+
+    # Calentar la app al arrancar (wsgi.py / gunicorn --preload)
+    WARM_ON_STARTUP = os.getenv("WARM_ON_STARTUP", "1") == "1"
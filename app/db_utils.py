@@ -0,0 +1,19 @@
+from .extensions import db
+
+
+def dialect_insert(table):
+    """
+    INSERT del dialecto activo, con soporte de ON CONFLICT (upsert).
+    SQLite y PostgreSQL comparten la misma API en SQLAlchemy:
+    .on_conflict_do_update(index_elements=..., set_=...) y .excluded.
+    """
+    dialecto = db.session.get_bind().dialect.name
+
+    if dialecto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialecto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise NotImplementedError(f"Upsert no soportado para el dialecto {dialecto}")
+
+    return insert(table)
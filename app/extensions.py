@@ -1,7 +1,59 @@
+import sqlite3
+
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def bind_club(club):
+    """Clave en SQLALCHEMY_BINDS de la base de datos de un club."""
+    return f"club_{club}"
+
+
+class SesionClub(Session):
+    """
+    Sesión que manda todas las consultas a la base de datos del club del
+    contexto (g.club, ver app/clubs.py). Cada club tiene el esquema
+    completo, así que no hay __bind_key__ en los modelos: sin club, la
+    BD por defecto de siempre.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            club = g.get("club")
+            if club is not None:
+                return self._db.engines[bind_club(club)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
 
-db = SQLAlchemy()
+
+db = SQLAlchemy(session_options={"class_": SesionClub})
 migrate = Migrate()
 jwt = JWTManager()
+
+
+@jwt.token_in_blocklist_loader
+def _token_revocado(jwt_header, jwt_payload):
+    """
+    Se llama en cada petición con JWT. Responde desde la copia en memoria
+    de tokens_revocados (app/revocacion.py), sin consultar la BD.
+    """
+    from .revocacion import esta_revocado
+
+    return esta_revocado(jwt_payload)
+
+
+@event.listens_for(Engine, "connect")
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    SQLite no aplica las FOREIGN KEY (ni sus ON DELETE CASCADE) salvo que
+    se active en cada conexión. Los borrados de pistas/usuarios/reservas
+    dependen de ello para no cargar los hijos en memoria.
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
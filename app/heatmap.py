@@ -0,0 +1,124 @@
+from sqlalchemy import select, union_all
+
+try:
+    import numpy as np
+except ImportError:  # el endpoint responde 501 sin numpy
+    np = None
+
+from . import archivo
+from .models import HorarioReserva, HorarioReservaArchivado, Reserva, ReservaArchivada
+
+
+# =========================================================
+# ===============   MAPA DE CALOR DE OCUPACIÓN   ==========
+# =========================================================
+# Tensor booleano denso pistas × franjas × días (True = reservada),
+# construido con una consulta de tripletas (pista_id, fecha, horario_id).
+# Los agregados salen con operaciones vectorizadas sobre el tensor y se
+# devuelven como matrices de porcentajes.
+
+DIAS_SEMANA = ("lun", "mar", "mie", "jue", "vie", "sab", "dom")
+
+
+def disponible():
+    return np is not None
+
+
+def tripletas(desde, hasta, pista_ids=None):
+    """SELECT (pista_id, fecha, horario_id) del rango, con el archivo si hace falta."""
+    def select_tabla(reserva, franja):
+        stmt = (
+            select(reserva.pista_id, reserva.fecha, franja.horario_id)
+            .join(franja, franja.reserva_id == reserva.id)
+            .where(reserva.fecha >= desde, reserva.fecha <= hasta)
+        )
+        if pista_ids:
+            stmt = stmt.where(reserva.pista_id.in_(pista_ids))
+        return stmt
+
+    stmt = select_tabla(Reserva, HorarioReserva)
+    if archivo.incluye_archivo(desde, hasta):
+        stmt = union_all(select_tabla(ReservaArchivada, HorarioReservaArchivado), stmt)
+    return stmt
+
+
+def _indices(valores, ids):
+    """Posición de cada valor en `ids` (-1 si no está), con una tabla de búsqueda."""
+    tabla = np.full(max(max(ids), int(valores.max())) + 1, -1, dtype=np.int64)
+    tabla[np.asarray(ids)] = np.arange(len(ids))
+    return tabla[valores]
+
+
+def tensor(filas, pista_ids, horario_ids, desde, n_dias):
+    """Tensor bool (pistas, franjas, días) a partir de las tripletas."""
+    t = np.zeros((len(pista_ids), len(horario_ids), n_dias), dtype=bool)
+    if not filas or not pista_ids or not horario_ids:
+        return t
+
+    pistas, fechas, horarios = zip(*filas)
+    p = _indices(np.fromiter(pistas, dtype=np.int64, count=len(filas)), pista_ids)
+    h = _indices(np.fromiter(horarios, dtype=np.int64, count=len(filas)), horario_ids)
+    d = (np.array(fechas, dtype="datetime64[D]") - np.datetime64(desde, "D")).astype(np.int64)
+
+    ok = (p >= 0) & (h >= 0) & (d >= 0) & (d < n_dias)
+    t[p[ok], h[ok], d[ok]] = True
+    return t
+
+
+def _pct(a):
+    return np.round(a * 100, 1).tolist()
+
+
+def agregados(t, cat, desde, picos=5):
+    """
+    Ocupación (%) de un tensor pistas × franjas (en orden del catálogo) × días:
+    - pista_franja: matriz pistas × franjas
+    - dia_semana_franja: matriz 7 × franjas (lunes primero)
+    - por_pista, por_franja, por_fecha, por_turno
+    - picos: las celdas día de la semana × franja más ocupadas
+    """
+    n_pistas, n_franjas, n_dias = t.shape
+    if not t.size:
+        return {"ocupacion": 0.0}
+
+    # Día de la semana de cada día del rango → one-hot (días × 7)
+    semana = (np.arange(n_dias) + desde.weekday()) % 7
+    una = np.zeros((n_dias, 7))
+    una[np.arange(n_dias), semana] = 1
+    dias_por_semana = una.sum(axis=0)
+
+    # (franjas × días) @ (días × 7) → reservas por franja y día de la semana
+    por_franja_dia = t.sum(axis=0, dtype=np.int64)
+    semana_franja = (por_franja_dia @ una).T
+    capacidad = (dias_por_semana * n_pistas)[:, None]
+    semana_franja = np.divide(semana_franja, capacidad, out=np.zeros_like(semana_franja), where=capacidad > 0)
+
+    turnos = list(dict.fromkeys(cat.turnos))
+    turno_de = np.array([turnos.index(x) for x in cat.turnos])
+    por_franja = t.mean(axis=(0, 2))
+    por_turno = {
+        turno: round(float(por_franja[turno_de == i].mean()) * 100, 1)
+        for i, turno in enumerate(turnos)
+    }
+
+    orden = np.argsort(semana_franja, axis=None)[::-1][:picos]
+    filas, columnas = np.unravel_index(orden, semana_franja.shape)
+
+    return {
+        "ocupacion": round(float(t.mean()) * 100, 1),
+        "pista_franja": _pct(t.mean(axis=2)),
+        "dia_semana_franja": _pct(semana_franja),
+        "por_pista": _pct(t.mean(axis=(1, 2))),
+        "por_franja": _pct(por_franja),
+        "por_fecha": _pct(t.mean(axis=(0, 1))),
+        "por_turno": por_turno,
+        "picos": [
+            {
+                "dia_semana": DIAS_SEMANA[f],
+                "franja": cat.franjas[c],
+                "ocupacion": round(float(semana_franja[f, c]) * 100, 1),
+            }
+            for f, c in zip(filas.tolist(), columnas.tolist())
+            if semana_franja[f, c] > 0
+        ],
+    }
@@ -0,0 +1,201 @@
+import hashlib
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Response, current_app, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import db
+from .models import ClaveIdempotencia
+
+
+# =========================================================
+# ===============   IDEMPOTENCIA   ========================
+# =========================================================
+# Con la cabecera Idempotency-Key, un reintento de la misma petición
+# (mismo usuario, clave, método, ruta y cuerpo) recibe la respuesta
+# original sin volver a ejecutar el endpoint.
+#
+# - La primera petición inserta la clave "en_curso" (UNIQUE usuario+clave)
+#   antes de ejecutar; un duplicado concurrente choca con esa fila y espera
+#   hasta IDEMPOTENCY_WAIT segundos a que se complete (luego 409).
+# - Las respuestas 2xx/4xx se guardan IDEMPOTENCY_TTL segundos. Las 5xx,
+#   las 409 (franja ocupada o retenida: un conflicto pasajero) y las
+#   excepciones liberan la clave para que el reintento se ejecute.
+# - Misma clave con otra petición: 422.
+# - Si la clave no se puede guardar (el usuario del token ya no existe en
+#   esta BD), se ejecuta el endpoint sin idempotencia y él responde.
+
+CABECERA = "Idempotency-Key"
+MAX_CLAVE = 255
+# Vueltas de _reservar si la clave cambia de manos entre SELECT e INSERT
+REINTENTOS_RESERVA = 3
+
+# Resultados de _reservar además de None (nuestra) o la fila de otra petición
+SIN_CLAVE = "sin_clave"
+OCUPADA = "ocupada"
+
+
+def _huella():
+    h = hashlib.sha256()
+    for parte in (request.method.encode(), request.path.encode(), request.query_string, request.get_data()):
+        h.update(parte)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _filtro(usuario_id, clave):
+    return (ClaveIdempotencia.usuario_id == usuario_id, ClaveIdempotencia.clave == clave)
+
+
+def _reservar(usuario_id, clave, huella):
+    """
+    Intenta quedarse con la clave. Devuelve None si es nuestra (hay que
+    ejecutar), la fila vigente de otra petición con esa clave, SIN_CLAVE
+    si el INSERT falla por otra cosa que la UNIQUE (FK del usuario) u
+    OCUPADA si tras REINTENTOS_RESERVA vueltas sigue en disputa.
+    """
+    for _ in range(REINTENTOS_RESERVA):
+        ahora = datetime.utcnow()
+        fila = db.session.execute(
+            select(ClaveIdempotencia)
+            .where(*_filtro(usuario_id, clave))
+            .execution_options(populate_existing=True)
+        ).scalar_one_or_none()
+
+        if fila is not None:
+            if fila.expira_en > ahora:
+                return fila
+            # Caducada, o la original se abandonó a medias: se puede reutilizar
+            db.session.execute(
+                delete(ClaveIdempotencia).where(ClaveIdempotencia.id == fila.id, ClaveIdempotencia.expira_en <= ahora)
+            )
+
+        try:
+            db.session.execute(
+                insert(ClaveIdempotencia).values(
+                    usuario_id=usuario_id,
+                    clave=clave,
+                    huella=huella,
+                    estado="en_curso",
+                    creada_en=ahora,
+                    expira_en=ahora + timedelta(seconds=current_app.config["IDEMPOTENCY_LOCK_TIMEOUT"]),
+                )
+            )
+            db.session.commit()
+            return None
+        except IntegrityError:
+            db.session.rollback()
+            existe = db.session.execute(
+                select(ClaveIdempotencia.id).where(*_filtro(usuario_id, clave))
+            ).first()
+            if existe is None:
+                # No es la UNIQUE usuario+clave: reintentar no lo arregla
+                return SIN_CLAVE
+            # Otra petición con la misma clave se ha adelantado: se ve en la siguiente vuelta
+    return OCUPADA
+
+
+def _liberar(usuario_id, clave):
+    db.session.rollback()
+    db.session.execute(delete(ClaveIdempotencia).where(*_filtro(usuario_id, clave)))
+    db.session.commit()
+
+
+def _guardar(usuario_id, clave, respuesta):
+    # Lo que el endpoint no confirmó no se confirma aquí
+    db.session.rollback()
+    db.session.execute(
+        update(ClaveIdempotencia)
+        .where(*_filtro(usuario_id, clave))
+        .values(
+            estado="completada",
+            status=respuesta.status_code,
+            content_type=respuesta.content_type,
+            respuesta=respuesta.get_data(),
+            expira_en=datetime.utcnow() + timedelta(seconds=current_app.config["IDEMPOTENCY_TTL"]),
+        )
+    )
+    db.session.commit()
+
+
+def _en_curso():
+    r = jsonify({"error": "Hay una petición con esta Idempotency-Key en curso"})
+    r.status_code = 409
+    r.headers["Retry-After"] = "1"
+    return r
+
+
+def _repetir(fila):
+    r = Response(fila.respuesta, status=fila.status, content_type=fila.content_type)
+    r.headers["Idempotent-Replayed"] = "true"
+    return r
+
+
+def idempotente(fn):
+    """
+    Decorador para endpoints de escritura autenticados. Va justo debajo
+    de la ruta (por encima de los decoradores de permisos), para que el
+    reintento de un DELETE ya hecho reciba la respuesta original y no un 404.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        clave = request.headers.get(CABECERA)
+        if not clave:
+            return fn(*args, **kwargs)
+        if len(clave) > MAX_CLAVE:
+            return jsonify({"error": f"{CABECERA} admite como máximo {MAX_CLAVE} caracteres"}), 400
+
+        verify_jwt_in_request(optional=True)
+        identidad = get_jwt_identity()
+        if identidad is None:
+            # Sin usuario no hay ámbito para la clave; el endpoint responderá 401
+            return fn(*args, **kwargs)
+
+        usuario_id = int(identidad)
+        huella = _huella()
+        limite = time.monotonic() + current_app.config["IDEMPOTENCY_WAIT"]
+
+        while True:
+            fila = _reservar(usuario_id, clave, huella)
+            if fila is None:
+                break
+            if fila == SIN_CLAVE:
+                return fn(*args, **kwargs)
+            if fila == OCUPADA:
+                return _en_curso()
+            if fila.huella != huella:
+                return jsonify({"error": f"{CABECERA} ya se usó con otra petición"}), 422
+            if fila.estado == "completada":
+                return _repetir(fila)
+            if time.monotonic() >= limite:
+                return _en_curso()
+            # La original sigue ejecutándose
+            db.session.rollback()
+            time.sleep(0.05)
+
+        try:
+            respuesta = make_response(fn(*args, **kwargs))
+        except Exception:
+            _liberar(usuario_id, clave)
+            raise
+
+        if respuesta.status_code >= 500 or respuesta.status_code == 409 or respuesta.is_streamed:
+            _liberar(usuario_id, clave)
+        else:
+            _guardar(usuario_id, clave, respuesta)
+        return respuesta
+
+    return wrapper
+
+
+def purgar():
+    """Borra las claves caducadas. Devuelve cuántas."""
+    borradas = db.session.execute(
+        delete(ClaveIdempotencia).where(ClaveIdempotencia.expira_en <= datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    return borradas
@@ -0,0 +1,76 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # en requirements.txt; sin él (entornos de desarrollo) se usa el json de la stdlib
+    orjson = None
+
+
+def formato_dinero(valor: Decimal) -> str:
+    """
+    Formato único para importes: str(valor), el mismo que devolvían los
+    handlers con str(precio) y el provider por defecto de Flask. Los
+    importes de la BD (Numeric(10, 2)) salen con dos decimales ("12.00");
+    los totales calculados conservan su escala (un total vacío es "0").
+    """
+    return str(valor)
+
+
+def _default(obj):
+    """Tipos que ni orjson ni json saben serializar por sí solos."""
+    if isinstance(obj, Decimal):
+        return formato_dinero(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return DefaultJSONProvider.default(obj)
+
+
+class PadelJSONProvider(DefaultJSONProvider):
+    """
+    Provider JSON de la aplicación.
+    - Usa orjson si está instalado (mucho más rápido en listados grandes).
+    - Decimal → str ("12.00"), date/datetime → ISO 8601, igual que antes
+      hacían los handlers a mano, así que el formato de respuesta no cambia.
+    """
+
+    default = staticmethod(_default)
+
+    if orjson is not None:
+        _opciones = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+    def _usa_orjson(self, kwargs) -> bool:
+        # orjson siempre genera salida compacta: si se pide indentación u
+        # otras opciones de json.dumps (modo debug) se usa la stdlib.
+        return orjson is not None and set(kwargs) <= {"separators"}
+
+    def dumps_bytes(self, obj, **kwargs) -> bytes:
+        if self._usa_orjson(kwargs):
+            return orjson.dumps(obj, default=self.default, option=self._opciones)
+        return self.dumps(obj, **kwargs).encode("utf-8")
+
+    def dumps(self, obj, **kwargs) -> str:
+        if self._usa_orjson(kwargs):
+            return self.dumps_bytes(obj).decode("utf-8")
+        kwargs.setdefault("default", self.default)
+        kwargs.setdefault("ensure_ascii", self.ensure_ascii)
+        kwargs.setdefault("sort_keys", self.sort_keys)
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            body = self.dumps_bytes(obj, indent=2)
+        else:
+            body = self.dumps_bytes(obj, separators=(",", ":"))
+
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
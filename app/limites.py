@@ -0,0 +1,303 @@
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+try:
+    import fcntl
+except ImportError:  # Windows: el almacén compartido sólo excluye entre hilos
+    fcntl = None
+
+
+# =========================================================
+# ===============   LÍMITES DE PETICIONES   ===============
+# =========================================================
+# Dos defensas antes de que la petición llegue al endpoint:
+#
+# 1. Cubo de fichas por (endpoint, usuario del JWT o IP), con el
+#    presupuesto de RATE_LIMITS: capacidad (ráfaga) y fichas por segundo.
+#    Sin fichas → 429 con Retry-After.
+# 2. Descarte por sobrecarga: con RATE_LIMIT_SHED_EN_CURSO o más peticiones
+#    en curso se rechazan las LECTURAS (429, Retry-After: 1); las escrituras
+#    (crear/cancelar reservas...) siguen entrando.
+#
+# Los cubos viven en memoria del proceso o, con RATE_LIMIT_BACKEND =
+# "compartido", en un fichero mapeado que comparten todos los workers
+# (y entonces el recuento de peticiones en curso también es global).
+
+
+class AlmacenMemoria:
+    """
+    Cubos en un dict del proceso, sin cerrojos: cada cubo es una tupla que
+    se sustituye entera. Dos hilos del mismo usuario a la vez pueden
+    colar alguna ficha de más; a cambio, nadie espera a nadie. Sólo la
+    poda (rara) va con cerrojo.
+    """
+
+    def __init__(self, max_cubos=100_000):
+        self.max_cubos = max_cubos
+        # Tras podar quedan como mucho estos: la siguiente poda tarda en llegar
+        self.min_cubos = max_cubos * 3 // 4
+        self._cubos = {}
+        self._en_curso = 0
+        self._lock = threading.Lock()
+        self._podando = threading.Lock()
+
+    def tomar(self, clave, capacidad, recarga, ahora):
+        """Gasta una ficha. Devuelve 0 si había, o los segundos hasta la siguiente."""
+        fichas, ts = self._cubos.get(clave, (capacidad, ahora))
+        fichas = min(capacidad, fichas + (ahora - ts) * recarga)
+        if fichas >= 1:
+            self._cubos[clave] = (fichas - 1, ahora)
+            espera = 0.0
+        else:
+            self._cubos[clave] = (fichas, ahora)
+            espera = (1 - fichas) / recarga
+        if len(self._cubos) > self.max_cubos:
+            self._podar(ahora)
+        return espera
+
+    def _podar(self, ahora):
+        if not self._podando.acquire(blocking=False):
+            return  # ya poda otro hilo
+        try:
+            if len(self._cubos) <= self.max_cubos:
+                return
+            # Copia: otros hilos siguen insertando mientras se recorre
+            cubos = list(self._cubos.items())
+            # Un cubo sin uso en la última hora ya estaría lleno: sobra
+            vivos = [(c, v) for c, v in cubos if ahora - v[1] < 3600]
+            if len(vivos) > self.min_cubos:
+                # Demasiados en uso: fuera los más antiguos hasta min_cubos
+                vivos.sort(key=lambda cv: cv[1][1])
+                vivos = vivos[len(vivos) - self.min_cubos:]
+            self._cubos = dict(vivos)
+        finally:
+            self._podando.release()
+
+    def entrar(self):
+        with self._lock:
+            self._en_curso += 1
+            return self._en_curso
+
+    def salir(self):
+        with self._lock:
+            self._en_curso -= 1
+
+
+class AlmacenCompartido:
+    """
+    Cubos en un fichero mapeado en memoria (tabla hash de tamaño fijo)
+    para que el límite sea por usuario y no por usuario y worker.
+
+    cabecera: magic (8) | WORKERS × (pid i64, peticiones en curso i64)
+    huecos:   hash de la clave u64 | fichas f64 | último acceso f64
+
+    Cada worker cuenta sus peticiones en curso en su propia entrada; si
+    un worker muere a mitad de petición, el que reutiliza su entrada
+    descarta su cuenta en vez de arrastrarla para siempre.
+    """
+
+    MAGIC = b"PADLRAT1"
+    WORKERS = 64
+    WORKER = struct.Struct("<qq")
+    CABECERA_SIZE = 8 + WORKERS * 16
+    HUECO = struct.Struct("<Qdd")
+    SONDEOS = 8
+
+    def __init__(self, ruta, huecos):
+        self.ruta = ruta
+        self.huecos = huecos
+        self.tamano = self.CABECERA_SIZE + huecos * self.HUECO.size
+        self._pid = None
+        self._abrir()
+
+    def _abrir(self):
+        fd = os.open(self.ruta, os.O_RDWR | os.O_CREAT, 0o600)
+        self._fd = fd
+        self._lock = threading.Lock()
+        with self._exclusivo():
+            if os.fstat(fd).st_size != self.tamano:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.tamano)
+            self._mm = mmap.mmap(fd, self.tamano)
+            if self._mm[:8] != self.MAGIC:
+                self._mm[:self.CABECERA_SIZE] = self.MAGIC + bytes(self.CABECERA_SIZE - 8)
+            self._pid = os.getpid()
+            self._worker = self._reclamar_entrada()
+
+    def _reclamar_entrada(self):
+        """Entrada de este proceso en la cabecera (None si no quedan libres)."""
+        propia = None
+        for i in range(self.WORKERS):
+            pid, _ = self.WORKER.unpack_from(self._mm, 8 + i * 16)
+            if pid and pid != self._pid and _vivo(pid):
+                continue
+            # Libre, de un proceso muerto o ya nuestra: su cuenta no vale
+            self.WORKER.pack_into(self._mm, 8 + i * 16, 0, 0)
+            if propia is None:
+                propia = i
+        if propia is not None:
+            self.WORKER.pack_into(self._mm, 8 + propia * 16, self._pid, 0)
+        return propia
+
+    def _comprobar_proceso(self):
+        # flock va por descriptor: tras un fork cada worker abre el suyo
+        if self._pid != os.getpid():
+            self._mm.close()
+            os.close(self._fd)
+            self._abrir()
+
+    class _Exclusivo:
+        def __init__(self, almacen):
+            self.a = almacen
+
+        def __enter__(self):
+            self.a._lock.acquire()
+            if fcntl is not None:
+                fcntl.flock(self.a._fd, fcntl.LOCK_EX)
+
+        def __exit__(self, *exc):
+            if fcntl is not None:
+                fcntl.flock(self.a._fd, fcntl.LOCK_UN)
+            self.a._lock.release()
+
+    def _exclusivo(self):
+        return self._Exclusivo(self)
+
+    def _offset(self, i):
+        return self.CABECERA_SIZE + i * self.HUECO.size
+
+    def tomar(self, clave, capacidad, recarga, ahora):
+        self._comprobar_proceso()
+        h = _hash_clave(clave)
+        with self._exclusivo():
+            # Sondeo lineal; si todo está ocupado se reutiliza el más antiguo
+            libre = viejo = None
+            for n in range(self.SONDEOS):
+                i = (h + n) % self.huecos
+                hh, fichas, ts = self.HUECO.unpack_from(self._mm, self._offset(i))
+                if hh == h:
+                    break
+                if hh == 0 and libre is None:
+                    libre = i
+                if viejo is None or ts < viejo[1]:
+                    viejo = (i, ts)
+            else:
+                i = libre if libre is not None else viejo[0]
+                fichas, ts = capacidad, ahora
+
+            fichas = min(capacidad, fichas + (ahora - ts) * recarga)
+            if fichas >= 1:
+                fichas -= 1
+                espera = 0.0
+            else:
+                espera = (1 - fichas) / recarga
+            self.HUECO.pack_into(self._mm, self._offset(i), h, fichas, ahora)
+            return espera
+
+    def _sumar_en_curso(self, n):
+        self._comprobar_proceso()
+        with self._exclusivo():
+            if self._worker is not None:
+                offset = 8 + self._worker * 16 + 8
+                struct.pack_into("<q", self._mm, offset, max(struct.unpack_from("<q", self._mm, offset)[0] + n, 0))
+            return sum(
+                self.WORKER.unpack_from(self._mm, 8 + i * 16)[1] for i in range(self.WORKERS)
+            )
+
+    def entrar(self):
+        return self._sumar_en_curso(1)
+
+    def salir(self):
+        self._sumar_en_curso(-1)
+
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _hash_clave(clave):
+    # hash() de str cambia entre procesos (PYTHONHASHSEED); éste no
+    return int.from_bytes(hashlib.blake2b(clave.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+
+def _almacen(app):
+    a = app.extensions.get("limites")
+    if a is None:
+        cfg = app.config
+        if cfg["RATE_LIMIT_BACKEND"] == "compartido":
+            a = AlmacenCompartido(cfg["RATE_LIMIT_PATH"], cfg["RATE_LIMIT_HUECOS"])
+        else:
+            a = AlmacenMemoria()
+        app.extensions["limites"] = a
+    return a
+
+
+def _identidad():
+    """Usuario del JWT (verificado) o, sin JWT válido, la IP."""
+    try:
+        verify_jwt_in_request(optional=True)
+        identidad = get_jwt_identity()
+    except Exception:
+        # El endpoint ya responderá 401/422; aquí cuenta como anónimo
+        identidad = None
+    if identidad is None:
+        return f"ip:{request.remote_addr}"
+    # Los ids de usuario se repiten entre clubs (cada uno con su BD)
+    club = g.get("club")
+    return f"u:{club}:{identidad}" if club is not None else f"u:{identidad}"
+
+
+def _es_lectura():
+    return request.method in ("GET", "HEAD") or request.endpoint in current_app.config["RATE_LIMIT_LECTURAS"]
+
+
+def _rechazar(mensaje, espera):
+    r = jsonify({"error": mensaje})
+    r.status_code = 429
+    r.headers["Retry-After"] = str(max(1, math.ceil(espera)))
+    return r
+
+
+def init_limites(app):
+    if not app.config["RATE_LIMIT_ENABLED"]:
+        return
+
+    @app.before_request
+    def _admitir():
+        if request.method == "OPTIONS" or request.endpoint is None:
+            return None
+        almacen = _almacen(app)
+
+        en_curso = almacen.entrar()
+        g._limites_en_curso = True
+        umbral = app.config["RATE_LIMIT_SHED_EN_CURSO"]
+        if umbral and en_curso > umbral and _es_lectura():
+            return _rechazar("Servidor saturado, reintenta en un momento", 1)
+
+        presupuesto = app.config["RATE_LIMITS"].get(request.endpoint)
+        if presupuesto:
+            capacidad, recarga = presupuesto
+            clave = f"{request.endpoint}|{_identidad()}"
+            espera = almacen.tomar(clave, capacidad, recarga, time.time())
+            if espera:
+                return _rechazar("Demasiadas peticiones", espera)
+        return None
+
+    @app.teardown_request
+    def _liberar(exc):
+        if g.pop("_limites_en_curso", False):
+            _almacen(app).salir()
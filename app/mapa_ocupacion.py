@@ -0,0 +1,286 @@
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: sólo hay exclusión entre hilos del mismo proceso
+    fcntl = None
+
+
+# =========================================================
+# ===============   MAPA DE OCUPACIÓN COMPARTIDO   ========
+# =========================================================
+# Fichero mapeado en memoria que comparten todos los workers:
+#
+#   cabecera (64 bytes)
+#     magic "PADLOCC2" | versión de catálogo (16) | pistas u32 | días u32 | seq u64
+#     | cambio u64 (último id de cambios_ocupacion aplicado)
+#   entradas: pistas × días, 16 bytes cada una
+#     ordinal de la fecha u64 (0 = vacía) | máscara de franjas u64
+#
+# La entrada de (pista_id, fecha) está en [pista_id][fecha.toordinal() % días];
+# el ordinal guardado dice si la entrada corresponde a esa fecha.
+#
+# Concurrencia:
+# - Escritores: flock sobre el fichero (entre procesos) + Lock (entre hilos).
+# - Lectores sin bloqueo, con seqlock: `seq` es impar mientras se escribe;
+#   si cambia durante la lectura, se repite.
+# - Rellenar una entrada desde la BD sólo se acepta si `seq` no ha cambiado
+#   desde antes de la consulta: así una reserva confirmada entre medias no
+#   queda tapada por datos viejos.
+#
+# El fichero sobrevive a los reinicios: los workers nuevos sirven desde
+# la primera petición con lo que ya había, después de invalidar lo que
+# cambió en la BD desde `cambio` (ver ocupacion.sincronizar_mapa).
+
+MAGIC = b"PADLOCC2"
+CABECERA = struct.Struct("<8s16sIIQQ")
+TAM_CABECERA = 64
+OFFSET_SEQ = 8 + 16 + 4 + 4
+OFFSET_CAMBIO = OFFSET_SEQ + 8
+ENTRADA = struct.Struct("<QQ")
+MAX_FRANJAS = 64
+# Reintentos de una lectura con seq impar antes de comprobar si el
+# escritor sigue vivo (y, si no se consigue leer, ir a la BD)
+REINTENTOS_LECTURA = 100
+
+
+def _clave(version):
+    return version.encode("ascii").ljust(16, b"\0")
+
+
+class MapaOcupacion:
+    def __init__(self, ruta, pistas, dias):
+        self.ruta = ruta
+        self.pistas = pistas
+        self.dias = dias
+        self.tamano = TAM_CABECERA + pistas * dias * ENTRADA.size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._abrir()
+
+    # ---------- fichero ----------
+
+    def _abrir(self):
+        """(Re)abre el fichero. Tras un fork hay que reabrir: flock va por descriptor."""
+        fd = os.open(self.ruta, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size != self.tamano:
+                self._bloquear(fd)
+                try:
+                    if os.fstat(fd).st_size != self.tamano:
+                        os.ftruncate(fd, 0)
+                        os.ftruncate(fd, self.tamano)
+                finally:
+                    self._desbloquear(fd)
+            mm = mmap.mmap(fd, self.tamano)
+        except Exception:
+            os.close(fd)
+            raise
+        self._fd = fd
+        self._mm = mm
+        self._pid = os.getpid()
+
+        magic, _, pistas, dias, seq, _ = CABECERA.unpack_from(self._mm, 0)
+        if magic != MAGIC or pistas != self.pistas or dias != self.dias:
+            with self._escritura():
+                self._reiniciar(b"", cambio=0)
+        elif seq & 1:
+            self._reparar()
+
+    def _reparar(self):
+        """
+        Un escritor murió a medias (o la máquina se apagó): si al tomar el
+        cerrojo el seq sigue impar, nadie está escribiendo y el contenido
+        no es fiable, así que se vacía. Con un escritor vivo, espera a que
+        termine.
+        """
+        with self._lock:
+            self._bloquear(self._fd)
+            try:
+                if self._seq() & 1:
+                    self._poner_seq(self._seq() + 1)
+                    self._reiniciar(self._mm[8:24], cambio=0)
+            finally:
+                self._desbloquear(self._fd)
+
+    def _comprobar_proceso(self):
+        if self._pid != os.getpid():
+            # Proceso hijo: el descriptor heredado comparte el flock con el
+            # padre, así que se cierra (sólo en el hijo) y se abre uno propio.
+            self._mm.close()
+            os.close(self._fd)
+            self._lock = threading.Lock()
+            self._abrir()
+
+    @staticmethod
+    def _bloquear(fd):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+    @staticmethod
+    def _desbloquear(fd):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    # ---------- seqlock ----------
+
+    def _seq(self):
+        return struct.unpack_from("<Q", self._mm, OFFSET_SEQ)[0]
+
+    def _poner_seq(self, valor):
+        struct.pack_into("<Q", self._mm, OFFSET_SEQ, valor)
+
+    class _Escritura:
+        def __init__(self, mapa):
+            self.mapa = mapa
+
+        def __enter__(self):
+            m = self.mapa
+            m._lock.acquire()
+            m._bloquear(m._fd)
+            m._poner_seq(m._seq() + 1)  # impar: escritura en curso
+            return m
+
+        def __exit__(self, *exc):
+            m = self.mapa
+            m._poner_seq(m._seq() + 1)
+            m._desbloquear(m._fd)
+            m._lock.release()
+
+    def _escritura(self):
+        return self._Escritura(self)
+
+    def _reiniciar(self, version, cambio=None):
+        """Vacía todas las entradas (llamar dentro de _escritura)."""
+        if cambio is None:
+            cambio = self._cambio()
+        self._mm[TAM_CABECERA:] = bytes(self.tamano - TAM_CABECERA)
+        CABECERA.pack_into(self._mm, 0, MAGIC, version, self.pistas, self.dias, self._seq(), cambio)
+
+    def _cambio(self):
+        return struct.unpack_from("<Q", self._mm, OFFSET_CAMBIO)[0]
+
+    # ---------- API ----------
+
+    def _offset(self, pista_id, ordinal):
+        return TAM_CABECERA + (pista_id * self.dias + ordinal % self.dias) * ENTRADA.size
+
+    def admite(self, pista_id):
+        return 0 <= pista_id < self.pistas
+
+    def version(self):
+        self._comprobar_proceso()
+        return CABECERA.unpack_from(self._mm, 0)[1].rstrip(b"\0").decode("ascii")
+
+    def asegurar_version(self, version):
+        """Si el catálogo cambió, el mapa entero deja de valer."""
+        if self.version() != version:
+            with self._escritura():
+                self._reiniciar(_clave(version))
+
+    def leer(self, pista_id, fecha, version):
+        """
+        Devuelve (máscara o None si no está cargada, seq) sin bloquear.
+        Si el mapa es de otra versión del catálogo, None. El seq sirve
+        para `guardar` si hubo que ir a la BD.
+
+        Si la escritura en curso no termina (escritor muerto a medias) se
+        repara el mapa; si aun así no se puede leer, (None, None): se va a
+        la BD y no se guarda lo leído.
+        """
+        self._comprobar_proceso()
+        ordinal = fecha.toordinal()
+        offset = self._offset(pista_id, ordinal)
+        clave = _clave(version)
+        for intento in range(2 * REINTENTOS_LECTURA):
+            s1 = self._seq()
+            if s1 & 1:
+                if intento == REINTENTOS_LECTURA - 1:
+                    self._reparar()
+                continue
+            vigente = self._mm[8:24] == clave
+            guardado, mascara = ENTRADA.unpack_from(self._mm, offset)
+            if self._seq() == s1:
+                return (mascara if vigente and guardado == ordinal else None), s1
+        return None, None
+
+    def guardar(self, entradas, seq_previo, version):
+        """
+        Guarda máscaras leídas de la BD, [(pista_id, fecha, máscara), ...],
+        sólo si nadie ha escrito en el mapa desde seq_previo.
+        """
+        self._comprobar_proceso()
+        with self._lock:
+            self._bloquear(self._fd)
+            try:
+                if self._seq() != seq_previo or self._mm[8:24] != _clave(version):
+                    return False
+                self._poner_seq(seq_previo + 1)
+                for pista_id, fecha, mascara in entradas:
+                    ordinal = fecha.toordinal()
+                    ENTRADA.pack_into(self._mm, self._offset(pista_id, ordinal), ordinal, mascara)
+                self._poner_seq(seq_previo + 2)
+                return True
+            finally:
+                self._desbloquear(self._fd)
+
+    def actualizar(self, pista_id, fecha, mascara, ocupar, version):
+        """
+        Marca (ocupar=True) o libera franjas tras un commit. Si la entrada
+        no está cargada no se toca, pero el seq avanza igualmente para
+        invalidar cualquier relleno en curso. Si el mapa es de otra versión
+        del catálogo la máscara no se puede traducir y se vacía entero.
+        """
+        self._comprobar_proceso()
+        ordinal = fecha.toordinal()
+        offset = self._offset(pista_id, ordinal)
+        with self._escritura():
+            if self._mm[8:24] != _clave(version):
+                self._reiniciar(self._mm[8:24])
+                return
+            guardado, actual = ENTRADA.unpack_from(self._mm, offset)
+            if guardado == ordinal:
+                nueva = (actual | mascara) if ocupar else (actual & ~mascara)
+                ENTRADA.pack_into(self._mm, offset, ordinal, nueva)
+
+    def cambio(self):
+        """Último id de cambios_ocupacion reflejado en el mapa."""
+        self._comprobar_proceso()
+        return self._cambio()
+
+    def aplicar_cambios(self, desde, hasta, entradas, todo=False):
+        """
+        Invalida las entradas [(pista_id, fecha), ...] cambiadas en la BD
+        (o el mapa entero si todo=True) y anota `hasta` como último cambio
+        aplicado. Sólo si el mapa sigue en `desde`: si otro worker ya se
+        puso al día, no se repite. Devuelve si se aplicó.
+        """
+        self._comprobar_proceso()
+        with self._escritura():
+            if self._cambio() != desde:
+                return False
+            if todo:
+                self._reiniciar(self._mm[8:24], cambio=hasta)
+                return True
+            for pista_id, fecha in entradas:
+                if self.admite(pista_id):
+                    ordinal = fecha.toordinal()
+                    offset = self._offset(pista_id, ordinal)
+                    if ENTRADA.unpack_from(self._mm, offset)[0] == ordinal:
+                        ENTRADA.pack_into(self._mm, offset, 0, 0)
+            struct.pack_into("<Q", self._mm, OFFSET_CAMBIO, hasta)
+            return True
+
+    def cerrar(self):
+        """Vuelca el mapa a disco (parada ordenada)."""
+        if self._pid == os.getpid() and not self._mm.closed:
+            self._mm.flush()
+
+    def invalidar_todo(self):
+        """Para borrados masivos: se vacía el mapa y se rellena bajo demanda."""
+        self._comprobar_proceso()
+        with self._escritura():
+            self._reiniciar(CABECERA.unpack_from(self._mm, 0)[1])
@@ -5,7 +5,34 @@ from sqlalchemy import (
     UniqueConstraint,
     ForeignKey,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
+
+
+def minutos(hh_mm: str) -> int:
+    """'18:30' → 1110 (minutos desde medianoche). Lanza ValueError si no es válida."""
+    horas, mins = hh_mm.strip().split(":")
+    horas, mins = int(horas), int(mins)
+    if not (0 <= horas <= 24 and 0 <= mins < 60) or (horas == 24 and mins):
+        raise ValueError(f"Hora inválida: {hh_mm}")
+    return horas * 60 + mins
+
+
+def parse_franja(franja: str) -> tuple[int, int]:
+    """
+    '08:00-08:30' → (480, 510).
+    Una franja que termina a medianoche ('23:30-00:00') acaba en 1440.
+    """
+    try:
+        inicio, fin = (minutos(p) for p in franja.split("-"))
+    except ValueError:
+        raise ValueError(f"Formato de franja inválido: {franja!r}. Usa HH:MM-HH:MM")
+    if fin == 0:
+        fin = 24 * 60
+    if fin <= inicio:
+        raise ValueError(f"La franja {franja!r} termina antes de empezar")
+    return inicio, fin
+
+
 class Rol(db.Model):
     __tablename__ = "roles"
 
@@ -72,10 +99,20 @@ class Horario(db.Model):
     franja = db.Column(db.String(50), nullable=False)  # ej: "09:00-10:30"
     turno = db.Column(db.String(50), nullable=False)   # ej: "mañana", "tarde", "noche"
 
+    # Franja en minutos desde medianoche (se rellenan al asignar franja)
+    inicio_min = db.Column(db.Integer, nullable=False, index=True)
+    fin_min = db.Column(db.Integer, nullable=False, index=True)
+
     __table_args__ = (
         UniqueConstraint("franja", "turno", name="uq_horarios_franja_turno"),
+        CheckConstraint("fin_min > inicio_min", name="ck_horarios_fin_gt_inicio"),
     )
 
+    @validates("franja")
+    def _sincronizar_minutos(self, key, franja):
+        self.inicio_min, self.fin_min = parse_franja(franja)
+        return franja
+
     # Relaciones
     horarios_reserva = relationship(
         "HorarioReserva",
@@ -124,6 +161,14 @@ class Reserva(db.Model):
 
     fecha = db.Column(db.Date, nullable=False, index=True)
 
+    __table_args__ = (
+        # Consultas por pista y rango de fechas (disponibilidad, cancelaciones)
+        db.Index("ix_reservas_pista_fecha", "pista_id", "fecha"),
+        # AUTOINCREMENT: los ids no se reutilizan aunque se archiven las últimas
+        # reservas, así nunca chocan con los de reservas_archivo.
+        {"sqlite_autoincrement": True},
+    )
+
     # Relaciones
     usuario = relationship("Usuario", back_populates="reservas")
     pista = relationship("Pista", back_populates="reservas")
@@ -158,12 +203,20 @@ class HorarioReserva(db.Model):
         index=True,
     )
 
+    # Copia de la pista y fecha de la reserva: con ellas la BD garantiza que
+    # una franja de una pista y día sólo se reserva una vez, aunque dos
+    # peticiones pasen a la vez la comprobación de disponibilidad.
+    pista_id = db.Column(db.Integer, nullable=False)
+    fecha = db.Column(db.Date, nullable=False)
+
     precio = db.Column(db.Numeric(10, 2), nullable=False)
 
     __table_args__ = (
         CheckConstraint("precio >= 0", name="ck_horarios_reserva_precio_ge_0"),
         # Evita duplicar el mismo horario dentro de la misma reserva
         UniqueConstraint("reserva_id", "horario_id", name="uq_horarios_reserva_reserva_horario"),
+        UniqueConstraint("pista_id", "fecha", "horario_id", name="uq_horarios_reserva_pista_fecha_horario"),
+        {"sqlite_autoincrement": True},
     )
 
     # Relaciones
@@ -171,4 +224,294 @@ class HorarioReserva(db.Model):
     horario = relationship("Horario", back_populates="horarios_reserva")
 
     def __repr__(self) -> str:
-        return f"<HorarioReserva {self.id} reserva={self.reserva_id} horario={self.horario_id} precio={self.precio}>"
\ No newline at end of file
+        return f"<HorarioReserva {self.id} reserva={self.reserva_id} horario={self.horario_id} precio={self.precio}>"
+
+class ReservaDiaria(db.Model):
+    """
+    Rollup diario de reservas por pista y turno.
+    Se mantiene en la misma transacción que crea/cancela reservas
+    (ver app/rollups.py) y se puede reconstruir con `flask rollups reconstruir`.
+    """
+    __tablename__ = "reservas_diarias"
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    pista_id = db.Column(
+        db.Integer,
+        ForeignKey("pistas.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+
+    fecha = db.Column(db.Date, nullable=False, index=True)
+    turno = db.Column(db.String(50), nullable=False)
+
+    slots = db.Column(db.Integer, nullable=False, default=0)
+    ingresos = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("pista_id", "fecha", "turno", name="uq_reservas_diarias_pista_fecha_turno"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<ReservaDiaria pista={self.pista_id} fecha={self.fecha} turno={self.turno} slots={self.slots}>"
+
+
+# =========================================================
+# Archivo histórico (reservas pasadas fuera de las tablas vivas)
+# =========================================================
+# Mismas columnas e ids que reservas / horarios_reserva. Las mueve
+# `flask reservas archivar` (ver app/archivo.py); sólo se consultan
+# cuando se pide un rango histórico.
+
+class ReservaArchivada(db.Model):
+    __tablename__ = "reservas_archivo"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    usuario_id = db.Column(
+        db.Integer,
+        ForeignKey("usuarios.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+
+    pista_id = db.Column(
+        db.Integer,
+        ForeignKey("pistas.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+
+    fecha = db.Column(db.Date, nullable=False, index=True)
+
+    # Relaciones (sólo lectura desde este lado)
+    usuario = relationship("Usuario")
+    pista = relationship("Pista")
+
+    horarios = relationship(
+        "HorarioReservaArchivado",
+        back_populates="reserva",
+        cascade="all,delete-orphan",
+        passive_deletes=True,
+    )
+
+    def __repr__(self) -> str:
+        return f"<ReservaArchivada {self.id} user={self.usuario_id} pista={self.pista_id} fecha={self.fecha}>"
+
+
+class HorarioReservaArchivado(db.Model):
+    __tablename__ = "horarios_reserva_archivo"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    reserva_id = db.Column(
+        db.Integer,
+        ForeignKey("reservas_archivo.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+
+    horario_id = db.Column(
+        db.Integer,
+        ForeignKey("horarios.id", ondelete="RESTRICT"),
+        nullable=False,
+        index=True,
+    )
+
+    precio = db.Column(db.Numeric(10, 2), nullable=False)
+
+    # Relaciones
+    reserva = relationship("ReservaArchivada", back_populates="horarios")
+    horario = relationship("Horario")
+
+    def __repr__(self) -> str:
+        return f"<HorarioReservaArchivado {self.id} reserva={self.reserva_id} horario={self.horario_id}>"
+
+
+# =========================================================
+# Tareas en segundo plano (outbox)
+# =========================================================
+# Se insertan en la misma transacción que la escritura que las origina y
+# se ejecutan después del commit (ver app/tareas.py). Si el proceso cae
+# antes de ejecutarlas, el barrido periódico las recoge.
+
+class TareaPendiente(db.Model):
+    __tablename__ = "tareas_pendientes"
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+
+    # pendiente | en_curso | fallida
+    estado = db.Column(db.String(20), nullable=False, default="pendiente")
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    # Cuándo se puede (re)intentar; en_curso: fin del plazo del que la ejecuta
+    disponible_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    creada_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    ultimo_error = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_tareas_pendientes_estado_disponible", "estado", "disponible_en"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<TareaPendiente {self.id} {self.tipo} {self.estado} intentos={self.intentos}>"
+
+
+# =========================================================
+# Claves de idempotencia (cabecera Idempotency-Key)
+# =========================================================
+# Una fila por (usuario, clave): huella de la petición original y su
+# respuesta, para devolverla tal cual en los reintentos (ver
+# app/idempotencia.py). Mientras la original se ejecuta, estado =
+# "en_curso" y expira_en es el plazo para darla por abandonada.
+
+class ClaveIdempotencia(db.Model):
+    __tablename__ = "idempotency_keys"
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    usuario_id = db.Column(
+        db.Integer,
+        ForeignKey("usuarios.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    clave = db.Column(db.String(255), nullable=False)
+    huella = db.Column(db.String(64), nullable=False)
+
+    # en_curso | completada
+    estado = db.Column(db.String(20), nullable=False, default="en_curso")
+    status = db.Column(db.Integer, nullable=True)
+    content_type = db.Column(db.String(100), nullable=True)
+    respuesta = db.Column(db.LargeBinary, nullable=True)
+
+    creada_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expira_en = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        UniqueConstraint("usuario_id", "clave", name="uq_idempotency_keys_usuario_clave"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<ClaveIdempotencia {self.usuario_id} {self.clave} {self.estado}>"
+
+
+# =========================================================
+# Refresh tokens (rotación y detección de reutilización)
+# =========================================================
+# Cada refresh token emitido tiene una fila. Al usarlo en /auth/refresh
+# se marca usado y se emite otro de la misma familia; si llega uno ya
+# usado, alguien lo ha copiado y se revoca la familia entera.
+
+class RefreshToken(db.Model):
+    __tablename__ = "refresh_tokens"
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), nullable=False, unique=True, index=True)
+    familia = db.Column(db.String(36), nullable=False, index=True)
+
+    usuario_id = db.Column(
+        db.Integer,
+        ForeignKey("usuarios.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+
+    creada_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expira_en = db.Column(db.DateTime, nullable=False, index=True)
+    usada_en = db.Column(db.DateTime, nullable=True)
+    revocada = db.Column(db.Boolean, nullable=False, default=False)
+
+    def __repr__(self) -> str:
+        return f"<RefreshToken {self.jti} user={self.usuario_id} familia={self.familia}>"
+
+
+# =========================================================
+# Tokens revocados (blocklist de JWT)
+# =========================================================
+# tipo / valor:
+#   "jti"     → un token concreto
+#   "familia" → todos los tokens de una sesión (claim "fam")
+#   "usuario" → todos los tokens del usuario emitidos hasta revocado_en
+# Cada worker mantiene una copia en memoria (app/revocacion.py) y lee
+# sólo las filas nuevas por id; por eso AUTOINCREMENT: un id nunca se
+# reutiliza aunque se purguen las filas caducadas.
+
+class TokenRevocado(db.Model):
+    __tablename__ = "tokens_revocados"
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(10), nullable=False)
+    valor = db.Column(db.String(64), nullable=False)
+    revocado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    expira_en = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = ({"sqlite_autoincrement": True},)
+
+    def __repr__(self) -> str:
+        return f"<TokenRevocado {self.tipo}={self.valor}>"
+
+
+# =========================================================
+# Cambios de ocupación (secuencia para el mapa compartido)
+# =========================================================
+# Cada escritura que cambia la ocupación añade una fila en su misma
+# transacción: (pista_id, fecha) concretos, o ambos NULL si afecta a
+# todo (borrado de pista o usuario, archivo...). El mapa en disco
+# guarda el último id aplicado; al arrancar (y cada OCCUPANCY_SYNC
+# segundos) se invalida sólo lo cambiado desde entonces.
+# AUTOINCREMENT para que un id nunca se reutilice tras purgar.
+
+class CambioOcupacion(db.Model):
+    __tablename__ = "cambios_ocupacion"
+
+    id = db.Column(db.Integer, primary_key=True)
+    pista_id = db.Column(db.Integer, nullable=True)
+    fecha = db.Column(db.Date, nullable=True)
+    creado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    __table_args__ = ({"sqlite_autoincrement": True},)
+
+    def __repr__(self) -> str:
+        return f"<CambioOcupacion {self.id} pista={self.pista_id} fecha={self.fecha}>"
+
+
+# =========================================================
+# Retenciones de franjas (holds durante el checkout)
+# =========================================================
+# Un usuario retiene franjas de una pista y fecha durante RETENCION_TTL
+# segundos mientras completa la reserva. El UNIQUE garantiza que sólo
+# uno puede retener cada franja; las filas caducadas no cuentan y se
+# borran al retener de nuevo la franja o con `flask retenciones purgar`.
+# `grupo` identifica las franjas retenidas en una misma petición.
+
+class Retencion(db.Model):
+    __tablename__ = "retenciones"
+
+    id = db.Column(db.Integer, primary_key=True)
+    grupo = db.Column(db.String(32), nullable=False, index=True)
+    usuario_id = db.Column(
+        db.Integer,
+        ForeignKey("usuarios.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    pista_id = db.Column(
+        db.Integer,
+        ForeignKey("pistas.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    fecha = db.Column(db.Date, nullable=False)
+    horario_id = db.Column(
+        db.Integer,
+        ForeignKey("horarios.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    expira_en = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        UniqueConstraint("pista_id", "fecha", "horario_id", name="uq_retenciones_pista_fecha_horario"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<Retencion {self.grupo} pista={self.pista_id} fecha={self.fecha} horario={self.horario_id}>"
@@ -0,0 +1,366 @@
+import atexit
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, func, or_, select
+
+from . import clubs
+from .extensions import db
+from .mapa_ocupacion import MAX_FRANJAS, MapaOcupacion
+from .models import CambioOcupacion, Horario, HorarioReserva, Reserva
+
+
+# =========================================================
+# ===============   CATÁLOGO DE FRANJAS   =================
+# =========================================================
+# Las franjas se numeran por hora de inicio: la franja en la posición i
+# es el bit i de las máscaras de ocupación. El catálogo es pequeño y
+# cambia poco, así que se cachea en el proceso.
+
+class Catalogo:
+    def __init__(self, filas):
+        # filas: (id, franja, turno, inicio_min, fin_min) ordenadas por inicio
+        self.ids = tuple(f[0] for f in filas)
+        self.franjas = tuple(f[1] for f in filas)
+        self.turnos = tuple(f[2] for f in filas)
+        self.inicio = tuple(f[3] for f in filas)
+        self.fin = tuple(f[4] for f in filas)
+
+        self.n = len(filas)
+        self.posicion = {h_id: i for i, h_id in enumerate(self.ids)}
+        self.todas = (1 << self.n) - 1
+
+        # Bit i = la franja i termina justo cuando empieza la i+1
+        self.enlaces = 0
+        for i in range(self.n - 1):
+            if self.fin[i] == self.inicio[i + 1]:
+                self.enlaces |= 1 << i
+
+        huella = repr([tuple(f) for f in filas]).encode("utf-8")
+        self.version = hashlib.sha1(huella).hexdigest()[:12]
+
+    def mascara(self, horario_ids):
+        """Máscara de bits de un conjunto de horario_id."""
+        m = 0
+        for h_id in horario_ids:
+            i = self.posicion.get(h_id)
+            if i is not None:
+                m |= 1 << i
+        return m
+
+    def posiciones(self, mascara):
+        """Posiciones de los bits activos, en orden."""
+        out = []
+        while mascara:
+            bajo = mascara & -mascara
+            out.append(bajo.bit_length() - 1)
+            mascara ^= bajo
+        return out
+
+    def ventana(self, desde_min=None, hasta_min=None):
+        """Máscara de las franjas contenidas en [desde_min, hasta_min]."""
+        m = 0
+        for i in range(self.n):
+            if desde_min is not None and self.inicio[i] < desde_min:
+                continue
+            if hasta_min is not None and self.fin[i] > hasta_min:
+                continue
+            m |= 1 << i
+        return m
+
+    def inicios_por_longitud(self, duracion):
+        """
+        Para una duración en minutos, agrupa las posiciones de inicio
+        válidas según cuántas franjas consecutivas necesitan:
+        {k: máscara de inicios}. Un inicio es válido si desde él hay una
+        cadena de franjas contiguas que cubre la duración.
+        """
+        grupos = {}
+        for i in range(self.n):
+            j = i
+            while self.fin[j] - self.inicio[i] < duracion:
+                if not (self.enlaces >> j) & 1:
+                    break
+                j += 1
+            else:
+                k = j - i + 1
+                grupos[k] = grupos.get(k, 0) | (1 << i)
+        return grupos
+
+
+# Uno por base de datos: club → {"catalogo", "cargado"} (ver clubs.py)
+_caches = {}
+
+
+def _cache():
+    club = clubs.actual()
+    c = _caches.get(club)
+    if c is None:
+        c = _caches.setdefault(club, {"catalogo": None, "cargado": 0.0})
+    return c
+
+
+def catalogo():
+    """Catálogo cacheado (CATALOGO_TTL segundos como máximo entre workers)."""
+    ttl = current_app.config["CATALOGO_TTL"]
+    cache = _cache()
+    if cache["catalogo"] is None or time.monotonic() - cache["cargado"] > ttl:
+        filas = (
+            db.session.query(Horario.id, Horario.franja, Horario.turno, Horario.inicio_min, Horario.fin_min)
+            .order_by(Horario.inicio_min.asc(), Horario.id.asc())
+            .all()
+        )
+        cache["catalogo"] = Catalogo(filas)
+        cache["cargado"] = time.monotonic()
+    return cache["catalogo"]
+
+
+def invalidar_catalogo():
+    """Llamar cuando se crean, modifican o borran horarios."""
+    _cache()["catalogo"] = None
+
+
+# =========================================================
+# ===============   MÁSCARAS DE OCUPACIÓN   ===============
+# =========================================================
+
+def mascaras_ocupacion(cat, pista_ids, desde, hasta):
+    """
+    Ocupación de varias pistas en un rango de fechas con UNA consulta.
+    Devuelve {(pista_id, fecha): máscara}; las combinaciones sin
+    reservas no aparecen (máscara 0).
+    """
+    filas = (
+        db.session.query(Reserva.pista_id, Reserva.fecha, HorarioReserva.horario_id)
+        .join(HorarioReserva, HorarioReserva.reserva_id == Reserva.id)
+        .filter(
+            Reserva.pista_id.in_(pista_ids),
+            Reserva.fecha >= desde,
+            Reserva.fecha <= hasta,
+        )
+        .all()
+    )
+
+    mascaras = {}
+    for pista_id, fecha, horario_id in filas:
+        i = cat.posicion.get(horario_id)
+        if i is not None:
+            mascaras[(pista_id, fecha)] = mascaras.get((pista_id, fecha), 0) | (1 << i)
+    return mascaras
+
+
+# =========================================================
+# ===============   MAPA COMPARTIDO ENTRE WORKERS   ========
+# =========================================================
+# Las consultas de disponibilidad leen del mapa (ver mapa_ocupacion.py)
+# y sólo van a la BD para las entradas que aún no están cargadas. Las
+# reservas y cancelaciones lo actualizan después del commit.
+#
+# Además, cada escritura anota su cambio en cambios_ocupacion dentro de
+# la misma transacción (anotar_cambio). El mapa recuerda el último id
+# aplicado, así que al arrancar un worker (o cada OCCUPANCY_SYNC
+# segundos) sólo se invalida lo que cambió desde entonces: lo que
+# hicieron otros procesos sin mapa, o todo lo ocurrido mientras el
+# servicio estaba parado.
+
+# Un mapa (y un fichero) por base de datos: club → {"mapa", "sincronizado",
+# "vistos"}; vistos: id → creado_en de los cambios ya aplicados dentro de
+# la ventana de SYNC_VENTANA (ver sincronizar_mapa)
+_mapas = {}
+
+
+def _ruta_mapa(cfg, club):
+    if club is None:
+        return cfg["OCCUPANCY_MAP_PATH"]
+    base, ext = os.path.splitext(cfg["OCCUPANCY_MAP_PATH"])
+    return f"{base}-{club}{ext}"
+
+
+def _mapa():
+    club = clubs.actual()
+    e = _mapas.get(club)
+    if e is None:
+        e = _mapas.setdefault(club, {"mapa": None, "sincronizado": 0.0, "vistos": {}})
+    return e
+
+
+def mapa():
+    """Mapa del proceso (del club en curso), o None si está desactivado."""
+    cfg = current_app.config
+    if not cfg["OCCUPANCY_MAP_ENABLED"]:
+        return None
+    e = _mapa()
+    if e["mapa"] is None:
+        e["mapa"] = MapaOcupacion(
+            _ruta_mapa(cfg, clubs.actual()), cfg["OCCUPANCY_MAP_PISTAS"], cfg["OCCUPANCY_MAP_DIAS"]
+        )
+        atexit.register(e["mapa"].cerrar)
+    return e["mapa"]
+
+
+def anotar_cambio(pista_id=None, fecha=None):
+    """
+    Anota en la transacción actual (sin commit) un cambio de ocupación
+    de (pista_id, fecha); sin argumentos, un cambio que afecta a todo.
+    """
+    db.session.add(CambioOcupacion(pista_id=pista_id, fecha=fecha))
+
+
+def sincronizar_mapa(forzar=False):
+    """
+    Pone el mapa al día con cambios_ocupacion: invalida las entradas
+    cambiadas desde el último id aplicado (y las de ids menores que se
+    confirmaron tarde, dentro de SYNC_VENTANA). Como mucho cada
+    OCCUPANCY_SYNC segundos por proceso, salvo forzar=True.
+    """
+    m = mapa()
+    if m is None:
+        return
+    e = _mapa()
+    ahora = time.monotonic()
+    if not forzar and ahora - e["sincronizado"] < current_app.config["OCCUPANCY_SYNC"]:
+        return
+    e["sincronizado"] = ahora
+
+    c = CambioOcupacion
+    desde = m.cambio()
+    primero, ultimo = db.session.execute(select(func.min(c.id), func.max(c.id))).one()
+    ultimo = ultimo or 0
+    if desde > ultimo or (primero is not None and desde < primero - 1):
+        # BD recreada o restaurada, o se purgaron cambios que el mapa no vio
+        m.aplicar_cambios(desde, ultimo, (), todo=True)
+        return
+
+    # Los ids nuevos y, además, los de los últimos SYNC_VENTANA segundos
+    # que este proceso no ha aplicado aún: en PostgreSQL el id se asigna al
+    # insertar, no al confirmar, y una transacción lenta puede hacer
+    # visible un id por debajo de `desde` cuando el mapa ya lo dejó atrás.
+    limite = datetime.utcnow() - timedelta(seconds=current_app.config["SYNC_VENTANA"])
+    vistos = e["vistos"]
+    filas = [
+        f for f in db.session.execute(
+            select(c.id, c.pista_id, c.fecha, c.creado_en)
+            .where(c.id <= ultimo, or_(c.id > desde, c.creado_en >= limite))
+        )
+        if f.id > desde or f.id not in vistos
+    ]
+    if not filas and ultimo == desde:
+        return
+
+    todo = any(f.pista_id is None or f.fecha is None for f in filas)
+    if m.aplicar_cambios(desde, ultimo, {(f.pista_id, f.fecha) for f in filas}, todo=todo):
+        # Copia: otro hilo puede estar sincronizando a la vez
+        vivos = {i: t for i, t in list(vistos.items()) if t >= limite}
+        vivos.update((f.id, f.creado_en) for f in filas)
+        e["vistos"] = vivos
+
+
+def purgar_cambios(dias):
+    """
+    Borra los cambios de más de `dias` días (siempre queda el último, que
+    marca hasta dónde llega la secuencia). Devuelve cuántos.
+    """
+    c = CambioOcupacion
+    ultimo = db.session.execute(select(func.max(c.id))).scalar()
+    if ultimo is None:
+        return 0
+    borrados = db.session.execute(
+        delete(c).where(c.creado_en < datetime.utcnow() - timedelta(days=dias), c.id < ultimo)
+    ).rowcount
+    db.session.commit()
+    return borrados
+
+
+def _mapa_para(cat):
+    """
+    Mapa alineado con el catálogo `cat`, o None si no se puede usar.
+    Si el mapa es de otra versión, primero se recarga el catálogo (puede
+    ser este worker el que lo tiene viejo) y sólo si sigue sin coincidir
+    se reinicia el mapa.
+    """
+    m = mapa()
+    if m is None or cat.n > MAX_FRANJAS:
+        return None
+    if m.version() != cat.version:
+        invalidar_catalogo()
+        if catalogo().version != cat.version:
+            return None
+        m.asegurar_version(cat.version)
+    sincronizar_mapa()
+    return m
+
+
+def mascaras_dia(cat, pista_ids, fecha):
+    """
+    {pista_id: máscara de franjas ocupadas} para una fecha. Lo que no
+    está en el mapa se consulta en la BD con una sola consulta y se guarda.
+    """
+    m = _mapa_para(cat)
+    mascaras, faltan, seq = {}, [], None
+    for pista_id in pista_ids:
+        if m is not None and m.admite(pista_id):
+            mascara, s = m.leer(pista_id, fecha, cat.version)
+            if seq is None:
+                seq = s
+            if mascara is not None:
+                mascaras[pista_id] = mascara
+                continue
+        faltan.append(pista_id)
+
+    if faltan:
+        ocupadas = mascaras_ocupacion(cat, faltan, fecha, fecha)
+        for pista_id in faltan:
+            mascaras[pista_id] = ocupadas.get((pista_id, fecha), 0)
+        if seq is not None:
+            # Si alguien escribió en el mapa desde la lectura, no se guarda:
+            # lo consultado podría ser anterior a su commit.
+            m.guardar(
+                [(p, fecha, mascaras[p]) for p in faltan if m.admite(p)],
+                seq,
+                cat.version,
+            )
+    return mascaras
+
+
+def registrar_cambio(pista_id, fecha, horario_ids, ocupar):
+    """Tras el commit de una reserva (ocupar=True) o cancelación."""
+    cat = catalogo()
+    m = mapa()
+    if m is None or cat.n > MAX_FRANJAS:
+        return
+    ids = set(horario_ids)
+    if any(h not in cat.posicion for h in ids):
+        # Franja que este catálogo no conoce: no se puede marcar
+        m.invalidar_todo()
+    elif m.admite(pista_id):
+        # Con otra versión en el mapa, actualizar() lo vacía entero
+        m.actualizar(pista_id, fecha, cat.mascara(ids), ocupar, cat.version)
+
+
+def invalidar_mapa():
+    """Tras borrados masivos (pistas, usuarios, archivo): se rehace bajo demanda."""
+    m = mapa()
+    if m is not None:
+        m.invalidar_todo()
+
+
+def bloques_libres(libres, grupos):
+    """
+    Inicios de bloques contiguos libres mediante desplazamientos de bits.
+    libres: máscara de franjas libres (ya recortada a la ventana)
+    grupos: salida de Catalogo.inicios_por_longitud
+    Devuelve {k: máscara de inicios} sólo con los k que tienen huecos.
+    """
+    encontrados = {}
+    for k, inicios in grupos.items():
+        ok = libres & inicios
+        s = 1
+        while ok and s < k:
+            ok &= libres >> s
+            s += 1
+        if ok:
+            encontrados[k] = ok
+    return encontrados
@@ -0,0 +1,90 @@
+import hashlib
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import select
+
+from . import clubs
+from .extensions import db
+from .models import Rol, Usuario
+
+
+# =========================================================
+# ===============   PERFIL DEL USUARIO (/auth/me)   =======
+# =========================================================
+# El frontend pide /auth/me en cada navegación. El perfil sale de una
+# sola consulta (usuario JOIN rol) y se guarda ya serializado, con su
+# ETag, en una caché por usuario de cada worker durante PERFIL_CACHE_TTL
+# segundos: las repeticiones no tocan la BD y, con If-None-Match, ni
+# siquiera envían el cuerpo.
+#
+# Quien cambie datos del perfil llama a invalidar() (o invalidar_todos()
+# si cambia algo compartido, como el nombre de un rol) tras el commit.
+# Los demás workers lo ven al caducar su entrada; un usuario borrado ya
+# no llega aquí porque sus tokens se revocan.
+
+_cache = {}  # (club, usuario_id) → (expira, etag, cuerpo); los ids se repiten entre clubs
+_lock = threading.Lock()
+# Sube con cada invalidación: un perfil leído de la BD antes de una
+# invalidación no se guarda después de ella.
+_generacion = [0]
+
+
+def _cargar(usuario_id):
+    fila = db.session.execute(
+        select(Usuario.id, Usuario.email, Usuario.nombre, Usuario.dni, Rol.nombre.label("rol"))
+        .join(Rol, Usuario.rol_id == Rol.id)
+        .where(Usuario.id == usuario_id)
+    ).one_or_none()
+    if fila is None:
+        return None
+    return {"id": fila.id, "email": fila.email, "nombre": fila.nombre, "dni": fila.dni, "rol": fila.rol}
+
+
+def perfil(usuario_id):
+    """(etag, cuerpo JSON) del perfil, o None si el usuario no existe."""
+    ahora = time.monotonic()
+    clave = (clubs.actual(), usuario_id)
+    entrada = _cache.get(clave)
+    if entrada is not None and entrada[0] > ahora:
+        return entrada[1], entrada[2]
+
+    generacion = _generacion[0]
+    datos = _cargar(usuario_id)
+    if datos is None:
+        return None
+    cuerpo = current_app.json.dumps(datos).encode("utf-8")
+    etag = hashlib.sha1(cuerpo).hexdigest()[:16]
+
+    cfg = current_app.config
+    with _lock:
+        if generacion != _generacion[0]:
+            return etag, cuerpo
+        if len(_cache) >= cfg["PERFIL_CACHE_MAX"]:
+            _podar(ahora, cfg["PERFIL_CACHE_MAX"])
+        _cache[clave] = (ahora + cfg["PERFIL_CACHE_TTL"], etag, cuerpo)
+    return etag, cuerpo
+
+
+def _podar(ahora, maximo):
+    # Fuera las caducadas y, si no basta, la mitad más antigua. Se cambia
+    # el dict entero: quien lea a la vez ve el viejo o el nuevo.
+    global _cache
+    vivas = [(c, v) for c, v in _cache.items() if v[0] > ahora]
+    if len(vivas) >= maximo:
+        vivas = vivas[len(vivas) // 2:]
+    _cache = dict(vivas)
+
+
+def invalidar(usuario_id):
+    with _lock:
+        _generacion[0] += 1
+        _cache.pop((clubs.actual(), usuario_id), None)
+
+
+def invalidar_todos():
+    global _cache
+    with _lock:
+        _generacion[0] += 1
+        _cache = {}
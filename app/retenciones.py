@@ -0,0 +1,231 @@
+import heapq
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.exc import IntegrityError
+
+from . import clubs
+from .extensions import db
+from .models import Retencion
+
+
+# =========================================================
+# ===============   RETENCIONES DE FRANJAS   ==============
+# =========================================================
+# Mientras completa el checkout, un usuario retiene las franjas que va
+# a reservar durante RETENCION_TTL segundos; el resto las ve ocupadas
+# y crear_reserva convierte la retención en reserva.
+#
+# - La tabla retenciones es la fuente de verdad: su UNIQUE por franja
+#   decide quién se la queda si dos usuarios la retienen a la vez.
+# - Cada worker guarda en memoria las vigentes, por (pista_id, fecha),
+#   para que la disponibilidad no vaya a la BD. Un heap por caducidad
+#   va retirando las que expiran; la lectura además ignora las ya
+#   caducadas, así que una retención deja de contar en el instante en
+#   que expira.
+# - La tabla sólo tiene unos minutos de filas vigentes: cada
+#   RETENCION_SYNC segundos se recarga entera (así llegan también las
+#   liberadas en otros workers). Lo hecho en este worker se aplica ya.
+
+
+def _timestamp(dt):
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+class Retenciones:
+    def __init__(self):
+        # (pista_id, fecha) → {horario_id: (expira, usuario_id)}; cada dict
+        # interior se sustituye entero, así la lectura no necesita cerrojo
+        self.franjas = {}
+        self.caducidades = []  # heap (expira, pista_id, fecha, horario_id)
+        self.recargada = 0.0
+        self._lock = threading.Lock()
+        self._recargando = threading.Lock()
+
+    def poner(self, pista_id, fecha, horario_ids, expira, usuario_id):
+        with self._lock:
+            dia = dict(self.franjas.get((pista_id, fecha), {}))
+            for h in horario_ids:
+                dia[h] = (expira, usuario_id)
+                heapq.heappush(self.caducidades, (expira, pista_id, fecha, h))
+            self.franjas[(pista_id, fecha)] = dia
+
+    def quitar(self, pista_id, fecha, horario_ids):
+        with self._lock:
+            dia = {h: v for h, v in self.franjas.get((pista_id, fecha), {}).items() if h not in horario_ids}
+            if dia:
+                self.franjas[(pista_id, fecha)] = dia
+            else:
+                self.franjas.pop((pista_id, fecha), None)
+
+    def _caducar(self, ahora):
+        with self._lock:
+            while self.caducidades and self.caducidades[0][0] <= ahora:
+                _, pista_id, fecha, h = heapq.heappop(self.caducidades)
+                dia = self.franjas.get((pista_id, fecha), {})
+                # Si se renovó, la entrada del heap es vieja
+                if h in dia and dia[h][0] <= ahora:
+                    dia = {k: v for k, v in dia.items() if k != h}
+                    if dia:
+                        self.franjas[(pista_id, fecha)] = dia
+                    else:
+                        del self.franjas[(pista_id, fecha)]
+
+    def recargar(self, forzar=False):
+        if not forzar and time.monotonic() - self.recargada < current_app.config["RETENCION_SYNC"]:
+            self._caducar(time.time())
+            return
+        # Un solo hilo recarga; el resto sigue con lo que hay
+        if not self._recargando.acquire(blocking=forzar):
+            return
+        try:
+            r = Retencion
+            filas = db.session.execute(
+                select(r.pista_id, r.fecha, r.horario_id, r.expira_en, r.usuario_id)
+                .where(r.expira_en > datetime.utcnow())
+            ).all()
+            franjas, caducidades = {}, []
+            for pista_id, fecha, h, expira_en, usuario_id in filas:
+                expira = _timestamp(expira_en)
+                franjas.setdefault((pista_id, fecha), {})[h] = (expira, usuario_id)
+                caducidades.append((expira, pista_id, fecha, h))
+            heapq.heapify(caducidades)
+            with self._lock:
+                self.franjas, self.caducidades = franjas, caducidades
+            self.recargada = time.monotonic()
+        finally:
+            self._recargando.release()
+
+    def retenidas(self, cat, pista_id, fecha, excepto=None):
+        """Máscara de las franjas retenidas (salvo las del usuario `excepto`)."""
+        dia = self.franjas.get((pista_id, fecha))
+        if not dia:
+            return 0
+        ahora = time.time()
+        return cat.mascara(h for h, (expira, usuario_id) in dia.items() if expira > ahora and usuario_id != excepto)
+
+
+def lista():
+    """Retenciones de este proceso y club (se crean en la primera petición)."""
+    por_club = current_app.extensions.setdefault("retenciones", {})
+    club = clubs.actual()
+    r = por_club.get(club)
+    if r is None:
+        r = por_club.setdefault(club, Retenciones())
+    return r
+
+
+def mascaras(cat, claves, excepto=None):
+    """
+    {(pista_id, fecha): máscara} de las franjas retenidas por otros
+    usuarios para cada (pista_id, fecha) de `claves`.
+    """
+    r = lista()
+    r.recargar()
+    return {(p, f): r.retenidas(cat, p, f, excepto) for p, f in claves}
+
+
+def _filtro(pista_id, fecha, horario_ids):
+    return (Retencion.pista_id == pista_id, Retencion.fecha == fecha, Retencion.horario_id.in_(horario_ids))
+
+
+def retener(usuario_id, pista_id, fecha, horario_ids):
+    """
+    Retiene las franjas, todas o ninguna, y hace commit. Las retenciones
+    caducadas y las propias sobre esas franjas se sustituyen (renovar).
+    Devuelve ({"retencion", "expira_en"}, None) o (None, error).
+    """
+    cfg = current_app.config
+    ahora = datetime.utcnow()
+    r = Retencion
+
+    db.session.execute(
+        delete(r).where(*_filtro(pista_id, fecha, horario_ids), or_(r.expira_en <= ahora, r.usuario_id == usuario_id))
+    )
+    activas = db.session.execute(
+        select(func.count()).select_from(r).where(r.usuario_id == usuario_id, r.expira_en > ahora)
+    ).scalar()
+    if activas + len(horario_ids) > cfg["RETENCION_MAX_FRANJAS"]:
+        db.session.rollback()
+        return None, f"Como máximo se pueden retener {cfg['RETENCION_MAX_FRANJAS']} franjas a la vez"
+
+    grupo = uuid.uuid4().hex
+    expira_en = ahora + timedelta(seconds=cfg["RETENCION_TTL"])
+    db.session.add_all(
+        Retencion(grupo=grupo, usuario_id=usuario_id, pista_id=pista_id, fecha=fecha, horario_id=h, expira_en=expira_en)
+        for h in horario_ids
+    )
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Otro usuario retuvo alguna franja entre el DELETE y el INSERT
+        # (uq_retenciones_pista_fecha_horario). Las franjas ya se validaron
+        # en la petición: si no es eso, el error sigue.
+        db.session.rollback()
+        ajena = db.session.execute(
+            select(r.id).where(*_filtro(pista_id, fecha, horario_ids), r.usuario_id != usuario_id).limit(1)
+        ).first()
+        if ajena is None:
+            raise
+        return None, "Alguna franja está retenida por otro usuario"
+
+    lista().poner(pista_id, fecha, horario_ids, _timestamp(expira_en), usuario_id)
+    return {"retencion": grupo, "expira_en": expira_en}, None
+
+
+def liberar(usuario_id, grupo):
+    """Suelta las franjas de una retención propia. Devuelve cuántas."""
+    filas = db.session.execute(
+        select(Retencion.pista_id, Retencion.fecha, Retencion.horario_id)
+        .where(Retencion.grupo == grupo, Retencion.usuario_id == usuario_id)
+    ).all()
+    if not filas:
+        return 0
+    db.session.execute(delete(Retencion).where(Retencion.grupo == grupo, Retencion.usuario_id == usuario_id))
+    db.session.commit()
+    for pista_id, fecha, h in filas:
+        lista().quitar(pista_id, fecha, {h})
+    return len(filas)
+
+
+def estado(usuario_id, pista_id, fecha, horario_ids):
+    """
+    Para crear_reserva: (franjas retenidas por el usuario, primera franja
+    retenida por otro o None), contando sólo retenciones vigentes.
+    """
+    propias, ajena = set(), None
+    for h, dueno in db.session.execute(
+        select(Retencion.horario_id, Retencion.usuario_id)
+        .where(*_filtro(pista_id, fecha, horario_ids), Retencion.expira_en > datetime.utcnow())
+        .order_by(Retencion.horario_id)
+    ):
+        if dueno == usuario_id:
+            propias.add(h)
+        elif ajena is None:
+            ajena = h
+    return propias, ajena
+
+
+def consumir(usuario_id, pista_id, fecha, horario_ids):
+    """Borra (sin commit) las retenciones propias de las franjas ya reservadas."""
+    db.session.execute(
+        delete(Retencion).where(*_filtro(pista_id, fecha, horario_ids), Retencion.usuario_id == usuario_id)
+    )
+
+
+def olvidar(pista_id, fecha, horario_ids):
+    """Tras el commit de consumir(): fuera también de la copia en memoria."""
+    lista().quitar(pista_id, fecha, set(horario_ids))
+
+
+def purgar():
+    """Borra las retenciones caducadas. Devuelve cuántas."""
+    borradas = db.session.execute(
+        delete(Retencion).where(Retencion.expira_en <= datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    return borradas
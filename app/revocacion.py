@@ -0,0 +1,192 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import delete, or_, select
+
+from . import clubs
+from .extensions import db
+from .models import TokenRevocado
+
+
+# =========================================================
+# ===============   REVOCACIÓN DE TOKENS   ================
+# =========================================================
+# El blocklist se consulta en cada petición autenticada, así que no
+# puede ir a la BD. Cada worker guarda en memoria:
+# - un filtro de Bloom con los jti y familias revocados: la respuesta
+#   habitual ("no está") sale de ahí con un par de hashes
+# - el conjunto exacto, para descartar los falsos positivos del filtro
+# - el corte por usuario (tokens emitidos hasta ese instante no valen)
+#
+# La tabla tokens_revocados es la fuente de verdad. Como mucho cada
+# TOKEN_BLOCKLIST_SYNC segundos se leen las filas con id mayor que la
+# última vista y, además, las revocadas en los últimos SYNC_VENTANA
+# segundos: en SQLite los ids llegan en orden de commit, pero en
+# PostgreSQL una transacción lenta puede confirmar un id menor después
+# (volver a añadir una ya vista no cambia nada). Cada
+# TOKEN_BLOCKLIST_PRUNE se olvidan las caducadas y se reconstruye el filtro.
+
+
+class FiltroBloom:
+    def __init__(self, capacidad, fp):
+        capacidad = max(capacidad, 1024)
+        self.capacidad = capacidad
+        self.m = math.ceil(-capacidad * math.log(fp) / math.log(2) ** 2)
+        self.k = max(1, round(self.m / capacidad * math.log(2)))
+        self.bits = bytearray((self.m + 7) // 8)
+
+    def _posiciones(self, clave):
+        d = hashlib.blake2b(clave.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        return ((h1 + i * h2) % self.m for i in range(self.k))
+
+    def add(self, clave):
+        for p in self._posiciones(clave):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, clave):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._posiciones(clave))
+
+
+def _timestamp(dt):
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+class ListaRevocacion:
+    def __init__(self, fp):
+        self.fp = fp
+        self.claves = {}    # "jti:<jti>" / "familia:<fam>" → expira (timestamp)
+        self.usuarios = {}  # usuario_id (str) → (corte, expira)
+        self.filtro = FiltroBloom(0, fp)
+        self.ultimo_id = 0
+        self.sincronizada = 0.0
+        self.podada = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _anadir(self, fila):
+        expira = _timestamp(fila.expira_en)
+        if fila.tipo == "usuario":
+            corte = _timestamp(fila.revocado_en)
+            anterior = self.usuarios.get(fila.valor)
+            if anterior is None or anterior[0] < corte:
+                self.usuarios[fila.valor] = (corte, expira)
+            return
+        clave = f"{fila.tipo}:{fila.valor}"
+        self.claves[clave] = max(expira, self.claves.get(clave, 0))
+        if len(self.claves) > self.filtro.capacidad:
+            self._reconstruir_filtro()
+        else:
+            self.filtro.add(clave)
+
+    def _reconstruir_filtro(self):
+        filtro = FiltroBloom(2 * len(self.claves), self.fp)
+        for clave in self.claves:
+            filtro.add(clave)
+        self.filtro = filtro
+
+    def _podar(self):
+        ahora = time.time()
+        self.claves = {c: e for c, e in self.claves.items() if e > ahora}
+        self.usuarios = {u: v for u, v in self.usuarios.items() if v[1] > ahora}
+        self._reconstruir_filtro()
+
+    def sincronizar(self, forzar=False):
+        cfg = current_app.config
+        if not forzar and time.monotonic() - self.sincronizada < cfg["TOKEN_BLOCKLIST_SYNC"]:
+            return
+        # Un solo hilo sincroniza; el resto sigue con lo que hay
+        if not self._lock.acquire(blocking=forzar):
+            return
+        try:
+            t = TokenRevocado
+            ahora = datetime.utcnow()
+            filas = db.session.execute(
+                select(t.id, t.tipo, t.valor, t.revocado_en, t.expira_en)
+                .where(
+                    or_(t.id > self.ultimo_id, t.revocado_en >= ahora - timedelta(seconds=cfg["SYNC_VENTANA"])),
+                    t.expira_en > ahora,
+                )
+                .order_by(t.id)
+            ).all()
+            for fila in filas:
+                self._anadir(fila)
+                self.ultimo_id = max(self.ultimo_id, fila.id)
+            self.sincronizada = time.monotonic()
+
+            if time.monotonic() - self.podada > cfg["TOKEN_BLOCKLIST_PRUNE"]:
+                self._podar()
+                self.podada = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def _contiene(self, clave):
+        return clave in self.filtro and self.claves.get(clave, 0) > time.time()
+
+    def revocado(self, payload):
+        self.sincronizar()
+        if self._contiene(f"jti:{payload['jti']}"):
+            return True
+        fam = payload.get("fam")
+        if fam and self._contiene(f"familia:{fam}"):
+            return True
+        corte = self.usuarios.get(str(payload.get(current_app.config["JWT_IDENTITY_CLAIM"])))
+        return corte is not None and payload.get("iat", 0) <= corte[0]
+
+
+def lista():
+    """Lista de revocación de este proceso y club (se crea en la primera petición)."""
+    por_club = current_app.extensions.setdefault("revocacion", {})
+    club = clubs.actual()
+    lr = por_club.get(club)
+    if lr is None:
+        lr = por_club.setdefault(club, ListaRevocacion(current_app.config["TOKEN_BLOCKLIST_FP"]))
+    return lr
+
+
+def esta_revocado(payload):
+    return lista().revocado(payload)
+
+
+# -------------------------
+# REVOCAR (sin commit; después del commit llamar a sincronizar())
+# -------------------------
+
+def _vida_maxima():
+    """Lo que puede seguir vivo un token emitido ahora."""
+    cfg = current_app.config
+    vidas = [v for v in (cfg["JWT_ACCESS_TOKEN_EXPIRES"], cfg["JWT_REFRESH_TOKEN_EXPIRES"]) if v]
+    return max(vidas, default=timedelta(days=365))
+
+
+def _revocar(tipo, valor, vida):
+    ahora = datetime.utcnow()
+    db.session.add(TokenRevocado(tipo=tipo, valor=str(valor), revocado_en=ahora, expira_en=ahora + vida))
+
+
+def revocar_familia(familia):
+    """Todos los tokens de una sesión (login + sus renovaciones)."""
+    _revocar("familia", familia, _vida_maxima())
+
+
+def revocar_usuario(usuario_id):
+    """Todos los tokens emitidos hasta ahora para el usuario."""
+    _revocar("usuario", usuario_id, _vida_maxima())
+
+
+def sincronizar():
+    """Aplica ya en este worker lo revocado (el resto lo verá en TOKEN_BLOCKLIST_SYNC)."""
+    lista().sincronizar(forzar=True)
+
+
+def purgar():
+    """Borra de la tabla las revocaciones caducadas. Devuelve cuántas."""
+    borradas = db.session.execute(
+        delete(TokenRevocado).where(TokenRevocado.expira_en <= datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    return borradas
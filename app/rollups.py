@@ -0,0 +1,109 @@
+from sqlalchemy import and_, delete, func, select, true, tuple_
+
+from .db_utils import dialect_insert
+from .extensions import db
+from .models import (
+    Horario,
+    HorarioReserva,
+    HorarioReservaArchivado,
+    Reserva,
+    ReservaArchivada,
+    ReservaDiaria,
+)
+
+
+# =========================================================
+# ===============   ROLLUP reservas_diarias   =============
+# =========================================================
+# Una fila por (pista, fecha, turno) con los slots reservados y los
+# ingresos. Los informes de ocupación leen de aquí en lugar de recorrer
+# horarios_reserva.
+
+def _agregado(condicion, signo=1, archivadas=False):
+    """
+    SELECT agregado por (pista, fecha, turno) de las franjas reservadas
+    que cumplen `condicion` (expresión sobre Reserva / HorarioReserva,
+    o sobre sus tablas de archivo si archivadas=True).
+    """
+    reserva, franja = (ReservaArchivada, HorarioReservaArchivado) if archivadas else (Reserva, HorarioReserva)
+    return (
+        select(
+            reserva.pista_id,
+            reserva.fecha,
+            Horario.turno,
+            func.count(franja.id) * signo,
+            func.sum(franja.precio) * signo,
+        )
+        .select_from(franja)
+        .join(reserva, franja.reserva_id == reserva.id)
+        .join(Horario, franja.horario_id == Horario.id)
+        .where(condicion)
+        .group_by(reserva.pista_id, reserva.fecha, Horario.turno)
+    )
+
+
+def aplicar_reservas(condicion, signo=1, archivadas=False):
+    """
+    Suma (signo=1) o resta (signo=-1) al rollup las franjas que cumplen
+    `condicion`, en un único INSERT ... SELECT ... ON CONFLICT.
+
+    Se ejecuta en la sesión actual: el llamador hace el commit, así el
+    rollup queda en la misma transacción que la reserva.
+    - Alta: llamar después del flush de las franjas.
+    - Cancelación: llamar ANTES de borrar la reserva.
+    """
+    t = ReservaDiaria.__table__
+    stmt = dialect_insert(t).from_select(
+        ["pista_id", "fecha", "turno", "slots", "ingresos"],
+        _agregado(condicion, signo, archivadas),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.pista_id, t.c.fecha, t.c.turno],
+        set_={
+            "slots": t.c.slots + stmt.excluded.slots,
+            "ingresos": t.c.ingresos + stmt.excluded.ingresos,
+        },
+    )
+    db.session.execute(stmt)
+
+    if signo < 0:
+        # Sólo las claves que se acaban de restar (slots no tiene índice:
+        # sin acotar sería recorrer el rollup entero en cada cancelación)
+        agregado = _agregado(condicion, signo, archivadas).subquery()
+        claves = select(agregado.c.pista_id, agregado.c.fecha, agregado.c.turno)
+        db.session.execute(
+            delete(ReservaDiaria).where(
+                tuple_(ReservaDiaria.pista_id, ReservaDiaria.fecha, ReservaDiaria.turno).in_(claves),
+                ReservaDiaria.slots <= 0,
+            )
+        )
+
+
+def reconstruir(desde=None, hasta=None):
+    """
+    Recalcula el rollup desde horarios_reserva y su archivo
+    (backfill o reparación). Devuelve el número de filas generadas.
+    """
+    borrar = delete(ReservaDiaria)
+    if desde:
+        borrar = borrar.where(ReservaDiaria.fecha >= desde)
+    if hasta:
+        borrar = borrar.where(ReservaDiaria.fecha <= hasta)
+    db.session.execute(borrar)
+
+    for modelo, archivadas in ((Reserva, False), (ReservaArchivada, True)):
+        condicion = true()
+        if desde:
+            condicion = and_(condicion, modelo.fecha >= desde)
+        if hasta:
+            condicion = and_(condicion, modelo.fecha <= hasta)
+        aplicar_reservas(condicion, archivadas=archivadas)
+
+    db.session.commit()
+
+    q = db.session.query(func.count(ReservaDiaria.id))
+    if desde:
+        q = q.filter(ReservaDiaria.fecha >= desde)
+    if hasta:
+        q = q.filter(ReservaDiaria.fecha <= hasta)
+    return q.scalar()
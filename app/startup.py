@@ -0,0 +1,102 @@
+import os
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+
+from .extensions import db
+
+
+# =========================================================
+# ===============   ARRANQUE PREFORK   ====================
+# =========================================================
+# Con gunicorn --preload la app se construye una vez en el proceso
+# master y los workers nacen por fork() con todo ya cargado. Aquí se
+# hace el trabajo que si no pagarían las primeras peticiones de cada
+# worker, y se deja el pool de conexiones listo para el fork.
+
+def _despues_del_fork(app):
+    """
+    En el hijo: olvidar las conexiones heredadas del master sin cerrarlas
+    (close=False), porque el socket/fichero es compartido con el padre,
+    y abrir ya la conexión propia del worker.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+            with engine.connect():
+                pass
+
+
+def calentar(app, tiempos=None):
+    """
+    Prepara la app antes de servir peticiones:
+    - configure_mappers(): resuelve todas las relaciones del ORM
+    - catálogo de franjas en caché
+    - mapa de ocupación en disco puesto al día con cambios_ocupacion, así
+      los workers sirven con la ocupación de antes del reinicio
+    - una conexión a la base de datos abierta y probada
+    - con clubs, lo mismo (conexión, catálogo, mapa) para la BD de cada uno
+    - una petición interna a /api/disponibilidad: compila el mapa de
+      URLs y deja en la caché del engine el SQL de la ruta más caliente
+    Devuelve los tiempos de cada fase (ms), que también quedan en
+    app.config["STARTUP_TIMINGS"] y en el log.
+    """
+    from . import clubs, ocupacion, tareas
+
+    tiempos = dict(tiempos or {})
+
+    def fase(nombre, fn):
+        t = time.perf_counter()
+        fn()
+        tiempos[nombre] = round((time.perf_counter() - t) * 1000, 2)
+
+    with app.app_context():
+        fase("mappers", configure_mappers)
+        fase("conexion", lambda: db.session.execute(text("SELECT 1")))
+        fase("catalogo", ocupacion.catalogo)
+        fase("mapa", lambda: ocupacion.sincronizar_mapa(forzar=True))
+        db.session.remove()
+
+    for club in app.config["CLUBS"]:
+        with clubs.en_club(app, club):
+            fase(f"club:{club}", lambda: (
+                db.session.execute(text("SELECT 1")),
+                ocupacion.catalogo(),
+                ocupacion.sincronizar_mapa(forzar=True),
+            ))
+            db.session.remove()
+
+    fase("peticion", lambda: app.test_client().get("/api/disponibilidad?pista_id=0&fecha=1970-01-01"))
+
+    # Los hilos no sobreviven al fork: cada worker arranca su propio
+    # ejecutor de tareas en su primera petición.
+    tareas.cerrar(app)
+
+    with app.app_context():
+        # El master no sirve peticiones: sus conexiones no deben llegar a
+        # los workers abiertas y compartidas.
+        for engine in db.engines.values():
+            engine.dispose()
+
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=lambda: _despues_del_fork(app))
+
+    app.config["STARTUP_TIMINGS"] = tiempos
+    app.logger.info("App calentada: %s", tiempos)
+    return tiempos
+
+
+def crear_app_calentada():
+    """create_app() + calentar(), midiendo también el tiempo de create_app."""
+    from . import create_app
+
+    t = time.perf_counter()
+    app = create_app()
+    tiempos = {"create_app": round((time.perf_counter() - t) * 1000, 2)}
+
+    if app.config["WARM_ON_STARTUP"]:
+        calentar(app, tiempos)
+    else:
+        app.config["STARTUP_TIMINGS"] = tiempos
+    return app
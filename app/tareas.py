@@ -0,0 +1,330 @@
+import atexit
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, event, func, select, update
+from sqlalchemy.orm import Session
+
+from . import clubs
+from .extensions import db
+from .models import TareaPendiente
+
+
+# =========================================================
+# ===============   TAREAS EN SEGUNDO PLANO   =============
+# =========================================================
+# Efectos secundarios que no tienen que retrasar la respuesta (auditoría,
+# avisos, precalentar cachés...).
+#
+# - encolar() inserta la tarea en tareas_pendientes en la MISMA transacción
+#   que la escritura que la origina: o se confirman las dos o ninguna.
+# - Tras el commit la tarea se entrega a un pool de hilos acotado del
+#   proceso. Si la cola está llena, o el proceso cae, la tarea sigue en la
+#   tabla y la recoge el barrido periódico (de este u otro worker).
+# - Cada ejecución reclama la fila con un UPDATE condicional, así que dos
+#   workers nunca ejecutan la misma tarea a la vez. La entrega es "al menos
+#   una vez": las tareas deben ser idempotentes.
+# - Los fallos se reintentan con espera exponencial hasta TAREAS_MAX_INTENTOS;
+#   después la tarea queda como "fallida" para revisarla a mano.
+# - Con clubs (app/clubs.py) cada BD tiene su outbox: la tarea se ejecuta
+#   en el club donde se encoló y el barrido recorre todas las BD.
+
+_REGISTRO = {}
+
+
+def tarea(tipo):
+    """Decorador: registra una función como tarea de tipo `tipo`."""
+    def decorador(fn):
+        _REGISTRO[tipo] = fn
+        return fn
+    return decorador
+
+
+def encolar(tipo, **payload):
+    """
+    Añade una tarea a la transacción en curso. El payload debe ser JSON
+    (fechas como 'YYYY-MM-DD'). Se ejecuta sólo si la transacción se confirma.
+    """
+    if tipo not in _REGISTRO:
+        raise ValueError(f"Tarea desconocida: {tipo}")
+    t = TareaPendiente(tipo=tipo, payload=payload)
+    db.session.add(t)
+    db.session.flush()
+    db.session.info.setdefault("tareas", []).append(t.id)
+    return t.id
+
+
+@event.listens_for(Session, "after_commit")
+def _despachar(session):
+    ids = session.info.pop("tareas", None)
+    if ids and current_app.config["TAREAS_ENABLED"]:
+        ejecutor(current_app._get_current_object()).enviar(ids, clubs.actual())
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar(session):
+    session.info.pop("tareas", None)
+
+
+# -------------------------
+# EJECUCIÓN DE UNA TAREA
+# -------------------------
+
+def _reclamar(tarea_id, ahora):
+    """Marca la tarea en_curso si está disponible. True si la hemos reclamado."""
+    plazo = ahora + timedelta(seconds=current_app.config["TAREAS_PLAZO"])
+    reclamada = db.session.execute(
+        update(TareaPendiente)
+        .where(
+            TareaPendiente.id == tarea_id,
+            TareaPendiente.estado.in_(("pendiente", "en_curso")),
+            TareaPendiente.disponible_en <= ahora,
+        )
+        .values(estado="en_curso", disponible_en=plazo)
+    ).rowcount
+    db.session.commit()
+    return reclamada == 1
+
+
+def ejecutar(tarea_id):
+    """
+    Reclama y ejecuta una tarea (dentro de un app context).
+    Devuelve None si otro la tenía, o (resultado, espera_s, duracion_s)
+    con resultado "ok", "reintento" o "fallida".
+    """
+    cfg = current_app.config
+    ahora = datetime.utcnow()
+    try:
+        if not _reclamar(tarea_id, ahora):
+            return None
+
+        t = db.session.get(TareaPendiente, tarea_id)
+        espera = (ahora - t.creada_en).total_seconds()
+        inicio = time.perf_counter()
+        try:
+            fn = _REGISTRO.get(t.tipo)
+            if fn is None:
+                raise LookupError(f"Tarea desconocida: {t.tipo}")
+            fn(**t.payload)
+        except Exception:
+            db.session.rollback()
+            t = db.session.get(TareaPendiente, tarea_id)
+            t.intentos += 1
+            t.ultimo_error = traceback.format_exc(limit=5)[-2000:]
+            if t.intentos >= cfg["TAREAS_MAX_INTENTOS"]:
+                t.estado = "fallida"
+                resultado = "fallida"
+            else:
+                espera_reintento = min(cfg["TAREAS_BACKOFF"] * 2 ** (t.intentos - 1), cfg["TAREAS_BACKOFF_MAX"])
+                t.estado = "pendiente"
+                t.disponible_en = datetime.utcnow() + timedelta(seconds=espera_reintento)
+                resultado = "reintento"
+            db.session.commit()
+            current_app.logger.warning("Tarea %s (%s) %s: %s", tarea_id, t.tipo, resultado, t.ultimo_error.splitlines()[-1])
+        else:
+            db.session.execute(delete(TareaPendiente).where(TareaPendiente.id == tarea_id))
+            db.session.commit()
+            resultado = "ok"
+        return resultado, espera, time.perf_counter() - inicio
+    finally:
+        db.session.remove()
+
+
+def pendientes(limite=None):
+    """Ids de tareas listas para ejecutarse (o con el plazo de ejecución vencido)."""
+    query = (
+        select(TareaPendiente.id)
+        .where(
+            TareaPendiente.estado.in_(("pendiente", "en_curso")),
+            TareaPendiente.disponible_en <= datetime.utcnow(),
+        )
+        .order_by(TareaPendiente.disponible_en, TareaPendiente.id)
+    )
+    if limite is not None:
+        query = query.limit(limite)
+    return db.session.scalars(query).all()
+
+
+def resumen_outbox():
+    """Tareas en la tabla por estado y antigüedad de la más vieja sin terminar."""
+    por_estado = dict(
+        db.session.execute(
+            select(TareaPendiente.estado, func.count()).group_by(TareaPendiente.estado)
+        ).all()
+    )
+    mas_antigua = db.session.scalar(
+        select(func.min(TareaPendiente.creada_en)).where(TareaPendiente.estado != "fallida")
+    )
+    return {
+        "por_estado": por_estado,
+        "mas_antigua": mas_antigua,
+    }
+
+
+# -------------------------
+# POOL DEL PROCESO
+# -------------------------
+
+def _percentiles(valores):
+    if not valores:
+        return {"p50_ms": None, "p95_ms": None, "max_ms": None}
+    s = sorted(valores)
+
+    def p(q):
+        return round(s[min(len(s) - 1, int(q * len(s)))] * 1000, 2)
+
+    return {
+        "p50_ms": p(0.50),
+        "p95_ms": p(0.95),
+        "max_ms": round(s[-1] * 1000, 2),
+    }
+
+
+class Ejecutor:
+    """Pool de hilos acotado + barrido periódico del outbox, uno por proceso."""
+
+    def __init__(self, app):
+        cfg = app.config
+        self.app = app
+        self.pid = os.getpid()
+        self.workers = cfg["TAREAS_WORKERS"]
+        self.max_cola = cfg["TAREAS_MAX_COLA"]
+
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tareas")
+        self._huecos = threading.BoundedSemaphore(self.max_cola)
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+
+        self._contadores = {
+            "en_cola": 0, "en_ejecucion": 0,
+            "completadas": 0, "reintentos": 0, "fallidas": 0,
+            "desbordadas": 0,
+        }
+        self._esperas = deque(maxlen=1000)
+        self._duraciones = deque(maxlen=1000)
+
+        self._barrido = threading.Thread(
+            target=self._barrer, args=(cfg["TAREAS_BARRIDO"],), name="tareas-barrido", daemon=True
+        )
+        self._barrido.start()
+        atexit.register(self.cerrar)
+
+    def _sumar(self, clave, n=1):
+        with self._lock:
+            self._contadores[clave] += n
+
+    def enviar(self, ids, club=None):
+        """Pasa tareas (del outbox de `club`) al pool. Sin hueco en la cola se quedan para el barrido."""
+        for tarea_id in ids:
+            if self._parar.is_set() or not self._huecos.acquire(blocking=False):
+                self._sumar("desbordadas")
+                continue
+            self._sumar("en_cola")
+            try:
+                self._pool.submit(self._ejecutar, tarea_id, club)
+            except RuntimeError:  # pool cerrado
+                self._huecos.release()
+                self._sumar("en_cola", -1)
+
+    def _ejecutar(self, tarea_id, club):
+        with self._lock:
+            self._contadores["en_cola"] -= 1
+            self._contadores["en_ejecucion"] += 1
+        try:
+            with clubs.en_club(self.app, club):
+                r = ejecutar(tarea_id)
+        except Exception:
+            self.app.logger.exception("Error ejecutando la tarea %s", tarea_id)
+            r = None
+        finally:
+            self._huecos.release()
+
+        with self._lock:
+            self._contadores["en_ejecucion"] -= 1
+            if r is not None:
+                resultado, espera, duracion = r
+                clave = {"ok": "completadas", "reintento": "reintentos", "fallida": "fallidas"}[resultado]
+                self._contadores[clave] += 1
+                self._esperas.append(espera)
+                self._duraciones.append(duracion)
+
+    def _barrer(self, intervalo):
+        while not self._parar.wait(intervalo):
+            for club in [None, *self.app.config["CLUBS"]]:
+                try:
+                    with clubs.en_club(self.app, club):
+                        libres = self.max_cola - self._contadores["en_cola"]
+                        ids = pendientes(limite=libres) if libres > 0 else []
+                        db.session.remove()
+                    self.enviar(ids, club)
+                except Exception:
+                    self.app.logger.exception("Error en el barrido de tareas (club %s)", club)
+
+    def cerrar(self, esperar=True):
+        """
+        Deja de aceptar tareas y espera a las que están ejecutándose. Las que
+        aún no habían empezado siguen en tareas_pendientes.
+        """
+        if self._parar.is_set():
+            return
+        self._parar.set()
+        self._pool.shutdown(wait=esperar, cancel_futures=True)
+
+    def estado(self):
+        with self._lock:
+            contadores = dict(self._contadores)
+            esperas = list(self._esperas)
+            duraciones = list(self._duraciones)
+        return {
+            "pid": self.pid,
+            "workers": self.workers,
+            "max_cola": self.max_cola,
+            **contadores,
+            "espera": _percentiles(esperas),
+            "duracion": _percentiles(duraciones),
+        }
+
+
+_creacion = threading.Lock()
+
+
+def ejecutor(app):
+    """Ejecutor del proceso actual; se crea al primer uso (y de nuevo tras un fork)."""
+    e = app.extensions.get("tareas")
+    if e is None or e.pid != os.getpid():
+        with _creacion:
+            e = app.extensions.get("tareas")
+            if e is None or e.pid != os.getpid():
+                e = app.extensions["tareas"] = Ejecutor(app)
+    return e
+
+
+def cerrar(app):
+    """Para el ejecutor de este proceso (p. ej. en el master antes del fork)."""
+    e = app.extensions.pop("tareas", None)
+    if e is not None and e.pid == os.getpid():
+        e.cerrar()
+
+
+def init_tareas(app):
+    @app.before_request
+    def _arrancar_ejecutor():
+        # El barrido tiene que correr en cada worker aunque no encole nada
+        if app.config["TAREAS_ENABLED"]:
+            ejecutor(app)
+
+
+# -------------------------
+# TAREAS
+# -------------------------
+
+@tarea("auditoria")
+def auditar(evento, **datos):
+    """Registro de auditoría de operaciones sobre reservas."""
+    current_app.logger.info("auditoria %s %s", evento, datos)
@@ -0,0 +1,104 @@
+"""
+Benchmark de borrado de una pista con mucho histórico.
+
+Crea una base de datos SQLite temporal con N reservas (3 franjas cada
+una) en una pista y mide tiempo y pico de memoria de:
+- "ORM": session.delete() con las colecciones cargadas (lo que ocurre
+  cuando SQLAlchemy tiene que recorrer los hijos).
+- "DELETE + CASCADE": lo que hace ahora DELETE /admin/pistas/<id>, un
+  único DELETE y los ON DELETE CASCADE de la base de datos.
+
+El pico de memoria del segundo caso no debería crecer con N.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_delete_cascade [n1 n2 ...]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import selectinload
+
+
+def preparar(app, n):
+    from app.extensions import db
+    from app.models import Horario, HorarioReserva, Pista, Reserva, Rol, Usuario
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(Rol(id=2, nombre="USER"))
+        db.session.add(Usuario(id=1, nombre="u", dni="1", email="u@u", password="x", rol_id=2))
+        db.session.add(Pista(id=1, nombre="Pista 1", plazas=4, precio_base=12))
+        db.session.add_all(Horario(franja=f"{h:02d}:00-{h + 1:02d}:00", turno="tarde") for h in range(8, 11))
+        db.session.flush()
+
+        inicio = date(2020, 1, 1)
+        db.session.execute(
+            insert(Reserva),
+            [{"id": i + 1, "usuario_id": 1, "pista_id": 1, "fecha": inicio + timedelta(days=i % 3000)} for i in range(n)],
+        )
+        db.session.execute(
+            insert(HorarioReserva),
+            [{"reserva_id": i + 1, "horario_id": h, "precio": 12} for i in range(n) for h in (1, 2, 3)],
+        )
+        db.session.commit()
+
+
+def borrar_orm(app):
+    from app.extensions import db
+    from app.models import Pista, Reserva
+
+    with app.app_context():
+        p = db.session.get(Pista, 1, options=[selectinload(Pista.reservas).selectinload(Reserva.horarios)])
+        db.session.delete(p)
+        db.session.commit()
+
+
+def borrar_cascade(app):
+    from app.extensions import db
+    from app.models import Pista
+
+    with app.app_context():
+        db.session.execute(delete(Pista).where(Pista.id == 1))
+        db.session.commit()
+
+
+def medir(app, fn):
+    tracemalloc.start()
+    t = time.perf_counter()
+    fn(app)
+    segundos = time.perf_counter() - t
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return segundos, pico
+
+
+def main():
+    tamanos = [int(x) for x in sys.argv[1:]] or [1_000, 5_000, 20_000]
+
+    carpeta = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{carpeta}/bench.db"
+
+    from app import create_app
+    from app.extensions import db
+    from app.models import HorarioReserva
+
+    app = create_app()
+
+    print(f"{'reservas':>9} {'método':<18} {'tiempo':>9} {'pico memoria':>14} {'franjas restantes':>18}")
+    for n in tamanos:
+        for nombre, fn in (("ORM", borrar_orm), ("DELETE + CASCADE", borrar_cascade)):
+            preparar(app, n)
+            segundos, pico = medir(app, fn)
+            with app.app_context():
+                restantes = db.session.query(HorarioReserva).count()
+            print(f"{n:>9} {nombre:<18} {segundos * 1000:>7.0f}ms {pico / 1024 / 1024:>11.2f} MB {restantes:>18}")
+
+
+if __name__ == "__main__":
+    main()
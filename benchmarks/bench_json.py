@@ -0,0 +1,69 @@
+"""
+Micro-benchmark de serialización JSON.
+
+Compara el provider por defecto de Flask (json de la stdlib, con la
+conversión manual de Decimal/fechas que hacían los handlers) con
+PadelJSONProvider sobre un listado de 10.000 reservas con la misma
+forma que devuelve GET /admin/reservas.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_json [n_reservas] [repeticiones]
+"""
+import sys
+import timeit
+from datetime import date, timedelta
+from decimal import Decimal
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from app.json_provider import PadelJSONProvider, orjson
+
+
+def payload(n: int):
+    hoy = date(2026, 1, 1)
+    return [
+        {
+            "id": i,
+            "usuario": f"Usuario {i % 500}",
+            "usuario_id": i % 500,
+            "pista": f"Pista {i % 8 + 1}",
+            "pista_id": i % 8 + 1,
+            "fecha": hoy + timedelta(days=i % 365),
+            "horarios": ["18:00-18:30", "18:30-19:00", "19:00-19:30"],
+            "precio_total": Decimal("36.00") + i % 3,
+        }
+        for i in range(n)
+    ]
+
+
+def payload_manual(reservas):
+    # Lo que hacían los handlers antes: str() e isoformat() a mano
+    return [
+        {**r, "fecha": r["fecha"].isoformat(), "precio_total": str(r["precio_total"])}
+        for r in reservas
+    ]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    app = Flask(__name__)
+    stdlib = DefaultJSONProvider(app)
+    padel = PadelJSONProvider(app)
+    datos = payload(n)
+
+    casos = {
+        "stdlib + conversión manual": lambda: stdlib.dumps(payload_manual(datos), separators=(",", ":")),
+        "PadelJSONProvider": lambda: padel.dumps_bytes(datos),
+    }
+
+    print(f"{n} reservas, {repeticiones} repeticiones (orjson={'sí' if orjson else 'no'})")
+    for nombre, fn in casos.items():
+        mejor = min(timeit.repeat(fn, number=1, repeat=repeticiones))
+        print(f"  {nombre:<28} {mejor * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Tiempo de arranque y latencia de la primera petición tras un fork.
+
+Para cada modo (sin calentar / calentada) un proceso construye la app
+como lo haría el master de gunicorn --preload, hace fork() y el hijo
+(el "worker") mide su primera y segunda petición a /api/disponibilidad.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_startup
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+WORKER = r"""
+import os, sys, time, json
+os.environ["WARM_ON_STARTUP"] = sys.argv[1]
+t = time.perf_counter()
+from app.startup import crear_app_calentada
+app = crear_app_calentada()
+arranque = (time.perf_counter() - t) * 1000
+
+r, w = os.pipe()
+if os.fork() == 0:
+    c = app.test_client()
+    lat = []
+    for _ in range(2):
+        t = time.perf_counter()
+        c.get("/api/disponibilidad?pista_id=1&fecha=2026-01-01")
+        lat.append((time.perf_counter() - t) * 1000)
+    os.write(w, json.dumps(lat).encode())
+    os._exit(0)
+os.wait()
+lat = json.loads(os.read(r, 1024))
+print(json.dumps({"arranque": arranque, "fases": app.config["STARTUP_TIMINGS"], "primera": lat[0], "segunda": lat[1]}))
+"""
+
+
+def preparar_bd(url):
+    os.environ["DATABASE_URL"] = url
+    import seed_padel
+    from app import create_app
+    from app.extensions import db
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed_padel.seed_pistas()
+        seed_padel.seed_horarios()
+        db.session.commit()
+
+
+def main():
+    import json
+
+    url = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    preparar_bd(url)
+
+    for modo, flag in (("sin calentar", "0"), ("calentada", "1")):
+        out = subprocess.run(
+            [sys.executable, "-c", WORKER, flag],
+            env={**os.environ, "DATABASE_URL": url},
+            capture_output=True, text=True, check=True,
+        ).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        print(f"{modo:<13} arranque {r['arranque']:7.1f} ms  fases {r['fases']}")
+        print(f"{'':<13} worker: 1ª petición {r['primera']:6.2f} ms, 2ª {r['segunda']:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
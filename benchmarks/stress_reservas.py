@@ -0,0 +1,256 @@
+"""
+Prueba de estrés de POST /api/reservas: muchas peticiones a la vez por
+las mismas franjas de la misma pista y fecha.
+
+En cada ronda N hilos esperan en una barrera y lanzan su reserva a la
+vez. Se comprueba que:
+- ninguna franja queda reservada por dos peticiones (dos 201 que la
+  incluyan)
+- con --modo iguales (todos piden las mismas franjas), hay exactamente
+  un ganador por ronda
+
+Y se mide la latencia de las peticiones, el reparto de códigos HTTP,
+los errores "database is locked" y, en local, lo que tardan las
+sentencias de escritura (en SQLite, casi todo es la espera del cerrojo).
+
+Dos formas de ejecutarlo (desde la raíz del proyecto):
+
+    # En proceso, con el test client y una BD SQLite temporal
+    python -m benchmarks.stress_reservas [--hilos 16] [--rondas 20] [--modo solapadas]
+
+    # Contra un servidor ya arrancado (p. ej. gunicorn con varios workers,
+    # con RATE_LIMIT_ENABLED=0 y un usuario USER existente)
+    python -m benchmarks.stress_reservas --url http://127.0.0.1:8000 --email u@u.com --password x
+
+Sale con código 1 si se incumple alguna de las comprobaciones, así que
+sirve también como prueba de corrección antes de tocar crear_reserva.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import date, timedelta
+
+FRANJAS_USUARIO = 2
+
+
+# -------------------------
+# CLIENTES
+# -------------------------
+
+class ClienteLocal:
+    """La app en este proceso, con una BD SQLite temporal."""
+
+    def __init__(self, hilos):
+        os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/stress.db"
+        os.environ["RATE_LIMIT_ENABLED"] = "0"
+
+        import seed_padel
+        from flask import got_request_exception
+        from sqlalchemy import event
+        from werkzeug.security import generate_password_hash
+
+        from app import create_app
+        from app.extensions import db
+        from app.models import Rol, Usuario
+
+        self.app = create_app()
+        self.bloqueos = 0
+        self.escrituras = []  # segundos de cada INSERT/UPDATE/DELETE
+
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(Rol(id=2, nombre="USER"))
+            seed_padel.seed_pistas()
+            seed_padel.seed_horarios()
+            seed_padel.seed_extras()
+            password = generate_password_hash("x")
+            db.session.add_all(
+                Usuario(nombre=f"u{i}", dni=str(i), email=f"u{i}@stress", password=password, rol_id=2)
+                for i in range(hilos)
+            )
+            db.session.commit()
+
+            @event.listens_for(db.engine, "before_cursor_execute")
+            def _antes(conn, cursor, statement, parameters, context, executemany):
+                conn.info["t_sentencia"] = time.perf_counter()
+
+            @event.listens_for(db.engine, "after_cursor_execute")
+            def _despues(conn, cursor, statement, parameters, context, executemany):
+                if statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+                    self.escrituras.append(time.perf_counter() - conn.info.pop("t_sentencia"))
+
+        def _excepcion(sender, exception, **extra):
+            if "database is locked" in str(exception):
+                self.bloqueos += 1
+
+        got_request_exception.connect(_excepcion, self.app, weak=False)
+
+        self.tokens = [self._login(f"u{i}@stress", "x") for i in range(hilos)]
+
+    def _login(self, email, password):
+        r = self.app.test_client().post("/auth/login", json={"email": email, "password": password})
+        return r.get_json()["access_token"]
+
+    def peticion(self, metodo, ruta, token, cuerpo=None):
+        c = self.app.test_client()
+        r = c.open(ruta, method=metodo, json=cuerpo, headers={"Authorization": f"Bearer {token}"})
+        return r.status_code, r.get_json(silent=True)
+
+
+class ClienteHTTP:
+    """Un servidor ya arrancado; todos los hilos con el mismo usuario."""
+
+    def __init__(self, url, email, password, hilos):
+        self.url = url.rstrip("/")
+        self.bloqueos = None
+        self.escrituras = None
+        try:
+            _, cuerpo = self.peticion("POST", "/auth/login", None, {"email": email, "password": password})
+        except urllib.error.URLError as e:
+            sys.exit(f"no se puede conectar con {self.url}: {e.reason}")
+        if not cuerpo or "access_token" not in cuerpo:
+            sys.exit(f"login fallido: {cuerpo}")
+        self.tokens = [cuerpo["access_token"]] * hilos
+
+    def peticion(self, metodo, ruta, token, cuerpo=None):
+        datos = json.dumps(cuerpo).encode() if cuerpo is not None else None
+        req = urllib.request.Request(self.url + ruta, data=datos, method=metodo)
+        req.add_header("Content-Type", "application/json")
+        if token:
+            req.add_header("Authorization", f"Bearer {token}")
+        try:
+            with urllib.request.urlopen(req, timeout=60) as r:
+                return r.status, json.loads(r.read() or b"null")
+        except urllib.error.HTTPError as e:
+            try:
+                return e.code, json.loads(e.read() or b"null")
+            except ValueError:
+                return e.code, None
+
+
+# -------------------------
+# RONDAS
+# -------------------------
+
+def franjas_de(hilo, ids, modo):
+    """Franjas que pide cada hilo: las mismas, o ventanas que se solapan."""
+    if modo == "iguales":
+        return ids[:FRANJAS_USUARIO]
+    inicio = hilo % (len(ids) - FRANJAS_USUARIO + 1)
+    return ids[inicio:inicio + FRANJAS_USUARIO]
+
+
+def ronda(cliente, pista_id, fecha, ids, modo):
+    """Lanza una reserva por hilo a la vez. Devuelve [(hilo, status, cuerpo, segundos)]."""
+    hilos = len(cliente.tokens)
+    barrera = threading.Barrier(hilos)
+    resultados = [None] * hilos
+
+    def reservar(i):
+        cuerpo = {"pista_id": pista_id, "fecha": fecha.isoformat(), "horarios": franjas_de(i, ids, modo)}
+        barrera.wait()
+        t = time.perf_counter()
+        try:
+            status, respuesta = cliente.peticion("POST", "/api/reservas", cliente.tokens[i], cuerpo)
+        except Exception as e:  # conexión rechazada, timeout...
+            status, respuesta = 0, {"error": repr(e)}
+        resultados[i] = (i, status, respuesta, time.perf_counter() - t)
+
+    threads = [threading.Thread(target=reservar, args=(i,)) for i in range(hilos)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return resultados
+
+
+def comprobar(resultados, modo):
+    """Lista de incumplimientos de la ronda (vacía si todo bien)."""
+    errores = []
+    dueno = {}
+    ganadores = [r for r in resultados if r[1] == 201]
+    for hilo, _, cuerpo, _ in ganadores:
+        for h in cuerpo["horarios"]:
+            if h in dueno:
+                errores.append(f"franja {h} reservada por los hilos {dueno[h]} y {hilo}")
+            dueno[h] = hilo
+    if modo == "iguales" and len(ganadores) != 1:
+        errores.append(f"{len(ganadores)} ganadores (se esperaba 1)")
+    if not ganadores:
+        errores.append("ninguna reserva tuvo éxito")
+    return errores
+
+
+def _pct(valores, q):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(q * len(valores)))]
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--hilos", type=int, default=16)
+    p.add_argument("--rondas", type=int, default=20)
+    p.add_argument("--modo", choices=("iguales", "solapadas"), default="iguales")
+    p.add_argument("--url", help="Servidor ya arrancado (por defecto, la app en proceso)")
+    p.add_argument("--email")
+    p.add_argument("--password")
+    p.add_argument("--pista", type=int, default=1, help="Pista (con --url)")
+    args = p.parse_args()
+
+    if args.url:
+        cliente = ClienteHTTP(args.url, args.email, args.password, args.hilos)
+    else:
+        cliente = ClienteLocal(args.hilos)
+
+    _, horarios = cliente.peticion("GET", "/api/horarios", cliente.tokens[0])
+    ids = [h["id"] for h in horarios][:FRANJAS_USUARIO * 2]
+    if len(ids) < FRANJAS_USUARIO * 2:
+        sys.exit("hacen falta al menos 4 franjas en el catálogo")
+
+    # Fechas lejanas y distintas por ejecución: con --url no chocan con
+    # reservas de ejecuciones anteriores.
+    base = date.today() + timedelta(days=3650 + int(time.time()) % 3650)
+
+    latencias, codigos, fallos = [], {}, []
+    t0 = time.perf_counter()
+    for n in range(args.rondas):
+        resultados = ronda(cliente, args.pista, base + timedelta(days=n), ids, args.modo)
+        for _, status, _, segundos in resultados:
+            latencias.append(segundos)
+            codigos[status] = codigos.get(status, 0) + 1
+        fallos += [f"ronda {n}: {e}" for e in comprobar(resultados, args.modo)]
+    total = time.perf_counter() - t0
+
+    peticiones = len(latencias)
+    print(f"{args.rondas} rondas × {args.hilos} hilos ({args.modo}): {peticiones} peticiones en {total:.2f} s "
+          f"({peticiones / total:.0f} req/s)")
+    print(f"códigos: {dict(sorted(codigos.items()))}")
+    print("latencia (ms): p50 {:.1f}  p95 {:.1f}  p99 {:.1f}  max {:.1f}".format(
+        *(_pct(latencias, q) * 1000 for q in (0.5, 0.95, 0.99, 1.0))
+    ))
+    if cliente.bloqueos is not None:
+        print(f"'database is locked': {cliente.bloqueos} ({cliente.bloqueos / peticiones:.1%})")
+    if cliente.escrituras:
+        e = cliente.escrituras
+        print("sentencias de escritura (ms): n {}  p50 {:.2f}  p95 {:.2f}  max {:.2f}  total {:.0f}".format(
+            len(e), *(_pct(e, q) * 1000 for q in (0.5, 0.95, 1.0)), sum(e) * 1000
+        ))
+
+    if fallos:
+        print(f"\nFALLOS ({len(fallos)}):")
+        for f in fallos[:20]:
+            print(f"  {f}")
+        sys.exit(1)
+    print("OK: ninguna franja reservada dos veces")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import os
+
+# La app se carga y calienta en el master (wsgi.py) y los workers la
+# heredan por fork; app/startup.py descarta las conexiones heredadas.
+wsgi_app = "wsgi:app"
+preload_app = True
+
+bind = os.getenv("GUNICORN_BIND", "127.0.0.1:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+# Varios hilos por worker: una petición lenta no bloquea el proceso y el
+# descarte por sobrecarga (RATE_LIMIT_SHED_EN_CURSO) tiene peticiones en
+# curso que contar. El umbral por defecto sale de estas mismas variables.
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
@@ -0,0 +1,67 @@
+"""horarios inicio_min / fin_min
+
+Revision ID: 23fa732b5674
+Revises: d76933c0e991
+Create Date: 2026-10-19 11:40:02.918377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '23fa732b5674'
+down_revision = 'd76933c0e991'
+branch_labels = None
+depends_on = None
+
+
+def _parse_franja(franja):
+    # Copia local de app.models.parse_franja: las migraciones no deben
+    # depender del código de la aplicación, que puede cambiar después.
+    inicio, fin = franja.split("-")
+    h1, m1 = (int(x) for x in inicio.strip().split(":"))
+    h2, m2 = (int(x) for x in fin.strip().split(":"))
+    inicio_min, fin_min = h1 * 60 + m1, h2 * 60 + m2
+    if fin_min == 0:
+        fin_min = 24 * 60
+    return inicio_min, fin_min
+
+
+def upgrade():
+    with op.batch_alter_table('horarios', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('inicio_min', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('fin_min', sa.Integer(), nullable=True))
+
+    # Backfill desde el texto de la franja
+    conn = op.get_bind()
+    horarios = sa.table(
+        'horarios',
+        sa.column('id', sa.Integer),
+        sa.column('franja', sa.String),
+        sa.column('inicio_min', sa.Integer),
+        sa.column('fin_min', sa.Integer),
+    )
+    for id_, franja in conn.execute(sa.select(horarios.c.id, horarios.c.franja)).all():
+        inicio_min, fin_min = _parse_franja(franja)
+        conn.execute(
+            horarios.update()
+            .where(horarios.c.id == id_)
+            .values(inicio_min=inicio_min, fin_min=fin_min)
+        )
+
+    with op.batch_alter_table('horarios', schema=None) as batch_op:
+        batch_op.alter_column('inicio_min', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('fin_min', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_check_constraint('ck_horarios_fin_gt_inicio', 'fin_min > inicio_min')
+        batch_op.create_index(batch_op.f('ix_horarios_inicio_min'), ['inicio_min'], unique=False)
+        batch_op.create_index(batch_op.f('ix_horarios_fin_min'), ['fin_min'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('horarios', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_horarios_fin_min'))
+        batch_op.drop_index(batch_op.f('ix_horarios_inicio_min'))
+        batch_op.drop_constraint('ck_horarios_fin_gt_inicio', type_='check')
+        batch_op.drop_column('fin_min')
+        batch_op.drop_column('inicio_min')
@@ -0,0 +1,40 @@
+"""tareas pendientes
+
+Revision ID: 2d7e77528913
+Revises: 7c06992e4397
+Create Date: 2026-10-19 10:56:06.751748
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d7e77528913'
+down_revision = '7c06992e4397'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('tareas_pendientes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.String(length=50), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('estado', sa.String(length=20), nullable=False),
+    sa.Column('intentos', sa.Integer(), nullable=False),
+    sa.Column('disponible_en', sa.DateTime(), nullable=False),
+    sa.Column('creada_en', sa.DateTime(), nullable=False),
+    sa.Column('ultimo_error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('tareas_pendientes', schema=None) as batch_op:
+        batch_op.create_index('ix_tareas_pendientes_estado_disponible', ['estado', 'disponible_en'], unique=False)
+
+
+
+def downgrade():
+    with op.batch_alter_table('tareas_pendientes', schema=None) as batch_op:
+        batch_op.drop_index('ix_tareas_pendientes_estado_disponible')
+
+    op.drop_table('tareas_pendientes')
@@ -0,0 +1,38 @@
+"""tokens revocados
+
+Revision ID: 338c1b731d1e
+Revises: c00faaac2a1a
+Create Date: 2026-10-19 11:01:15.806956
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '338c1b731d1e'
+down_revision = 'c00faaac2a1a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('tokens_revocados',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.String(length=10), nullable=False),
+    sa.Column('valor', sa.String(length=64), nullable=False),
+    sa.Column('revocado_en', sa.DateTime(), nullable=False),
+    sa.Column('expira_en', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sqlite_autoincrement=True
+    )
+    with op.batch_alter_table('tokens_revocados', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_tokens_revocados_expira_en'), ['expira_en'], unique=False)
+
+
+
+def downgrade():
+    with op.batch_alter_table('tokens_revocados', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_tokens_revocados_expira_en'))
+
+    op.drop_table('tokens_revocados')
@@ -0,0 +1,37 @@
+"""cambios_ocupacion
+
+Revision ID: 370237830d7d
+Revises: 338c1b731d1e
+Create Date: 2026-10-19 11:07:33.943276
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '370237830d7d'
+down_revision = '338c1b731d1e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cambios_ocupacion',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('pista_id', sa.Integer(), nullable=True),
+    sa.Column('fecha', sa.Date(), nullable=True),
+    sa.Column('creado_en', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sqlite_autoincrement=True
+    )
+    with op.batch_alter_table('cambios_ocupacion', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_cambios_ocupacion_creado_en'), ['creado_en'], unique=False)
+
+
+
+def downgrade():
+    with op.batch_alter_table('cambios_ocupacion', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_cambios_ocupacion_creado_en'))
+
+    op.drop_table('cambios_ocupacion')
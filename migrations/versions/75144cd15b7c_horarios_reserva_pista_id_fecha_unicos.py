@@ -0,0 +1,51 @@
+"""horarios_reserva pista_id fecha unicos
+
+Revision ID: 75144cd15b7c
+Revises: 370237830d7d
+Create Date: 2026-10-19 11:09:58.865709
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '75144cd15b7c'
+down_revision = '370237830d7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('horarios_reserva', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('pista_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('fecha', sa.Date(), nullable=True))
+
+    # Franjas huérfanas (de antes de activar las FOREIGN KEY en SQLite):
+    # sin reserva no hay pista ni fecha que copiar y el NOT NULL fallaría.
+    huerfanas = op.get_bind().execute(sa.text(
+        "DELETE FROM horarios_reserva WHERE reserva_id NOT IN (SELECT id FROM reservas)"
+    )).rowcount
+    if huerfanas:
+        print(f"  borradas {huerfanas} franjas de horarios_reserva sin reserva")
+
+    # Backfill desde la reserva de cada franja
+    op.execute(
+        "UPDATE horarios_reserva SET "
+        "pista_id = (SELECT r.pista_id FROM reservas r WHERE r.id = horarios_reserva.reserva_id), "
+        "fecha = (SELECT r.fecha FROM reservas r WHERE r.id = horarios_reserva.reserva_id)"
+    )
+
+    # Si ya hay franjas reservadas dos veces, el UNIQUE falla: hay que
+    # resolver antes esas reservas a mano.
+    with op.batch_alter_table('horarios_reserva', schema=None) as batch_op:
+        batch_op.alter_column('pista_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('fecha', existing_type=sa.Date(), nullable=False)
+        batch_op.create_unique_constraint('uq_horarios_reserva_pista_fecha_horario', ['pista_id', 'fecha', 'horario_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('horarios_reserva', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_horarios_reserva_pista_fecha_horario', type_='unique')
+        batch_op.drop_column('fecha')
+        batch_op.drop_column('pista_id')
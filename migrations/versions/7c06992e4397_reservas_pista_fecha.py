@@ -0,0 +1,26 @@
+"""indice reservas (pista_id, fecha)
+
+Revision ID: 7c06992e4397
+Revises: de7796b9dc6f
+Create Date: 2026-10-19 14:21:09.553871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c06992e4397'
+down_revision = 'de7796b9dc6f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('reservas', schema=None) as batch_op:
+        batch_op.create_index('ix_reservas_pista_fecha', ['pista_id', 'fecha'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('reservas', schema=None) as batch_op:
+        batch_op.drop_index('ix_reservas_pista_fecha')
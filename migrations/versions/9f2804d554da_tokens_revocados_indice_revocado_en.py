@@ -0,0 +1,26 @@
+"""tokens_revocados indice revocado_en
+
+Revision ID: 9f2804d554da
+Revises: a4cdce0c817e
+Create Date: 2026-10-19 11:43:39.177837
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f2804d554da'
+down_revision = 'a4cdce0c817e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tokens_revocados', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_tokens_revocados_revocado_en'), ['revocado_en'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('tokens_revocados', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_tokens_revocados_revocado_en'))
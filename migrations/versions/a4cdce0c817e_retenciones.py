@@ -0,0 +1,47 @@
+"""retenciones
+
+Revision ID: a4cdce0c817e
+Revises: 75144cd15b7c
+Create Date: 2026-10-19 11:12:56.464226
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4cdce0c817e'
+down_revision = '75144cd15b7c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('retenciones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('grupo', sa.String(length=32), nullable=False),
+    sa.Column('usuario_id', sa.Integer(), nullable=False),
+    sa.Column('pista_id', sa.Integer(), nullable=False),
+    sa.Column('fecha', sa.Date(), nullable=False),
+    sa.Column('horario_id', sa.Integer(), nullable=False),
+    sa.Column('expira_en', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['horario_id'], ['horarios.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['pista_id'], ['pistas.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['usuario_id'], ['usuarios.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('pista_id', 'fecha', 'horario_id', name='uq_retenciones_pista_fecha_horario')
+    )
+    with op.batch_alter_table('retenciones', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_retenciones_expira_en'), ['expira_en'], unique=False)
+        batch_op.create_index(batch_op.f('ix_retenciones_grupo'), ['grupo'], unique=False)
+        batch_op.create_index(batch_op.f('ix_retenciones_usuario_id'), ['usuario_id'], unique=False)
+
+
+
+def downgrade():
+    with op.batch_alter_table('retenciones', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_retenciones_usuario_id'))
+        batch_op.drop_index(batch_op.f('ix_retenciones_grupo'))
+        batch_op.drop_index(batch_op.f('ix_retenciones_expira_en'))
+
+    op.drop_table('retenciones')
@@ -0,0 +1,47 @@
+"""refresh tokens
+
+Revision ID: c00faaac2a1a
+Revises: dfa31c8a8ab3
+Create Date: 2026-10-19 10:59:39.550367
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c00faaac2a1a'
+down_revision = 'dfa31c8a8ab3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('refresh_tokens',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('jti', sa.String(length=36), nullable=False),
+    sa.Column('familia', sa.String(length=36), nullable=False),
+    sa.Column('usuario_id', sa.Integer(), nullable=False),
+    sa.Column('creada_en', sa.DateTime(), nullable=False),
+    sa.Column('expira_en', sa.DateTime(), nullable=False),
+    sa.Column('usada_en', sa.DateTime(), nullable=True),
+    sa.Column('revocada', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['usuario_id'], ['usuarios.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('refresh_tokens', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_refresh_tokens_expira_en'), ['expira_en'], unique=False)
+        batch_op.create_index(batch_op.f('ix_refresh_tokens_familia'), ['familia'], unique=False)
+        batch_op.create_index(batch_op.f('ix_refresh_tokens_jti'), ['jti'], unique=True)
+        batch_op.create_index(batch_op.f('ix_refresh_tokens_usuario_id'), ['usuario_id'], unique=False)
+
+
+
+def downgrade():
+    with op.batch_alter_table('refresh_tokens', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_refresh_tokens_usuario_id'))
+        batch_op.drop_index(batch_op.f('ix_refresh_tokens_jti'))
+        batch_op.drop_index(batch_op.f('ix_refresh_tokens_familia'))
+        batch_op.drop_index(batch_op.f('ix_refresh_tokens_expira_en'))
+
+    op.drop_table('refresh_tokens')
@@ -0,0 +1,51 @@
+"""reservas_diarias rollup
+
+Revision ID: d76933c0e991
+Revises: 422a32323bbb
+Create Date: 2026-10-19 10:12:31.402114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd76933c0e991'
+down_revision = '422a32323bbb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('reservas_diarias',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('pista_id', sa.Integer(), nullable=False),
+    sa.Column('fecha', sa.Date(), nullable=False),
+    sa.Column('turno', sa.String(length=50), nullable=False),
+    sa.Column('slots', sa.Integer(), nullable=False),
+    sa.Column('ingresos', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.ForeignKeyConstraint(['pista_id'], ['pistas.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('pista_id', 'fecha', 'turno', name='uq_reservas_diarias_pista_fecha_turno')
+    )
+    with op.batch_alter_table('reservas_diarias', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_reservas_diarias_fecha'), ['fecha'], unique=False)
+
+    # Backfill inicial (equivalente a `flask rollups reconstruir`)
+    op.execute(
+        """
+        INSERT INTO reservas_diarias (pista_id, fecha, turno, slots, ingresos)
+        SELECT r.pista_id, r.fecha, h.turno, COUNT(hr.id), SUM(hr.precio)
+        FROM horarios_reserva hr
+        JOIN reservas r ON hr.reserva_id = r.id
+        JOIN horarios h ON hr.horario_id = h.id
+        GROUP BY r.pista_id, r.fecha, h.turno
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('reservas_diarias', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_reservas_diarias_fecha'))
+
+    op.drop_table('reservas_diarias')
@@ -0,0 +1,69 @@
+"""archivo de reservas
+
+Revision ID: de7796b9dc6f
+Revises: 23fa732b5674
+Create Date: 2026-10-19 12:58:44.107735
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'de7796b9dc6f'
+down_revision = '23fa732b5674'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # AUTOINCREMENT en las tablas vivas: sin él SQLite reutiliza el id
+    # más alto tras archivar y chocaría con el id ya archivado.
+    for tabla in ('reservas', 'horarios_reserva'):
+        with op.batch_alter_table(tabla, recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+            pass
+
+    op.create_table('reservas_archivo',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('usuario_id', sa.Integer(), nullable=False),
+    sa.Column('pista_id', sa.Integer(), nullable=False),
+    sa.Column('fecha', sa.Date(), nullable=False),
+    sa.ForeignKeyConstraint(['pista_id'], ['pistas.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['usuario_id'], ['usuarios.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('reservas_archivo', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_reservas_archivo_fecha'), ['fecha'], unique=False)
+        batch_op.create_index(batch_op.f('ix_reservas_archivo_pista_id'), ['pista_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_reservas_archivo_usuario_id'), ['usuario_id'], unique=False)
+
+    op.create_table('horarios_reserva_archivo',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('reserva_id', sa.Integer(), nullable=False),
+    sa.Column('horario_id', sa.Integer(), nullable=False),
+    sa.Column('precio', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.ForeignKeyConstraint(['horario_id'], ['horarios.id'], ondelete='RESTRICT'),
+    sa.ForeignKeyConstraint(['reserva_id'], ['reservas_archivo.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('horarios_reserva_archivo', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_horarios_reserva_archivo_horario_id'), ['horario_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_horarios_reserva_archivo_reserva_id'), ['reserva_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('horarios_reserva_archivo', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_horarios_reserva_archivo_reserva_id'))
+        batch_op.drop_index(batch_op.f('ix_horarios_reserva_archivo_horario_id'))
+
+    op.drop_table('horarios_reserva_archivo')
+    with op.batch_alter_table('reservas_archivo', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_reservas_archivo_usuario_id'))
+        batch_op.drop_index(batch_op.f('ix_reservas_archivo_pista_id'))
+        batch_op.drop_index(batch_op.f('ix_reservas_archivo_fecha'))
+
+    op.drop_table('reservas_archivo')
+
+    for tabla in ('reservas', 'horarios_reserva'):
+        with op.batch_alter_table(tabla, recreate='always', table_kwargs={'sqlite_autoincrement': False}):
+            pass
@@ -0,0 +1,5 @@
+# Punto de entrada para servidores prefork (gunicorn --preload):
+# la app se construye y calienta una sola vez en el proceso master.
+from app.startup import crear_app_calentada
+
+app = crear_app_calentada()